@@ -0,0 +1,50 @@
+"""SQLite backend tuned for concurrent web traffic.
+
+Extra ``OPTIONS`` understood on top of ``django.db.backends.sqlite3``:
+
+* ``pragmas``: dict of PRAGMAs run on every new connection, merged over
+  ``DEFAULT_PRAGMAS`` (WAL journal, ...). ``busy_timeout``, which makes
+  writers wait for the lock instead of failing with "database is
+  locked", comes from the ``timeout`` option (seconds, 5 by default) so
+  that the configured wait is the one applied.
+* ``transaction_mode``: ``"IMMEDIATE"`` makes ``atomic()`` take the write
+  lock at ``BEGIN``. A deferred transaction that reads first and writes
+  later cannot wait on a busy lock and fails immediately instead.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+    'mmap_size': 134217728,
+}
+
+# Seconds, sqlite3.connect()'s default.
+DEFAULT_TIMEOUT = 5
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        options = self.settings_dict['OPTIONS']
+        busy_timeout = int(options.get('timeout', DEFAULT_TIMEOUT) * 1000)
+        pragmas = {**DEFAULT_PRAGMAS, 'busy_timeout': busy_timeout, **options.get('pragmas', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED').upper()
+        if mode not in TRANSACTION_MODES:
+            mode = 'DEFERRED'
+        self.cursor().execute(f'BEGIN {mode}')
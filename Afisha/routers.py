@@ -0,0 +1,85 @@
+"""Primary/replica database routing.
+
+``settings.DATABASE_REPLICAS['ALIASES']`` lists database aliases holding
+read-only copies of ``default``. ``ReplicaPinningMiddleware`` allows reads
+of the catalog models (``movie_app``) to go to a random replica while a
+request is safe (GET/HEAD/OPTIONS); everything else reads the primary:
+
+* unsafe requests, and a safe request from the moment it writes, so a view
+  serializing the row it just saved reads it back;
+* requests of a client that wrote less than ``MAX_LAG`` seconds ago, via
+  a cookie, so a client reads its own writes while replicas catch up;
+* anything outside a request (management commands, background jobs) and
+  reads inside a transaction on the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+
+PRIMARY = 'default'
+ROUTED_APPS = {'movie_app'}
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_settings():
+    return {'ALIASES': [], 'MAX_LAG': 5, 'COOKIE': 'db_primary', **getattr(settings, 'DATABASE_REPLICAS', {})}
+
+
+@contextmanager
+def use_replicas(allowed=True):
+    token = replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+def pin_to_primary():
+    replica_reads.set(False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APPS or not replica_reads.get():
+            return PRIMARY
+        if transaction.get_connection(PRIMARY).in_atomic_block:
+            return PRIMARY
+        aliases = replica_settings()['ALIASES']
+        return random.choice(aliases) if aliases else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replica_settings()['ALIASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary.
+        return db not in replica_settings()['ALIASES']
+
+
+class ReplicaPinningMiddleware:
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = replica_settings()
+        allowed = (bool(options['ALIASES']) and request.method in self.SAFE_METHODS
+                   and options['COOKIE'] not in request.COOKIES)
+        with use_replicas(allowed):
+            response = self.get_response(request)
+            wrote = allowed != replica_reads.get() or request.method not in self.SAFE_METHODS
+        if options['ALIASES'] and wrote:
+            response.set_cookie(options['COOKIE'], '1', max_age=options['MAX_LAG'],
+                                httponly=True, samesite='Lax')
+        return response
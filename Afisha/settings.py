@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+from django.conf import global_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,12 +46,31 @@ INSTALLED_APPS = [
 
     'movie_app',
     'users',
+    'jobs',
 ]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication"
-    ]
+        "users.authentication.CachedTokenAuthentication"
+    ],
+    "DEFAULT_PAGINATION_CLASS": "movie_app.pagination.KeysetPagination",
+    # Reverse proxies in front of the app; the throttles trust that many
+    # X-Forwarded-For entries, and none at all with 0 (direct connections)
+    "NUM_PROXIES": int(os.environ.get('DJANGO_NUM_PROXIES', 0)),
+    # Unsafe requests only, the login and register views have their own scopes
+    "DEFAULT_THROTTLE_CLASSES": [
+        "users.throttling.WriteRateThrottle",
+    ],
+    # orjson backed JSON, falls back to DRF's stdlib json without orjson installed
+    "DEFAULT_RENDERER_CLASSES": [
+        "movie_app.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "movie_app.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 MIDDLEWARE = [
@@ -58,20 +81,20 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'querycount.middleware.QueryCountMiddleware',
+    'movie_app.metrics.MetricsMiddleware',
+    'Afisha.routers.ReplicaPinningMiddleware',
 ]
 
-QUERYCOUNT = {
-    'THRESHOLDS': {
-        'MEDIUM': 50,
-        'HIGH': 200,
-        'MIN_TIME_TO_LOG': 0,
-        'MIN_QUERY_COUNT_TO_LOG': 0
-    },
-    'IGNORE_REQUEST_PATTERNS': [],
-    'IGNORE_SQL_PATTERNS': [],
-    'DISPLAY_DUPLICATES': None,
-    'RESPONSE_HEADER': 'X-DjangoQueryCount-Count'
+# Request metrics served at /metrics, see movie_app/metrics.py
+METRICS = {
+    'ENABLED': True,
+    # Clients allowed to scrape /metrics (the Prometheus server).
+    'ALLOWED_IPS': os.environ.get('DJANGO_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','),
+    # Staff users send this header to get a cProfile report of their request.
+    'PROFILE_HEADER': 'X-Profile',
+    'PROFILES_KEPT': 20,
+    # Set on every response while DEBUG is on.
+    'QUERY_COUNT_HEADER': 'X-DjangoQueryCount-Count',
 }
 
 ROOT_URLCONF = 'Afisha.urls'
@@ -99,13 +122,175 @@ WSGI_APPLICATION = 'Afisha.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
+# Configured from the environment:
+#   DJANGO_DB_ENGINE      sqlite (default) or postgresql
+#   DJANGO_DB_NAME        database name, or file path for SQLite
+#   DJANGO_DB_USER, DJANGO_DB_PASSWORD, DJANGO_DB_HOST, DJANGO_DB_PORT
+#   DJANGO_DB_CONN_MAX_AGE    seconds to keep a connection open between requests
+#   DJANGO_DB_POOL        1 to use psycopg's connection pool (Django 5.1+)
+#   DJANGO_DB_PGBOUNCER   1 when connecting through PgBouncer in transaction mode
+#   DJANGO_DB_REPLICA_HOSTS   comma separated read replicas of the PostgreSQL primary
+#   DJANGO_DB_REPLICA_MAX_LAG seconds a client keeps reading the primary after a write
+
+DB_ENGINE = os.environ.get('DJANGO_DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DJANGO_DB_NAME', 'afisha'),
+            'USER': os.environ.get('DJANGO_DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', ''),
+            'HOST': os.environ.get('DJANGO_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DJANGO_DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DJANGO_DB_POOL') == '1' and django.VERSION >= (5, 1):
+        # The pool owns the connections, Django must not keep them itself.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DJANGO_DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DJANGO_DB_POOL_MAX_SIZE', 10)),
+        }
+    if os.environ.get('DJANGO_DB_PGBOUNCER') == '1':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    for number, host in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICA_HOSTS', '').split(',')), 1):
+        DATABASES[f'replica_{number}'] = {
+            **DATABASES['default'],
+            'HOST': host,
+            # Tests run against the primary only.
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            # django.db.backends.sqlite3 with WAL, see Afisha/backends/sqlite3
+            'ENGINE': 'Afisha.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds a writer waits for the lock (PRAGMA busy_timeout)
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file (not the in-memory default) so that tests exercise WAL
+            # and locking across threads like production does.
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+
+# GET requests read the catalog from the replicas, see Afisha/routers.py
+DATABASE_ROUTERS = ['Afisha.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('replica')],
+    'MAX_LAG': int(os.environ.get('DJANGO_DB_REPLICA_MAX_LAG', 5)),
+    'COOKIE': 'db_primary',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'afisha'),
     }
 }
 
+# Cached GET payloads of the movie API, see movie_app/cache.py
+API_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'ENABLED': True,
+}
+
+# Full-text search backend, picked from the database vendor when empty.
+# See movie_app/search.py
+MOVIE_SEARCH = {
+    'BACKEND': os.environ.get('DJANGO_SEARCH_BACKEND', ''),
+}
+
+# Leaderboards of /api/v1/movies/top/ and /trending/, see movie_app/rankings.py
+LEADERBOARD = {
+    # The Bayesian score counts every movie as having PRIOR_WEIGHT extra reviews
+    # of PRIOR_MEAN stars (None: the mean of the catalog).
+    'PRIOR_WEIGHT': 10,
+    'PRIOR_MEAN': 3.0,
+    # Reviews with stars a movie needs to be ranked.
+    'MIN_REVIEWS': 1,
+    'MAX_LIMIT': 100,
+    # Days of daily review counts kept, the longest trending window.
+    'TRENDING_DAYS': 30,
+}
+
+# Stored responses of POSTs sent with an Idempotency-Key header, see movie_app/idempotency.py
+IDEMPOTENCY = {
+    # Seconds a key is remembered; `manage.py purge_idempotency_keys` deletes older ones.
+    'TTL': 86400,
+    # Seconds after which a key whose first request never finished can be reused.
+    'PROCESSING_TIMEOUT': 60,
+}
+
+# Background jobs for the side effects of writes, see jobs/queue.py
+#   DJANGO_JOBS_MODE  thread (default, run by the web process after commit),
+#                     worker (run by `manage.py run_jobs_worker`) or eager (inline)
+JOBS = {
+    'MODE': os.environ.get('DJANGO_JOBS_MODE', 'thread'),
+    'THREADS': 2,
+    'MAX_ATTEMPTS': 5,
+    # Seconds before the first retry, doubled on every attempt.
+    'RETRY_DELAY': 2,
+    # Seconds after which a job still marked running is considered abandoned.
+    'LEASE': 300,
+    # Seconds finished jobs are kept before the worker (or the thread pool) purges them.
+    'KEEP_DONE': 86400,
+}
+
+# Jobs run eagerly, throttling is off and passwords use the fast hashers in tests,
+# see Afisha/testing.py
+TEST_RUNNER = 'Afisha.testing.TestRunner'
+
+# Tokens returned by /api/v1/users/auth/, see users/authentication.py
+#   DJANGO_TOKEN_TTL  seconds a token stays valid after it was issued (default: no expiry)
+AUTH_TOKENS = {
+    'TTL': int(os.environ['DJANGO_TOKEN_TTL']) if os.environ.get('DJANGO_TOKEN_TTL') else None,
+}
+
+# Token key -> user cache of users.authentication.CachedTokenAuthentication
+TOKEN_CACHE = {
+    'ALIAS': 'default',
+    'TTL': 300,
+    # Per-process copy; other processes may accept a rotated token or a
+    # deactivated user for up to this many seconds.
+    'MEMORY_TTL': 30,
+    'MAX_ENTRIES': 10000,
+}
+
+# Token bucket throttling, see users/throttling.py
+#   DJANGO_THROTTLE_REDIS_URL  share the buckets between processes through a
+#                              Redis-compatible server instead of process memory
+THROTTLE_REDIS_URL = os.environ.get('DJANGO_THROTTLE_REDIS_URL')
+THROTTLING = {
+    'ENABLED': True,
+    'STORE': 'users.throttling.RedisStore' if THROTTLE_REDIS_URL else 'users.throttling.MemoryStore',
+    'STORE_OPTIONS': {'url': THROTTLE_REDIS_URL} if THROTTLE_REDIS_URL else {},
+    # Requests per client and period; the full rate may be used as a burst.
+    'RATES': {
+        'login': '10/min',
+        'login_username': '20/hour',
+        'register': '5/hour',
+        'write': '120/min',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -126,6 +311,17 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+#   DJANGO_PASSWORD_HASHERS  fast: hash new passwords with MD5 in test and load test
+#                            environments, where PBKDF2 dominates the cost of a login.
+#                            Never use it in production.
+PASSWORD_HASHER_PROFILES = {
+    'default': global_settings.PASSWORD_HASHERS,
+    'fast': ['django.contrib.auth.hashers.MD5PasswordHasher', *global_settings.PASSWORD_HASHERS],
+}
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[os.environ.get('DJANGO_PASSWORD_HASHERS', 'default')]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
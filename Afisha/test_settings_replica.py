@@ -0,0 +1,29 @@
+"""Settings with a primary and a replica SQLite file, to test the routing offline.
+
+    python manage.py test --settings=Afisha.test_settings_replica
+
+Nothing copies the primary to the replica by itself: the replica lags
+until a test replicates explicitly (see ``ReplicaRoutingTests``).
+"""
+from Afisha.settings import *  # noqa: F401,F403
+from Afisha.settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],
+        'ENGINE': 'Afisha.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+}
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': BASE_DIR / 'db_replica.sqlite3',
+    'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3'},
+}
+
+DATABASE_REPLICAS = {
+    'ALIASES': ['replica'],
+    'MAX_LAG': 5,
+    'COOKIE': 'db_primary',
+}
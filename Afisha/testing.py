@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.test.utils import override_settings
+
+from jobs.testing import EagerJobsTestRunner
+from users.throttling import throttle_settings
+
+
+class TestRunner(EagerJobsTestRunner):
+    """Also turns throttling off: the whole suite writes from one client address.
+
+    Tests of the throttles switch it back on with ``override_settings(THROTTLING=...)``.
+    Passwords are hashed with the ``fast`` profile of ``PASSWORD_HASHER_PROFILES``.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_override = override_settings(
+            THROTTLING={**throttle_settings(), 'ENABLED': False},
+            PASSWORD_HASHERS=settings.PASSWORD_HASHER_PROFILES['fast'],
+        )
+        self.test_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_override.disable()
+        super().teardown_test_environment(**kwargs)
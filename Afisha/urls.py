@@ -17,19 +17,28 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from movie_app import async_views as movies_async_views
 from movie_app import views as movies_views
 from users import views as users_views
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', movies_views.metrics_view),
+    path('metrics/profiles/<str:profile_id>/', movies_views.profile_view),
     path('api/v1/directors/', movies_views.director_list_api_view),
     path('api/v1/directors/', movies_views.director_list_api_view),
     path('api/v1/directors/<int:director_id>/', movies_views.director_detail_api_view),
+    path('api/v1/directors/bulk/', movies_views.director_bulk_api_view),
     path('api/v1/movies/', movies_views.movie_list_api_view),
     path('api/v1/movies/<int:movie_id>/', movies_views.movie_detail_api_view),
+    path('api/v1/movies/bulk/', movies_views.movie_bulk_api_view),
+    path('api/v1/movies/top/', movies_views.movie_top_api_view),
+    path('api/v1/movies/trending/', movies_views.movie_trending_api_view),
+    path('api/v1/movies/export/<str:export_format>/', movies_views.movie_export_view),
     path('api/v1/reviews/', movies_views.review_list_api_view),
     path('api/v1/reviews/<int:review_id>/', movies_views.review_detail_api_view),
+    path('api/v1/reviews/bulk/', movies_views.review_bulk_api_view),
 
     path('api/v1/users/auth/', users_views.auth_api_view),
     path('api/v1/users/register/', users_views.register_api_view),
@@ -38,8 +47,15 @@ urlpatterns = [
     path('api/v1/directors_cbv/<int:id>/', movies_views.DirectorRetrieveUpdateDestroyAPIView.as_view()),
     path('api/v1/movies_cbv/', movies_views.MovieViewSet.as_view({'get': 'list', 'post': 'create'})),
     path('api/v1/movies_cbv/<int:id>/', movies_views.MovieViewSet.as_view(
-        {'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}
+        {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
     )),
     path('api/v1/reviews_cbv/', movies_views.ReviewListCreateAPIView.as_view()),
     path('api/v1/reviews_cbv/<int:id>/', movies_views.ReviewRetrieveUpdateDestroyAPIView.as_view()),
+
+    path('api/v1/async/directors/', movies_async_views.director_list_async_view),
+    path('api/v1/async/directors/<int:director_id>/', movies_async_views.director_detail_async_view),
+    path('api/v1/async/movies/', movies_async_views.movie_list_async_view),
+    path('api/v1/async/movies/<int:movie_id>/', movies_async_views.movie_detail_async_view),
+    path('api/v1/async/reviews/', movies_async_views.review_list_async_view),
+    path('api/v1/async/reviews/<int:review_id>/', movies_async_views.review_detail_async_view),
 ]
@@ -0,0 +1,61 @@
+import os
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import purge_done, requeue_stale, run_pending
+
+MAINTENANCE_INTERVAL = 60    # seconds between requeueing stale jobs and purging done ones
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (JOBS["MODE"] = "worker"), polling the jobs table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Jobs run concurrently.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait before polling again when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due and exit instead of polling forever.')
+
+    def handle(self, *args, **options):
+        name = f'{socket.gethostname()}-{os.getpid()}'
+        stop = threading.Event()
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} jobs of stopped workers.')
+
+        def work(index):
+            worker = f'{name}-{index}'
+            try:
+                while not stop.is_set():
+                    ran = run_pending(worker)
+                    if options['once'] and not ran:
+                        break
+                    if not ran:
+                        stop.wait(options['interval'])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(index,), daemon=True)
+                   for index in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f'Worker {name} running {len(threads)} threads.')
+        maintained = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(min(options['interval'], 1.0))
+                if not options['once'] and time.monotonic() - maintained > MAINTENANCE_INTERVAL:
+                    requeue_stale()
+                    purge_done()
+                    maintained = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping after the running jobs...')
+            stop.set()
+        for thread in threads:
+            thread.join()
+        self.stdout.write(self.style.SUCCESS('Worker stopped.'))
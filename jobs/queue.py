@@ -0,0 +1,232 @@
+"""Database backed job queue.
+
+Tasks are plain functions registered with ``@task``; ``enqueue`` stores a
+``Job`` row with the task name and its keyword arguments, so queued work
+survives restarts and needs no broker. ``settings.JOBS['MODE']`` selects
+who runs them:
+
+* ``eager``: the task runs inline, inside ``enqueue``. The test runner
+  uses it so side effects are visible right after the request.
+* ``thread``: a small thread pool in the web process picks the job up as
+  soon as the enqueuing transaction commits. The pool also does the
+  worker's maintenance (requeueing the jobs of dead runners, purging old
+  done jobs), at most once per ``LEASE``; it runs when the pool wakes up,
+  so after a restart the jobs left running are picked up again with the
+  first write of the new process.
+* ``worker``: nothing runs in the web process, ``manage.py
+  run_jobs_worker`` polls the table.
+
+A failing job is retried ``max_attempts`` times with exponential backoff,
+then marked ``failed`` with its traceback. A job whose runner died is
+requeued once its lease expires. Jobs may run more than once, tasks must
+be idempotent.
+"""
+import logging
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def jobs_settings():
+    return {
+        'MODE': 'thread',
+        'THREADS': 2,
+        'MAX_ATTEMPTS': 5,
+        'RETRY_DELAY': 2,
+        'LEASE': 300,
+        'KEEP_DONE': 86400,
+        **getattr(settings, 'JOBS', {}),
+    }
+
+
+def task(name=None, max_attempts=None):
+    """Register a function as a task, by default under ``<module>.<function name>``."""
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+    return decorator
+
+
+def enqueue(func, key='', delay=0, **payload):
+    """Queue ``func(**payload)``; the payload must be JSON serializable.
+
+    With a ``key``, nothing is queued while a job of the same task and key
+    is still waiting: it will run with the latest data anyway.
+    """
+    options = jobs_settings()
+    if options['MODE'] == 'eager':
+        func(**payload)
+        return None
+    if key and Job.objects.filter(name=func.task_name, key=key, status=Job.QUEUED).exists():
+        return None
+    job = Job.objects.create(
+        name=func.task_name, key=key, payload=payload,
+        max_attempts=func.max_attempts or options['MAX_ATTEMPTS'],
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if options['MODE'] == 'thread':
+        transaction.on_commit(runner.wake)
+    return job
+
+
+def claim(worker, limit=1):
+    """Lock up to ``limit`` due jobs for ``worker`` and return them."""
+    now = timezone.now()
+    token = f'{worker}:{uuid.uuid4().hex[:8]}'
+    with transaction.atomic():
+        ids = list(Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+                   .order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # The status condition makes the claim safe against concurrent runners.
+        Job.objects.filter(id__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=token, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by('run_at', 'id'))
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns the new status."""
+    func = TASKS.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {job.name!r}')
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed, attempt %s of %s', job.id, job.name,
+                       job.attempts, job.max_attempts)
+        if func is None or job.attempts >= job.max_attempts:
+            update = {'status': Job.FAILED, 'finished_at': timezone.now()}
+        else:
+            delay = jobs_settings()['RETRY_DELAY'] * 2 ** (job.attempts - 1)
+            update = {'status': Job.QUEUED, 'run_at': timezone.now() + timedelta(seconds=delay)}
+        Job.objects.filter(id=job.id).update(last_error=error, locked_by='', locked_at=None, **update)
+        return update['status']
+    Job.objects.filter(id=job.id).update(status=Job.DONE, finished_at=timezone.now(),
+                                         locked_by='', locked_at=None)
+    return Job.DONE
+
+
+def requeue_stale():
+    """Give the jobs of runners that died mid-job back to the queue."""
+    expired = timezone.now() - timedelta(seconds=jobs_settings()['LEASE'])
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=expired).update(
+        status=Job.QUEUED, locked_by='', locked_at=None,
+    )
+
+
+def purge_done():
+    expired = timezone.now() - timedelta(seconds=jobs_settings()['KEEP_DONE'])
+    return Job.objects.filter(status=Job.DONE, finished_at__lt=expired).delete()[0]
+
+
+def run_pending(worker='inline', limit=None):
+    """Run due jobs one by one until there are none left (or ``limit`` ran)."""
+    ran = 0
+    while limit is None or ran < limit:
+        jobs = claim(worker)
+        if not jobs:
+            break
+        for job in jobs:
+            run_job(job)
+            ran += 1
+    return ran
+
+
+class ThreadRunner:
+    """Runs queued jobs on a pool of threads of the web process (``thread`` mode)."""
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.active = 0
+        self.dirty = False
+        self.threads = []
+        self.timer = None
+        self.timer_at = None
+        self.next_maintenance = None
+
+    def wake(self):
+        with self.lock:
+            self.dirty = True
+            if self.active >= jobs_settings()['THREADS']:
+                return    # a running drain sees ``dirty`` and claims again
+            self.active += 1
+        thread = threading.Thread(target=self.drain, name='jobs-runner', daemon=True)
+        thread.start()
+
+    def drain(self):
+        worker = f'thread-{threading.get_ident()}'
+        try:
+            self.maintain()
+            while True:
+                with self.lock:
+                    self.dirty = False
+                run_pending(worker)
+                with self.lock:
+                    if not self.dirty:
+                        break
+            self.schedule_retries()
+        except Exception:
+            logger.exception('Job runner crashed')
+        finally:
+            connections.close_all()
+            with self.lock:
+                self.active -= 1
+                self.lock.notify_all()
+
+    def maintain(self):
+        """Requeue the jobs of dead runners and purge old done jobs, at most once per lease."""
+        now = timezone.now()
+        with self.lock:
+            if self.next_maintenance is not None and now < self.next_maintenance:
+                return
+            self.next_maintenance = now + timedelta(seconds=jobs_settings()['LEASE'])
+        requeue_stale()
+        purge_done()
+
+    def schedule_retries(self):
+        # Jobs waiting for a retry, and running jobs whose runner may have died,
+        # have no commit left to wake the pool.
+        state = Job.objects.aggregate(run_at=Min('run_at', filter=Q(status=Job.QUEUED)),
+                                      locked_at=Min('locked_at', filter=Q(status=Job.RUNNING)))
+        wake_at = [state['run_at']] if state['run_at'] is not None else []
+        if state['locked_at'] is not None:
+            wake_at.append(max(state['locked_at'] + timedelta(seconds=jobs_settings()['LEASE']),
+                               self.next_maintenance))
+        if not wake_at:
+            return
+        wake_at = min(wake_at)
+        with self.lock:
+            # Keep one pending timer, the earliest.
+            if self.timer is not None and self.timer.is_alive():
+                if self.timer_at <= wake_at:
+                    return
+                self.timer.cancel()
+            delay = max((wake_at - timezone.now()).total_seconds(), 0.1)
+            self.timer = threading.Timer(delay, self.wake)
+            self.timer.daemon = True
+            self.timer_at = wake_at
+            self.timer.start()
+
+    def wait(self, timeout=10):
+        """Block until no drain is running, for tests and graceful shutdowns."""
+        with self.lock:
+            return self.lock.wait_for(lambda: self.active == 0, timeout)
+
+
+runner = ThreadRunner()
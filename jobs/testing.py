@@ -0,0 +1,20 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from jobs.queue import jobs_settings
+
+
+class EagerJobsTestRunner(DiscoverRunner):
+    """Runs jobs inline during tests, so their effects are visible right after a request.
+
+    Tests of the queue itself switch back with ``override_settings(JOBS=...)``.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.jobs_override = override_settings(JOBS={**jobs_settings(), 'MODE': 'eager'})
+        self.jobs_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.jobs_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,179 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import claim, enqueue, jobs_settings, requeue_stale, run_pending, runner, task
+from movie_app.models import Director, Movie, Review
+from movie_app.tasks import BULK_RATINGS_CHUNK
+
+calls = []
+
+
+@task('jobs.tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task('jobs.tests.flaky', max_attempts=3)
+def flaky(fail_times):
+    calls.append('try')
+    if len(calls) <= fail_times:
+        raise RuntimeError('boom')
+
+
+def mode(name):
+    return override_settings(JOBS={**jobs_settings(), 'MODE': name, 'RETRY_DELAY': 0})
+
+
+@mode('worker')
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_wait_in_the_table_until_a_runner_picks_them(self):
+        job = enqueue(record, value=1)
+        self.assertEqual(calls, [])
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+
+    def test_retries_then_fails(self):
+        enqueue(flaky, fail_times=1)
+        run_pending()
+        run_pending()
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertEqual(calls, ['try', 'try'])
+
+        calls.clear()
+        Job.objects.all().delete()
+        enqueue(flaky, fail_times=10)
+        for _ in range(5):
+            run_pending()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIn('RuntimeError: boom', job.last_error)
+
+    def test_retry_waits_for_backoff(self):
+        with override_settings(JOBS={**jobs_settings(), 'RETRY_DELAY': 60}):
+            enqueue(flaky, fail_times=1)
+            run_pending()
+            self.assertEqual(run_pending(), 0)
+        self.assertGreater(Job.objects.get().run_at, timezone.now() + timedelta(seconds=50))
+
+    def test_keyed_jobs_coalesce_while_queued(self):
+        enqueue(record, key='movie:1', value=1)
+        enqueue(record, key='movie:1', value=1)
+        enqueue(record, key='movie:2', value=2)
+        self.assertEqual(Job.objects.count(), 2)
+        run_pending()
+        enqueue(record, key='movie:1', value=1)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    def test_unknown_task_and_stale_jobs(self):
+        Job.objects.create(name='gone.task')
+        run_pending()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+        enqueue(record, value=3)
+        [job] = claim('dead-worker')
+        self.assertEqual(run_pending(), 0)
+        Job.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [3])
+
+    def test_bulk_writes_queue_few_rating_jobs(self):
+        director = Director.objects.create(name='Kurosawa')
+        movies = Movie.objects.bulk_create(Movie(title=f'Movie {i}', description='', director=director)
+                                           for i in range(BULK_RATINGS_CHUNK + 100))
+        run_pending()
+        items = [{'text': 'a', 'stars': 4, 'movie_id': movie.id} for movie in movies]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/reviews/bulk/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 15)
+        jobs = Job.objects.filter(status=Job.QUEUED, name='movie_app.refresh_ratings')
+        self.assertEqual(sorted(len(job.payload['movie_ids']) for job in jobs), [100, BULK_RATINGS_CHUNK])
+        run_pending()
+        self.assertEqual(Movie.objects.filter(reviews_count=1).count(), len(movies))
+
+    def test_review_side_effects_run_off_the_request(self):
+        movie = Movie.objects.create(title='Ikiru', description='', director=Director.objects.create(name='Kurosawa'))
+        run_pending()
+        response = self.client.post('/api/v1/reviews/', {'text': 'a', 'stars': 4, 'movie_id': movie.id})
+        self.assertEqual(response.status_code, 200)
+        movie.refresh_from_db()
+        self.assertEqual(movie.reviews_count, 0)
+        self.assertEqual(set(Job.objects.filter(status=Job.QUEUED).values_list('name', flat=True)),
+                         {'movie_app.refresh_ratings', 'movie_app.sync_search_index'})
+
+        run_pending()
+        movie.refresh_from_db()
+        self.assertEqual((movie.reviews_count, movie.rating), (1, 4.0))
+        self.assertEqual(self.client.get('/api/v1/reviews/?search=a').json()['results'][0]['text'], 'a')
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+
+def pending_due_jobs():
+    # With replicas configured, cache invalidation also queues a delayed job.
+    return Job.objects.exclude(status=Job.DONE).filter(run_at__lte=timezone.now())
+
+
+class JobRunnerTests(TransactionTestCase):
+    def setUp(self):
+        self.movie = Movie.objects.create(title='Ran', description='',
+                                          director=Director.objects.create(name='Kurosawa'))
+
+    @mode('thread')
+    def test_thread_mode_runs_jobs_after_commit(self):
+        with transaction.atomic():
+            Review.objects.create(text='epic', stars=5, movie=self.movie)
+            Review.objects.create(text='long', stars=3, movie=self.movie)
+        self.assertTrue(runner.wait())
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.reviews_count, self.movie.stars_sum), (2, 8))
+        self.assertFalse(pending_due_jobs().exists())
+
+    @mode('worker')
+    def test_worker_command(self):
+        for stars in (1, 2, 3):
+            Review.objects.create(text='review', stars=stars, movie=self.movie)
+        out = StringIO()
+        call_command('run_jobs_worker', once=True, threads=2, stdout=out)
+        self.assertIn('Worker stopped.', out.getvalue())
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.reviews_count, self.movie.rating), (3, 2.0))
+        self.assertFalse(pending_due_jobs().exists())
+
+    @mode('thread')
+    def test_thread_mode_does_the_maintenance(self):
+        calls.clear()
+        long_ago = timezone.now() - timedelta(days=2)
+        done = Job.objects.create(name=record.task_name, payload={'value': 'done'}, status=Job.DONE,
+                                  run_at=long_ago, finished_at=long_ago)
+        Job.objects.create(name=record.task_name, payload={'value': 'orphan'}, status=Job.RUNNING,
+                           run_at=long_ago, locked_by='dead-runner', locked_at=long_ago)
+        runner.next_maintenance = None    # as in a freshly started process
+        runner.wake()
+        self.assertTrue(runner.wait())
+        self.assertFalse(Job.objects.filter(id=done.id).exists())
+        self.assertEqual(calls, ['orphan'])
+
+    @mode('thread')
+    def test_thread_mode_keeps_one_retry_timer(self):
+        self.addCleanup(lambda: runner.timer and runner.timer.cancel())
+        enqueue(record, delay=60, value='later')
+        for _ in range(3):
+            runner.wake()
+            self.assertTrue(runner.wait())
+        timers = [thread for thread in threading.enumerate() if isinstance(thread, threading.Timer)]
+        self.assertEqual(timers, [runner.timer])
@@ -0,0 +1,105 @@
+"""Native async read endpoints, for deployments running under ASGI.
+
+They query with Django's async ORM (``aget``, ``async for``) so no thread
+from the sync-to-async pool is held while waiting on the database.
+Serializers only run on rows that are already loaded (related objects
+come from ``select_related``/``prefetch_related``), so they never touch
+the database from the event loop.
+
+Lists are paged by a keyset on ``id``: ``?cursor=`` is the opaque value
+of ``next`` from the previous page, ``?page_size=`` is capped like in
+``KeysetPagination``.
+"""
+import base64
+
+from django.http import JsonResponse
+from django.utils.http import urlencode
+
+from movie_app.models import Director, Movie, Review
+from movie_app.pagination import KeysetPagination
+from movie_app.serializers import DirectorSerializer, MovieSerializer, ReviewSerializer
+
+
+class BadRequest(Exception):
+    pass
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(f'id={last_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        name, value = base64.urlsafe_b64decode(cursor.encode()).decode().split('=')
+        value = int(value)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest('Invalid cursor')
+    if name != 'id':
+        raise BadRequest('Invalid cursor')
+    return value
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.GET.get('page_size', KeysetPagination.page_size))
+    except ValueError:
+        raise BadRequest('Invalid page_size')
+    return max(1, min(page_size, KeysetPagination.max_page_size))
+
+
+async def list_response(request, queryset, serializer_class):
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        page_size = get_page_size(request)
+        cursor = request.GET.get('cursor')
+        if cursor:
+            queryset = queryset.filter(id__gt=decode_cursor(cursor))
+    except BadRequest as exc:
+        return JsonResponse({'detail': str(exc)}, status=400)
+
+    page = [obj async for obj in queryset.order_by('id')[:page_size + 1]]
+    next_url = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        query = {**request.GET.dict(), 'cursor': encode_cursor(page[-1].id)}
+        next_url = request.build_absolute_uri(f'{request.path}?{urlencode(query)}')
+    data = serializer_class(page, many=True).data
+    return JsonResponse({'next': next_url, 'results': data})
+
+
+async def detail_response(request, queryset, pk, serializer_class, not_found):
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        obj = await queryset.aget(id=pk)
+    except queryset.model.DoesNotExist:
+        return JsonResponse({'error': not_found}, status=404)
+    return JsonResponse(serializer_class(obj).data)
+
+
+async def director_list_async_view(request):
+    return await list_response(request, Director.objects.all(), DirectorSerializer)
+
+
+async def director_detail_async_view(request, director_id):
+    return await detail_response(request, Director.objects.all(), director_id,
+                                 DirectorSerializer, 'Director not Found')
+
+
+async def movie_list_async_view(request):
+    return await list_response(request, Movie.objects.with_related(), MovieSerializer)
+
+
+async def movie_detail_async_view(request, movie_id):
+    return await detail_response(request, Movie.objects.with_related(), movie_id,
+                                 MovieSerializer, 'Movie not Found')
+
+
+async def review_list_async_view(request):
+    return await list_response(request, Review.objects.all(), ReviewSerializer)
+
+
+async def review_detail_async_view(request, review_id):
+    return await detail_response(request, Review.objects.all(), review_id,
+                                 ReviewSerializer, 'Review not Found')
@@ -0,0 +1,305 @@
+"""Helpers shared by the benchmark and load test management commands.
+
+The clients send ``Host: testserver``, callers run them under
+``override_settings(ALLOWED_HOSTS=...)`` that accepts it.
+"""
+import asyncio
+import math
+import random
+import re
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+from itertools import count
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from movie_app.models import STARS, Director, Movie, Review
+from movie_app.rankings import refresh_rankings
+from movie_app.renderers import FastJSONParser, FastJSONRenderer
+from movie_app.search import get_backend
+
+BENCHMARK_USER = ('benchmark', 'benchmark-password')
+# Routes that are not part of the API itself.
+SKIPPED_ROUTES = ('admin/', 'metrics')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Latencies in seconds -> milliseconds percentiles and throughput."""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def load_sync(url, requests, concurrency):
+    """Hit ``url`` through the WSGI handler from ``concurrency`` threads."""
+    def worker(count):
+        client = Client()
+        latencies, errors = [], 0
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+        connections.close_all()
+        return latencies, errors
+
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - started
+    return summarize([lat for lats, _ in results for lat in lats], elapsed,
+                     sum(errors for _, errors in results))
+
+
+def load_async(url, requests, concurrency):
+    """Hit ``url`` through the ASGI handler with ``concurrency`` requests in flight."""
+    async def run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return summarize(latencies, time.perf_counter() - started, errors)
+
+    return asyncio.run(run())
+
+
+def seed_catalog(directors, movies, reviews, batch_size=1000, seed=0):
+    """Bulk insert a synthetic catalog and rebuild what the signals would have kept.
+
+    ``bulk_create`` skips ``post_save``, so the rating aggregates, the
+    leaderboards and the search index are rebuilt once at the end instead
+    of row by row. Reviews are spread over the last 30 days.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    words = ['night', 'city', 'river', 'ghost', 'summer', 'empire', 'silent', 'road',
+             'dream', 'stranger', 'garden', 'winter', 'fire', 'last', 'house', 'sea']
+
+    def phrase(size):
+        return ' '.join(rng.choice(words) for _ in range(size))
+
+    Director.objects.bulk_create(
+        (Director(name=f'Director {i} {phrase(1)}') for i in range(directors)),
+        batch_size=batch_size,
+    )
+    director_ids = list(Director.objects.values_list('id', flat=True))
+    Movie.objects.bulk_create(
+        (Movie(title=f'{phrase(2).title()} {i}', description=phrase(12),
+               duration=rng.randint(80, 180), director_id=rng.choice(director_ids))
+         for i in range(movies)),
+        batch_size=batch_size,
+    )
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    Review.objects.bulk_create(
+        (Review(text=phrase(8), stars=rng.choice(STARS), movie_id=rng.choice(movie_ids),
+                created_at=now - timedelta(seconds=rng.randrange(30 * 86400)))
+         for _ in range(reviews)),
+        batch_size=batch_size,
+    )
+    Movie.objects.refresh_ratings()
+    refresh_rankings()
+    backend = get_backend()
+    for model in (Movie, Review):
+        backend.rebuild(model)
+    if not User.objects.filter(username=BENCHMARK_USER[0]).exists():
+        User.objects.create_user(username=BENCHMARK_USER[0], password=BENCHMARK_USER[1])
+    return {'directors': len(director_ids), 'movies': len(movie_ids),
+            'reviews': Review.objects.count()}
+
+
+def iter_routes(patterns=None, prefix=''):
+    """Yield the path templates of the project urlconf, ``SKIPPED_ROUTES`` excluded."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if route.startswith(SKIPPED_ROUTES):
+            continue
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            yield route
+
+
+class RouteRequests:
+    """Turn a path template into concrete requests against the seeded catalog.
+
+    Detail routes get the id of an existing row, list routes are read with
+    GET and written with POST, bulk and user routes are POST only and the
+    leaderboards GET only.
+    """
+    RESOURCES = {'directors': Director, 'movies': Movie, 'reviews': Review}
+    READ_ONLY_ROUTES = ('api/v1/movies/top/', 'api/v1/movies/trending/')
+
+    def __init__(self):
+        self.sequence = count()
+        self.ids = {name: model.objects.order_by('id').values_list('id', flat=True).first()
+                    for name, model in self.RESOURCES.items()}
+
+    def resource(self, route):
+        match = re.match(r'api/v1/(?:async/)?(\w+?)(?:_cbv)?/', route)
+        return match.group(1) if match else None
+
+    def payload(self, resource):
+        n = next(self.sequence)
+        if resource == 'directors':
+            return {'name': f'Benchmark director {n}'}
+        if resource == 'movies':
+            return {'title': f'Benchmark movie {n}', 'description': 'benchmark',
+                    'duration': 120, 'director_id': self.ids['directors']}
+        if resource == 'reviews':
+            return {'text': f'Benchmark review {n}', 'stars': STARS[n % len(STARS)],
+                    'movie_id': self.ids['movies']}
+        return None
+
+    def requests_for(self, route):
+        """Return ``[(method, url, payload factory or None), ...]`` for a route."""
+        resource = self.resource(route)
+        url = '/' + re.sub(r'<(?:\w+:)?(\w+)>', lambda match: self.fill(resource, match.group(1)), route)
+        if route.startswith('api/v1/users/register'):
+            return [('post', url, lambda: {'username': f'bench-{next(self.sequence)}',
+                                           'password': BENCHMARK_USER[1]})]
+        if route.startswith('api/v1/users/auth'):
+            return [('post', url, lambda: dict(zip(('username', 'password'), BENCHMARK_USER)))]
+        if route.endswith('bulk/'):
+            return [('post', url, lambda: [self.payload(resource) for _ in range(10)])]
+        requests = [('get', url, None)]
+        if ('<' not in route and '/async/' not in url and resource in self.RESOURCES
+                and route not in self.READ_ONLY_ROUTES):
+            requests.append(('post', url, lambda: self.payload(resource)))
+        return requests
+
+    def fill(self, resource, name):
+        if name == 'export_format':
+            return 'ndjson'
+        return str(self.ids.get(resource) or 0)
+
+
+def measure(client, method, url, payload, iterations, warmup=2):
+    """Time one request ``iterations`` times; count its queries and peak memory."""
+    def send():
+        data = payload() if payload else None
+        response = getattr(client, method)(url, data, content_type='application/json') \
+            if data is not None else getattr(client, method)(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    for _ in range(warmup):
+        send()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        request_started = time.perf_counter()
+        response = send()
+        latencies.append(time.perf_counter() - request_started)
+        errors += response.status_code >= 400
+    stats = summarize(latencies, time.perf_counter() - started, errors)
+    stats['status'] = response.status_code
+
+    # Queries and memory come from one extra request each, so neither the
+    # query log nor tracemalloc skews the latencies above.
+    with CaptureQueriesContext(connection) as queries:
+        send()
+    stats['queries'] = len(queries)
+    tracemalloc.start()
+    try:
+        send()
+        stats['peak_memory_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+    return stats
+
+
+def benchmark_routes(iterations=50, warmup=2, routes=None):
+    """Benchmark every route of the urlconf, keyed ``"METHOD /path/"``."""
+    client = Client()
+    planner = RouteRequests()
+    results = {}
+    for route in routes or iter_routes():
+        for method, url, payload in planner.requests_for(route):
+            results[f'{method.upper()} /{route}'] = measure(client, method, url, payload,
+                                                            iterations, warmup)
+    return results
+
+
+def compare(baseline, current, threshold=1.25, min_delta_ms=1.0):
+    """List the routes of ``current`` that regressed against ``baseline``.
+
+    A route regresses when it issues more queries, or when its p50 latency
+    grows by more than ``threshold`` times and ``min_delta_ms`` milliseconds
+    (the absolute floor keeps sub-millisecond noise out).
+    """
+    regressions = []
+    for key, stats in current.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if stats['queries'] > before['queries']:
+            regressions.append(f'{key}: {before["queries"]} -> {stats["queries"]} queries')
+        if (stats['p50_ms'] > before['p50_ms'] * threshold
+                and stats['p50_ms'] - before['p50_ms'] > min_delta_ms):
+            regressions.append(f'{key}: p50 {before["p50_ms"]} -> {stats["p50_ms"]} ms')
+    return regressions
+
+
+def time_serializers(pairs, repeat=3):
+    """Best-of-``repeat`` seconds to render each ``(name, render)`` pair, queries included."""
+    results = {}
+    for name, render in pairs:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started)
+        results[name] = round(min(timings), 4)
+    return results
+
+
+def time_json(data, repeat=5):
+    """Render ``data`` and parse it back with DRF's stdlib JSON classes and the orjson ones."""
+    results = {}
+    for name, renderer, parser in (('json', JSONRenderer(), JSONParser()),
+                                   ('orjson', FastJSONRenderer(), FastJSONParser())):
+        body = renderer.render(data)
+        results[name] = time_serializers([
+            ('render', lambda: renderer.render(data)),
+            ('parse', lambda: parser.parse(BytesIO(body))),
+        ], repeat)
+        results[name]['bytes'] = len(body)
+    return results
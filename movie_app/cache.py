@@ -0,0 +1,159 @@
+"""Response cache for the read endpoints.
+
+Serialized payloads of GET requests are stored in the cache configured by
+``settings.API_CACHE`` under a key made of the request URL (scheme, host
+and path), its query parameters and a *version token*. Every resource has one token for its
+list pages and one per object; changing a row replaces the tokens it
+affects (see ``invalidate_objects``), which orphans exactly the entries
+built from the old data without having to enumerate cache keys.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from Afisha.routers import replica_settings
+from jobs.queue import enqueue, task
+from movie_app.models import Director, Movie, Review
+
+
+def api_cache_settings():
+    return {'ALIAS': 'default', 'TIMEOUT': 300, 'ENABLED': True, **getattr(settings, 'API_CACHE', {})}
+
+
+def get_cache():
+    return caches[api_cache_settings()['ALIAS']]
+
+
+def version_key(resource, pk=None):
+    return f'api:version:{resource}:{"list" if pk is None else pk}'
+
+
+def get_version(resource, pk=None):
+    cache = get_cache()
+    key = version_key(resource, pk)
+    version = cache.get(key)
+    if version is None:
+        # A missing token (never set or evicted) must not resurrect old entries.
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def response_key(request, resource, pk):
+    query = sorted(request.query_params.lists())
+    # The next/previous links of the payloads are absolute, built from the scheme and host.
+    url = f'{request.scheme}://{request.get_host()}{request.path}'
+    digest = hashlib.md5(f'{url}?{query}'.encode()).hexdigest()
+    return f'api:response:{resource}:{"list" if pk is None else pk}:{get_version(resource, pk)}:{digest}'
+
+
+def cached_response(request, resource, pk, get_response):
+    """Serve a GET from the cache, or build it with ``get_response()`` and store it."""
+    options = api_cache_settings()
+    if request.method != 'GET' or not options['ENABLED']:
+        return get_response()
+
+    cache = get_cache()
+    key = response_key(request, resource, pk)
+    data = cache.get(key)
+    if data is not None:
+        response = Response(data=data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    response = get_response()
+    if response.status_code == 200 and getattr(response, 'data', None) is not None:
+        cache.set(key, response.data, timeout=options['TIMEOUT'])
+        response['X-Cache'] = 'MISS'
+    return response
+
+
+def cache_response(resource, lookup_kwarg=None):
+    """Decorator for function views, to be put under ``@api_view``."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            pk = kwargs.get(lookup_kwarg) if lookup_kwarg else None
+            return cached_response(request, resource, pk, lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+class CacheResponseMixin:
+    """Caches ``list``/``retrieve`` of generic views and viewsets."""
+    cache_resource = None
+
+    def list(self, request, *args, **kwargs):
+        get_response = super().list
+        return cached_response(request, self.cache_resource, None,
+                               lambda: get_response(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        get_response = super().retrieve
+        return cached_response(request, self.cache_resource, kwargs.get(self.lookup_field),
+                               lambda: get_response(request, *args, **kwargs))
+
+
+def bump_versions(keys):
+    get_cache().set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+
+@task('movie_app.bump_cache_versions')
+def bump_cache_versions(keys):
+    bump_versions(keys)
+
+
+def invalidate(keys):
+    keys = set(keys)
+    if not keys:
+        return
+    bump_versions(keys)
+    if transaction.get_connection().in_atomic_block:
+        # A reader may have cached the old rows between the first bump and the
+        # commit, bump again once the new rows are visible.
+        transaction.on_commit(lambda: bump_versions(keys))
+    replicas = replica_settings()
+    if replicas['ALIASES']:
+        # Readers of a lagging replica may still cache the old rows, bump once
+        # more when the replicas have caught up.
+        transaction.on_commit(lambda: enqueue(bump_cache_versions, delay=replicas['MAX_LAG'],
+                                              keys=sorted(keys)))
+
+
+def invalidate_objects(model, objects):
+    """Replace the version tokens of every payload that contains one of ``objects``."""
+    objects = list(objects)
+    if not objects:
+        return
+    keys = set()
+    if model is Director:
+        ids = [director.id for director in objects]
+        keys.add(version_key('director'))
+        keys.update(version_key('director', pk) for pk in ids)
+        movie_ids = Movie.objects.filter(director_id__in=ids).values_list('id', flat=True)
+        keys.add(version_key('movie'))
+        keys.update(version_key('movie', pk) for pk in movie_ids)
+    elif model is Movie:
+        keys.add(version_key('movie'))
+        keys.update(version_key('movie', movie.id) for movie in objects)
+        # Director payloads embed the aggregates and a list of their movies.
+        keys.add(version_key('director'))
+        for movie in objects:
+            keys.add(version_key('director', movie.director_id))
+            if getattr(movie, '_loaded_director_id', None) is not None:
+                keys.add(version_key('director', movie._loaded_director_id))
+    elif model is Review:
+        keys.add(version_key('review'))
+        keys.update(version_key('review', review.id) for review in objects)
+        # Reviews and the rating are embedded in the movie payloads.
+        keys.add(version_key('movie'))
+        for review in objects:
+            keys.add(version_key('movie', review.movie_id))
+            if hasattr(review, '_loaded_rating'):
+                keys.add(version_key('movie', review._loaded_rating[0]))
+    invalidate(keys)
@@ -0,0 +1,198 @@
+"""Conditional GET (``ETag`` / ``Last-Modified``) for the read endpoints.
+
+Validators come from ``updated_at`` columns: one indexed lookup for a
+detail resource, one ``MAX(updated_at)``/``COUNT(*)`` aggregate for a
+list. A matching ``If-None-Match``/``If-Modified-Since`` is answered with
+``304 Not Modified`` before the view queries or serializes anything.
+With the response cache on (``movie_app.cache``), the validators are
+cached next to the payload, under the same version token: a cache hit
+and its 304 do not query the database at all. The key, and so the
+token, is read before the validators are computed, so validators built
+from rows a write has since changed are stored under a token the write
+replaces.
+Movie payloads embed their reviews, so the movie validators include the
+reviews' ``MAX(updated_at)``/``COUNT(*)`` (a text edit does not touch
+the movie); the director validators include their movies, whose
+aggregates they embed.
+
+Writes to a movie or a review (``PUT``/``PATCH``/``DELETE``) run in a
+transaction that locks the row first. With an ``If-Match`` header the
+write only happens if the tag is still the current ``ETag`` of the
+resource (otherwise ``412 Precondition Failed``), so two clients editing
+the same row cannot overwrite each other. The tags of these resources
+are ``"<version tag>.<representation>"``: If-Match only compares the
+version tag, made of the resource, its id and the ``version`` column
+every write of the API increments, so a tag read from any URL or
+``?fields=`` of the resource works, and background changes that do not
+bump the version (rating recounts) do not fail it. Successful updates
+return the new ``ETag``.
+"""
+import hashlib
+from functools import wraps
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from movie_app.cache import api_cache_settings, get_cache, response_key
+from movie_app.models import Director, Movie, Review
+
+# Resources whose writes are serialized by a row lock and checked against If-Match.
+VERSIONED = {'movie': Movie, 'review': Review}
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been modified, fetch it again before changing it.'
+    default_code = 'precondition_failed'
+
+
+def latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def list_state(resource):
+    if resource in ('movie', 'director'):
+        movies = Movie.objects.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+        directors = Director.objects.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+        if resource == 'director':
+            count = f'{directors["count"]}:{movies["count"]}'
+            return latest(movies['updated_at'], directors['updated_at']), count, None
+        reviews = Review.objects.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+        count = f'{movies["count"]}:{reviews["count"]}'
+        return latest(movies['updated_at'], directors['updated_at'], reviews['updated_at']), count, None
+    state = Review.objects.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+    return state['updated_at'], state['count'], None
+
+
+def detail_state(resource, pk):
+    """``(updated_at, count, version)`` of a detail resource, None when it does not exist."""
+    if resource == 'movie':
+        row = (Movie.objects.filter(id=pk)
+               .annotate(reviews_updated_at=Max('reviews__updated_at'), reviews_total=Count('reviews'))
+               .values_list('updated_at', 'director__updated_at', 'reviews_updated_at', 'reviews_total', 'version')
+               .first())
+        return None if row is None else (latest(*row[:3]), row[3], row[4])
+    if resource == 'director':
+        live_movies = Q(movie__deleted_at__isnull=True)
+        row = (Director.objects.filter(id=pk)
+               # Reverse joins ignore the default manager, leave soft deleted movies out.
+               .annotate(movies_updated_at=Max('movie__updated_at', filter=live_movies),
+                         movies_count=Count('movie', filter=live_movies))
+               .values_list('updated_at', 'movies_updated_at', 'movies_count').first())
+        return None if row is None else (latest(*row[:2]), row[2], None)
+    row = Review.objects.filter(id=pk).values_list('updated_at', 'version').first()
+    return None if row is None else (row[0], None, row[1])
+
+
+def version_tag(resource, pk, version):
+    return hashlib.md5(f'{resource}|{pk}|{version}'.encode()).hexdigest()[:16]
+
+
+def make_etag(request, resource, updated_at, count, pk=None, version=None):
+    # The path and query are part of the tag: ?fields=, pages and orderings differ.
+    query = sorted(request.query_params.lists())
+    source = f'{resource}|{request.path}?{query}|{updated_at.isoformat() if updated_at else ""}|{count}'
+    digest = hashlib.md5(source.encode()).hexdigest()
+    if version is not None:
+        digest = f'{version_tag(resource, pk, version)}.{digest}'
+    return f'"{digest}"'
+
+
+def matches_version(if_match, resource, pk, version):
+    if if_match.strip() == '*':
+        return True
+    current = version_tag(resource, pk, version)
+    return any(etag.removeprefix('W/').strip('"').split('.')[0] == current for etag in parse_etags(if_match))
+
+
+def locked_write(request, resource, pk, get_response):
+    with transaction.atomic():
+        version = (VERSIONED[resource].objects.select_for_update().filter(id=pk)
+                   .values_list('version', flat=True).first())
+        if version is None:
+            return get_response()    # let the view answer 404
+        if_match = request.headers.get('If-Match')
+        if if_match is not None and not matches_version(if_match, resource, pk, version):
+            raise PreconditionFailed()
+        response = get_response()
+        if request.method != 'DELETE' and 200 <= response.status_code < 300:
+            updated_at, count, version = detail_state(resource, pk)
+            response['ETag'] = make_etag(request, resource, updated_at, count, pk=pk, version=version)
+    return response
+
+
+def validators_key(request, resource, pk):
+    """Cache key of the ``(ETag, Last-Modified)`` of a response, None with the cache off."""
+    if not api_cache_settings()['ENABLED']:
+        return None
+    return response_key(request, resource, pk) + ':validators'
+
+
+def conditional_response(request, resource, pk, get_response):
+    if request.method in ('PUT', 'PATCH', 'DELETE') and pk is not None and resource in VERSIONED:
+        return locked_write(request, resource, pk, get_response)
+    if request.method not in ('GET', 'HEAD'):
+        return get_response()
+    key = validators_key(request, resource, pk)
+    cached = get_cache().get(key) if key else None
+    if cached is not None:
+        etag, last_modified = cached
+    else:
+        state = list_state(resource) if pk is None else detail_state(resource, pk)
+        if state is None:
+            return get_response()    # let the view answer 404
+        updated_at, count, version = state
+        etag = make_etag(request, resource, updated_at, count, pk=pk, version=version)
+        last_modified = int(updated_at.timestamp()) if updated_at else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    response = get_response()
+    if response.status_code == 200:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if key and cached is None:
+            get_cache().set(key, (etag, last_modified), timeout=api_cache_settings()['TIMEOUT'])
+    return response
+
+
+def conditional(resource, lookup_kwarg=None):
+    """Decorator for function views, to be put under ``@api_view``."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            pk = kwargs.get(lookup_kwarg) if lookup_kwarg else None
+            return conditional_response(request, resource, pk, lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+class ConditionalResponseMixin:
+    """``ETag``/``Last-Modified`` for ``list``/``retrieve`` of generic views and viewsets.
+
+    ``destroy`` is checked against ``If-Match``; views overriding ``update``
+    wrap it in ``conditional_response`` themselves.
+    """
+    cache_resource = None
+
+    def list(self, request, *args, **kwargs):
+        get_response = super().list
+        return conditional_response(request, self.cache_resource, None,
+                                    lambda: get_response(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        get_response = super().retrieve
+        return conditional_response(request, self.cache_resource, kwargs.get(self.lookup_field),
+                                    lambda: get_response(request, *args, **kwargs))
+
+    def destroy(self, request, *args, **kwargs):
+        get_response = super().destroy
+        return conditional_response(request, self.cache_resource, kwargs.get(self.lookup_field),
+                                    lambda: get_response(request, *args, **kwargs))
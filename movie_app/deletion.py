@@ -0,0 +1,86 @@
+"""Soft delete of directors and movies, and the purge that removes them for good.
+
+Deleting through the API does not run the ``on_delete=CASCADE`` collector,
+which loads every movie and review of a director in Python before deleting
+them. ``soft_delete`` marks the rows and everything below them with
+``deleted_at`` instead: one ``UPDATE`` per table, whatever the size of the
+filmography. The default managers hide marked rows (``all_objects`` still
+returns them). The payloads of the deleted rows are invalidated right away;
+the leaderboards, the search index and the cached reviews are updated by a
+job (see ``movie_app.tasks``).
+
+``manage.py purge_deleted`` removes the marked rows later, children first,
+in batches of raw ``DELETE ... WHERE id IN (SELECT ... LIMIT n)``
+statements, each in its own short transaction.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from movie_app.cache import invalidate, invalidate_objects, version_key
+from movie_app.models import Director, Movie, MovieRanking, MovieReviewDay, Review
+from movie_app.tasks import forget_deleted_movies
+
+
+def soft_delete(model, ids):
+    """Mark directors or movies (``model``) and the rows that depend on them as deleted."""
+    now = timezone.now()
+    with transaction.atomic():
+        if model is Director:
+            directors = Director.objects.filter(id__in=ids)
+            invalidate_objects(Director, directors)
+            movies = Movie.objects.filter(director_id__in=ids)
+        else:
+            movies = Movie.objects.filter(id__in=ids)
+        movie_objects = list(movies.only('id', 'director_id'))
+        invalidate_objects(Movie, movie_objects)
+        invalidate([version_key('review')])
+
+        # updated_at moves too, the ETag validators compare it.
+        Review.objects.filter(movie_id__in=movies.values('id')).update(deleted_at=now, updated_at=now)
+        movies.update(deleted_at=now, updated_at=now)
+        if model is Director:
+            directors.update(deleted_at=now, updated_at=now)
+        if movie_objects:
+            enqueue(forget_deleted_movies, movie_ids=[movie.id for movie in movie_objects])
+
+
+def purge_steps(before):
+    """``(model, condition, params)`` of the rows to delete, in a foreign key safe order.
+
+    Movies of a purged director and reviews of a purged movie go too, even if a
+    concurrent write created them after the parent was marked.
+    """
+    directors = f'SELECT id FROM {Director._meta.db_table} WHERE deleted_at < %s'
+    movies = f'SELECT id FROM {Movie._meta.db_table} WHERE deleted_at < %s OR director_id IN ({directors})'
+    return [
+        (Review, f'movie_id IN ({movies})', [before, before]),
+        (MovieReviewDay, f'movie_id IN ({movies})', [before, before]),
+        (MovieRanking, f'movie_id IN ({movies})', [before, before]),
+        (Movie, f'deleted_at < %s OR director_id IN ({directors})', [before, before]),
+        (Director, 'deleted_at < %s', [before]),
+    ]
+
+
+def purge_deleted(before=None, batch_size=1000, progress=None):
+    """Delete the rows soft deleted before ``before`` (default: now); return the counts per model.
+
+    ``progress(model, deleted, total)`` is called after every batch.
+    """
+    before = before or timezone.now()
+    counts = {}
+    for model, condition, params in purge_steps(before):
+        table, pk = model._meta.db_table, model._meta.pk.column
+        sql = f'DELETE FROM {table} WHERE {pk} IN (SELECT {pk} FROM {table} WHERE {condition} LIMIT %s)'
+        total = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [*params, batch_size])
+                deleted = cursor.rowcount
+            total += deleted
+            if deleted and progress is not None:
+                progress(model, deleted, total)
+            if deleted < batch_size:
+                break
+        counts[model._meta.label] = total
+    return counts
@@ -0,0 +1,57 @@
+"""Streaming export of the whole catalog.
+
+Movies are read with ``.iterator(chunk_size=...)`` (reviews are prefetched
+per chunk) and written out one record at a time, so memory use depends on
+the chunk size and not on the size of the tables.
+"""
+import csv
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from movie_app.models import Movie
+from movie_app.serializers import MovieSerializer
+
+CHUNK_SIZE = 500
+
+CSV_HEADER = [
+    'movie_id', 'title', 'description', 'duration', 'director_id', 'director_name',
+    'rating', 'reviews_count', 'review_id', 'review_text', 'review_stars',
+]
+
+
+def iter_movies(chunk_size=CHUNK_SIZE):
+    movies = Movie.objects.with_related().order_by('id')
+    for movie in movies.iterator(chunk_size=chunk_size):
+        yield MovieSerializer(movie).data
+
+
+def iter_ndjson(chunk_size=CHUNK_SIZE):
+    """One JSON document per movie, in the same shape as ``MovieSerializer``."""
+    encoder = JSONEncoder(ensure_ascii=False)
+    for movie in iter_movies(chunk_size):
+        yield encoder.encode(movie) + '\n'
+
+
+class Echo:
+    """File-like object whose ``write`` returns the line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(chunk_size=CHUNK_SIZE):
+    """One row per review, movies without reviews get a single row with empty review columns."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for movie in iter_movies(chunk_size):
+        director = movie['director']
+        columns = [movie['id'], movie['title'], movie['description'], movie['duration'],
+                   director['id'], director['name'], movie['rating'], movie['reviews_count']]
+        for review in movie['reviews'] or [{'id': '', 'text': '', 'stars': ''}]:
+            yield writer.writerow(columns + [review['id'], review['text'], review['stars']])
+
+
+EXPORTERS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
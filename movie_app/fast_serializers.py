@@ -0,0 +1,182 @@
+"""Read-only serializers that render ``.values()`` rows.
+
+``MovieSerializer`` spends most of a large list's CPU time in DRF's field
+machinery (``get_attribute``, ``to_representation`` per field, nested
+serializer instances) rather than in SQL. The classes here produce the
+exact same output from plain dict rows: each field is reduced once to a
+*plan* entry, a function of the row, so rendering an item is a single
+dict comprehension.
+
+They take the same arguments as the serializers they stand in for
+(``instance``, ``many``, ``fields``) and expose ``.data``, so ``paginate``
+and the generic views use them unchanged. Querysets must be prepared with
+``setup_queryset``, which selects the columns the plan reads; write
+endpoints keep using the regular serializers.
+"""
+import time
+from operator import itemgetter
+
+from movie_app.metrics import observe_serializer
+from movie_app.models import STARS, Director, Movie, Review, average_rating
+
+
+def nullable(convert, column):
+    def get(row):
+        value = row[column]
+        return None if value is None else convert(value)
+    return get
+
+
+class ValuesSerializer:
+    model = None
+    # Every field: (columns the field reads, function of the row or None for row[column]).
+    plan = {}
+    # Columns the list endpoints may order by; the cursor reads them from the row.
+    ordering_columns = ('id',)
+
+    _compiled = {}
+    # ``?fields=`` combinations are client controlled, keep the plan cache bounded.
+    max_compiled = 256
+
+    def __init__(self, instance=None, many=False, fields=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.fields = tuple(fields) if fields is not None else tuple(self.plan)
+
+    @classmethod
+    def compile(cls, fields):
+        key = (cls, fields)
+        getters = cls._compiled.get(key)
+        if getters is None:
+            # Shared by every thread: return the local list, another thread may clear() the dict.
+            if len(cls._compiled) >= cls.max_compiled:
+                cls._compiled.clear()
+            getters = []
+            for name in fields:
+                columns, get = cls.plan[name]
+                getters.append((name, get or itemgetter(columns[0])))
+            cls._compiled[key] = getters
+        return getters
+
+    @classmethod
+    def columns(cls, fields=None):
+        columns = dict.fromkeys(cls.ordering_columns)
+        for name in fields if fields is not None else cls.plan:
+            columns.update(dict.fromkeys(cls.plan[name][0]))
+        return list(columns)
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None):
+        return queryset.values(*cls.columns(fields))
+
+    def prepare(self, rows):
+        """Hook to attach related data to the rows before they are rendered."""
+
+    @property
+    def data(self):
+        if not hasattr(self, '_data'):
+            started = time.perf_counter()
+            rows = list(self.instance) if self.many else [self.instance]
+            self.prepare(rows)
+            getters = self.compile(self.fields)
+            items = [{name: get(row) for name, get in getters} for row in rows]
+            self._data = items if self.many else items[0]
+            observe_serializer(type(self).__name__ + ('[]' if self.many else ''),
+                               time.perf_counter() - started)
+        return self._data
+
+
+class DirectorValuesSerializer(ValuesSerializer):
+    """Same output as ``DirectorSerializer``."""
+    model = Director
+    plan = {
+        'id': (['id'], None),
+        'name': (['name'], None),
+    }
+    ordering_columns = ('id', 'name')
+
+
+class ReviewValuesSerializer(ValuesSerializer):
+    """Same output as ``ReviewSerializer``."""
+    model = Review
+    plan = {
+        'id': (['id'], None),
+        'text': (['text'], None),
+        'stars': (['stars'], None),
+    }
+    ordering_columns = ('id', 'stars')
+
+
+def movie_rating(row):
+    return average_rating(row['stars_sum'], [row[f'stars_{stars}'] for stars in STARS])
+
+
+class MovieValuesSerializer(ValuesSerializer):
+    """Same output as ``MovieSerializer``, including ``?fields=`` / ``?view=summary``.
+
+    The reviews of all the rows are loaded with one extra query, like the
+    ``prefetch_related`` of ``Movie.objects.with_related()``.
+    """
+    model = Movie
+    review_fields = tuple(ReviewValuesSerializer.plan)
+    plan = {
+        'id': (['id'], None),
+        'title': (['title'], None),
+        'description': (['description'], None),
+        'duration': (['duration'], nullable(float, 'duration')),
+        'director': (['director_id', 'director__name'],
+                     lambda row: {'id': row['director_id'], 'name': row['director__name']}),
+        'reviews': ([], itemgetter('reviews')),
+        'director_name': (['director__name'], None),
+        'rating': (['stars_sum'] + [f'stars_{stars}' for stars in STARS], movie_rating),
+        'reviews_count': (['reviews_count'], None),
+    }
+    ordering_columns = ('id', 'title', 'duration')
+
+    def prepare(self, rows):
+        if 'reviews' not in self.fields or not rows:
+            return
+        by_movie = {row['id']: [] for row in rows}
+        reviews = (Review.objects.filter(movie_id__in=by_movie).order_by('id')
+                   .values('movie_id', *self.review_fields))
+        getters = ReviewValuesSerializer.compile(self.review_fields)
+        for review in reviews:
+            by_movie[review['movie_id']].append({name: get(review) for name, get in getters})
+        for row in rows:
+            row['reviews'] = by_movie[row['id']]
+
+
+class DirectorFilmographyValuesSerializer(ValuesSerializer):
+    """Same output as ``DirectorFilmographySerializer``.
+
+    The aggregates come from ``Director.objects.with_filmography()``; the
+    movies of all the rows, when requested, are loaded with one extra query.
+    """
+    model = Director
+    movie_fields = ('id', 'title', 'duration', 'rating')
+    plan = {
+        'id': (['id'], None),
+        'name': (['name'], None),
+        'movies_count': (['movies_count'], None),
+        'total_duration': (['total_duration'], lambda row: float(row['total_duration'])),
+        'rating': (['movies_stars_sum', 'movies_rated'],
+                   lambda row: average_rating(row['movies_stars_sum'], [row['movies_rated']])),
+        'movies': ([], itemgetter('movies')),
+    }
+    ordering_columns = ('id', 'name')
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None):
+        return super().setup_queryset(queryset.with_filmography(), fields)
+
+    def prepare(self, rows):
+        if 'movies' not in self.fields or not rows:
+            return
+        by_director = {row['id']: [] for row in rows}
+        movies = (Movie.objects.filter(director_id__in=by_director).order_by('id')
+                  .values('director_id', *MovieValuesSerializer.columns(self.movie_fields)))
+        getters = MovieValuesSerializer.compile(self.movie_fields)
+        for movie in movies:
+            by_director[movie['director_id']].append({name: get(movie) for name, get in getters})
+        for row in rows:
+            row['movies'] = by_director[row['id']]
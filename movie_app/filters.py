@@ -0,0 +1,87 @@
+"""Query parameter filters for the list endpoints.
+
+Each filter serializer validates ``request.query_params`` like the
+``*ValidateSerializer`` classes validate bodies; ``lookups`` maps a
+parameter to the queryset lookup it applies. The lookups line up with
+the indexes declared on the models.
+"""
+from rest_framework import serializers
+
+# Highest code point, ``title < prefix + PREFIX_END`` bounds a prefix range.
+PREFIX_END = '\U0010ffff'
+
+
+class FilterSerializer(serializers.Serializer):
+    lookups = {}
+    ordering_fields = ('id', '-id')
+
+    def filter_queryset(self, queryset):
+        self.is_valid(raise_exception=True)
+        for name, value in self.validated_data.items():
+            if name in self.lookups:
+                queryset = queryset.filter(**{self.lookups[name]: value})
+            else:
+                queryset = getattr(self, f'filter_{name}')(queryset, value)
+        return queryset
+
+
+class DirectorFilterSerializer(FilterSerializer):
+    name = serializers.CharField(required=False)
+    ordering_fields = ('id', '-id', 'name', '-name')
+
+    def filter_name(self, queryset, prefix):
+        return queryset.filter(name__gte=prefix, name__lt=prefix + PREFIX_END)
+
+
+class MovieFilterSerializer(FilterSerializer):
+    director_id = serializers.IntegerField(required=False)
+    duration_min = serializers.FloatField(required=False)
+    duration_max = serializers.FloatField(required=False)
+    title = serializers.CharField(required=False)
+    lookups = {
+        'director_id': 'director_id',
+        'duration_min': 'duration__gte',
+        'duration_max': 'duration__lte',
+    }
+    ordering_fields = ('id', '-id', 'title', '-title', 'duration', '-duration')
+
+    def filter_title(self, queryset, prefix):
+        # A range instead of LIKE 'prefix%', so the title indexes can be used.
+        return queryset.filter(title__gte=prefix, title__lt=prefix + PREFIX_END)
+
+
+class ReviewFilterSerializer(FilterSerializer):
+    movie_id = serializers.IntegerField(required=False)
+    stars = serializers.IntegerField(required=False, min_value=1, max_value=5)
+    stars_min = serializers.IntegerField(required=False, min_value=1, max_value=5)
+    lookups = {
+        'movie_id': 'movie_id',
+        'stars': 'stars',
+        'stars_min': 'stars__gte',
+    }
+    ordering_fields = ('id', '-id', 'stars', '-stars')
+
+
+class LeaderboardFilterSerializer(serializers.Serializer):
+    """``?limit=`` and, for the trending leaderboard, ``?days=``."""
+    limit = serializers.IntegerField(required=False, default=10, min_value=1)
+    days = serializers.IntegerField(required=False, default=7, min_value=1)
+
+    def __init__(self, *args, max_limit=100, max_days=30, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_limit = max_limit
+        self.max_days = max_days
+
+    def validate_limit(self, limit):
+        if limit > self.max_limit:
+            raise serializers.ValidationError(f'Ensure this value is less than or equal to {self.max_limit}.')
+        return limit
+
+    def validate_days(self, days):
+        if days > self.max_days:
+            raise serializers.ValidationError(f'Ensure this value is less than or equal to {self.max_days}.')
+        return days
+
+
+def filter_queryset(request, queryset, filter_serializer_class):
+    return filter_serializer_class(data=request.query_params).filter_queryset(queryset)
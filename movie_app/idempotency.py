@@ -0,0 +1,136 @@
+"""Safe retries of ``POST`` requests through an ``Idempotency-Key`` header.
+
+The first request with a key stores a marker row (committed right away),
+then runs the view and stores its response in the same transaction as the
+rows the view wrote. A retry with the same key gets the stored response
+back (``Idempotent-Replayed: true``) instead of creating a duplicate; a
+retry that arrives while the first request is still running gets ``409
+Conflict``. Reusing a key for another path or body is ``422``.
+
+Keys are scoped to the user, or to the client address of anonymous
+requests, and remembered for ``TTL`` seconds. Responses raised as
+exceptions or with a 5xx status are not stored: the marker is dropped and
+the request can be retried.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from movie_app.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def idempotency_settings():
+    return {
+        'TTL': 86400,
+        'PROCESSING_TIMEOUT': 60,
+        **getattr(settings, 'IDEMPOTENCY', {}),
+    }
+
+
+class RequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed, retry later.'
+    default_code = 'request_in_progress'
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def request_owner(request):
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return BaseThrottle().get_ident(request)
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.path}|{body}'.encode()).hexdigest()
+
+
+def claim(record, path, fingerprint):
+    """Take over an expired or abandoned key; False when another request got it first."""
+    return IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+        path=path, fingerprint=fingerprint, status_code=None, response=None,
+        created_at=timezone.now()) == 1
+
+
+def idempotent_response(request, get_response):
+    key = request.headers.get(HEADER)
+    if request.method != 'POST' or key is None:
+        return get_response()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValidationError({HEADER: [f'Expected 1 to {MAX_KEY_LENGTH} characters.']})
+
+    options = idempotency_settings()
+    fingerprint = request_fingerprint(request)
+    with transaction.atomic():
+        record, created = IdempotencyKey.objects.get_or_create(
+            owner=request_owner(request), key=key,
+            defaults={'path': request.path, 'fingerprint': fingerprint},
+        )
+    if not created:
+        age = timezone.now() - record.created_at
+        expired = age > timedelta(seconds=options['TTL'])
+        abandoned = record.status_code is None and age > timedelta(seconds=options['PROCESSING_TIMEOUT'])
+        if expired or abandoned:
+            if not claim(record, request.path, fingerprint):
+                raise RequestInProgress()
+        elif record.status_code is None:
+            raise RequestInProgress()
+        elif record.fingerprint != fingerprint:
+            raise KeyReused()
+        else:
+            return Response(data=record.response, status=record.status_code,
+                            headers={'Idempotent-Replayed': 'true'})
+
+    try:
+        with transaction.atomic():
+            response = get_response()
+            if response.status_code < 500:
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status_code=response.status_code, response=getattr(response, 'data', None))
+    except BaseException:
+        record.delete()
+        raise
+    if response.status_code >= 500:
+        record.delete()
+    return response
+
+
+def purge_expired(batch_size=1000):
+    """Delete the keys older than ``TTL`` in batches; return how many were deleted."""
+    cutoff = timezone.now() - timedelta(seconds=idempotency_settings()['TTL'])
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(created_at__lt=cutoff)
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+def idempotent(view):
+    """Decorator for function views, to be put under ``@api_view``.
+
+    Generic views wrap their ``create`` in ``idempotent_response``.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return idempotent_response(request, lambda: view(request, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,88 @@
+import json
+import platform
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from movie_app.benchmark import benchmark_routes, compare, seed_catalog
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database, time every API route (function views and their _cbv '
+            'variants) and write latency percentiles, queries and peak memory per route as JSON. '
+            'With --compare, fail when a route regressed against an earlier run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directors', type=int, default=50)
+        parser.add_argument('--movies', type=int, default=500)
+        parser.add_argument('--reviews', type=int, default=5000)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON file of an earlier run to check for regressions.')
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help='p50 latency ratio over the baseline that counts as a regression.')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Keep the response cache on (by default the views themselves are timed).')
+        parser.add_argument('--existing', action='store_true',
+                            help='Benchmark the configured database as is, without seeding a test one.')
+
+    def handle(self, *args, **options):
+        # Every route is hit many times from one client, throttling would answer 429s.
+        overrides = {'DEBUG': False, 'ALLOWED_HOSTS': ['testserver'], 'THROTTLING': {'ENABLED': False}}
+        if not options['with_cache']:
+            overrides['API_CACHE'] = {'ENABLED': False}
+
+        old_config = None
+        if not options['existing']:
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            with override_settings(**overrides):
+                catalog = {}
+                if not options['existing']:
+                    catalog = seed_catalog(options['directors'], options['movies'], options['reviews'])
+                routes = benchmark_routes(options['iterations'], options['warmup'])
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': int(time.time()),
+                'python': platform.python_version(),
+                'database': settings.DATABASES['default']['ENGINE'],
+                'iterations': options['iterations'],
+                'catalog': catalog,
+            },
+            'routes': routes,
+        }
+        for key, stats in routes.items():
+            self.stdout.write(
+                f'{key:<52} {stats["status"]}  p50 {stats["p50_ms"]:>8} ms  p95 {stats["p95_ms"]:>8} ms  '
+                f'{stats["queries"]:>3} queries  {stats["peak_memory_kb"]:>9} KiB'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}.')
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            regressions = compare(baseline['routes'], routes, options['threshold'])
+            if regressions:
+                raise CommandError('Regressions against {}:\n{}'.format(
+                    options['compare'], '\n'.join(regressions)))
+            self.stdout.write(self.style.SUCCESS('No regressions.'))
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, check=True, cwd=settings.BASE_DIR).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
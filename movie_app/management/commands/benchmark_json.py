@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from movie_app.benchmark import seed_catalog, time_json
+from movie_app.fast_serializers import MovieValuesSerializer
+from movie_app.models import Movie
+from movie_app.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and compare rendering and parsing the /api/v1/movies/ payload '
+            'with DRF\'s stdlib JSON renderer/parser against the orjson ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directors', type=int, default=200)
+        parser.add_argument('--movies', type=int, default=2000)
+        parser.add_argument('--reviews', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            seed_catalog(options['directors'], options['movies'], options['reviews'])
+            movies = MovieValuesSerializer(MovieValuesSerializer.setup_queryset(Movie.objects.order_by('id')),
+                                           many=True).data
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        payloads = {
+            f'one page ({KeysetPagination.max_page_size} movies)':
+                {'next': None, 'previous': None, 'results': movies[:KeysetPagination.max_page_size]},
+            f'whole catalog ({len(movies)} movies)': {'next': None, 'previous': None, 'results': movies},
+        }
+        results = {}
+        for name, payload in payloads.items():
+            results[name] = timings = time_json(payload, options['repeat'])
+            for action in ('render', 'parse'):
+                speedup = round(timings['json'][action] / timings['orjson'][action], 1)
+                self.stdout.write(f'{name:<30} {action:<6} json {timings["json"][action]:>8} s   '
+                                  f'orjson {timings["orjson"][action]:>8} s   x{speedup}')
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from movie_app.benchmark import seed_catalog, time_serializers
+from movie_app.fast_serializers import DirectorValuesSerializer, MovieValuesSerializer, \
+    ReviewValuesSerializer
+from movie_app.models import Director, Movie, Review
+from movie_app.serializers import DirectorSerializer, MovieSerializer, ReviewSerializer
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and compare rendering every movie, review and director '
+            'with the DRF serializers against the .values() based read serializers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directors', type=int, default=500)
+        parser.add_argument('--movies', type=int, default=10000)
+        parser.add_argument('--reviews', type=int, default=30000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            seed_catalog(options['directors'], options['movies'], options['reviews'])
+            cases = {
+                'movies': (
+                    lambda: MovieSerializer(Movie.objects.with_related(), many=True).data,
+                    lambda: MovieValuesSerializer(MovieValuesSerializer.setup_queryset(
+                        Movie.objects.all()), many=True).data,
+                ),
+                'movies (summary)': (
+                    lambda: MovieSerializer(MovieSerializer.setup_queryset(
+                        Movie.objects.all(), MovieSerializer.Meta.summary_fields), many=True,
+                        fields=MovieSerializer.Meta.summary_fields).data,
+                    lambda: MovieValuesSerializer(MovieValuesSerializer.setup_queryset(
+                        Movie.objects.all(), MovieSerializer.Meta.summary_fields), many=True,
+                        fields=MovieSerializer.Meta.summary_fields).data,
+                ),
+                'reviews': (
+                    lambda: ReviewSerializer(Review.objects.all(), many=True).data,
+                    lambda: ReviewValuesSerializer(ReviewValuesSerializer.setup_queryset(
+                        Review.objects.all()), many=True).data,
+                ),
+                'directors': (
+                    lambda: DirectorSerializer(Director.objects.all(), many=True).data,
+                    lambda: DirectorValuesSerializer(DirectorValuesSerializer.setup_queryset(
+                        Director.objects.all()), many=True).data,
+                ),
+            }
+            results = {}
+            for name, (drf, values) in cases.items():
+                timings = time_serializers([('drf', drf), ('values', values)], options['repeat'])
+                timings['speedup'] = round(timings['drf'] / timings['values'], 1)
+                results[name] = timings
+                self.stdout.write(f'{name:<18} DRF {timings["drf"]:>8} s   values {timings["values"]:>8} s'
+                                  f'   x{timings["speedup"]}')
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from movie_app.export import CHUNK_SIZE, EXPORTERS
+
+
+class Command(BaseCommand):
+    help = 'Stream all movies with their director and reviews as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORTERS), default='ndjson')
+        parser.add_argument('--output', help='File to write to, stdout by default.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        exporter, _ = EXPORTERS[options['format']]
+        lines = exporter(chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from movie_app.benchmark import load_async, load_sync
+
+# (sync endpoint served through WSGI, its native async counterpart served through ASGI)
+ROUTES = [
+    ('/api/v1/directors/', '/api/v1/async/directors/'),
+    ('/api/v1/movies/', '/api/v1/async/movies/'),
+]
+
+
+class Command(BaseCommand):
+    help = ('Load test the sync list views through the WSGI handler against the async views '
+            'through the ASGI handler, in process, and report requests/sec and latency percentiles.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        requests, concurrency = options['requests'], options['concurrency']
+        results = {}
+        # Measure the views themselves, not the response cache.
+        with override_settings(API_CACHE={'ENABLED': False}, ALLOWED_HOSTS=['testserver']):
+            for sync_url, async_url in ROUTES:
+                results[sync_url] = {'wsgi': load_sync(sync_url, requests, concurrency)}
+                results[async_url] = {'asgi': load_async(async_url, requests, concurrency)}
+        for url, modes in results.items():
+            for mode, stats in modes.items():
+                self.stdout.write(
+                    f'{mode} {url:<28} {stats["rps"]:>8} req/s  p50 {stats["p50_ms"]:>8} ms  '
+                    f'p99 {stats["p99_ms"]:>8} ms  errors {stats["errors"]}'
+                )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from movie_app.deletion import purge_deleted
+
+
+class Command(BaseCommand):
+    help = 'Delete the soft deleted directors and movies, with their reviews, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows deleted per statement.')
+        parser.add_argument('--older-than', type=float, default=0,
+                            help='Only purge rows deleted more than this many hours ago.')
+
+    def handle(self, *args, **options):
+        def progress(model, deleted, total):
+            self.stdout.write(f'{model._meta.label}: deleted {deleted} rows ({total} so far)')
+
+        before = timezone.now() - timedelta(hours=options['older_than'])
+        counts = purge_deleted(before, batch_size=options['batch_size'], progress=progress)
+        summary = ', '.join(f'{total} {label}' for label, total in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Purged {summary}.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from movie_app.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete the Idempotency-Key responses older than IDEMPOTENCY["TTL"].'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows deleted per query.')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} idempotency keys.'))
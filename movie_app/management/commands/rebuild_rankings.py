@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from movie_app.rankings import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the leaderboard tables (Bayesian ranking and daily review counts) of every movie.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows inserted per query.')
+
+    def handle(self, *args, **options):
+        ranked = refresh_rankings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Ranked {ranked} movies.'))
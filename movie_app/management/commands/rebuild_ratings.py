@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from movie_app.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized rating aggregates of every movie from its reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of movies recomputed per query.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total, last_id = 0, 0
+        while True:
+            ids = list(Movie.objects.filter(id__gt=last_id).order_by('id')
+                       .values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            total += Movie.objects.filter(id__in=ids).refresh_ratings()
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings of {total} movies.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from movie_app.models import Movie, Review
+from movie_app.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of movies and reviews.'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        for model in (Movie, Review):
+            count = backend.rebuild(model)
+            self.stdout.write(f'Indexed {count} {model._meta.verbose_name_plural}.')
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
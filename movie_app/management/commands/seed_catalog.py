@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from movie_app.benchmark import seed_catalog
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert a synthetic catalog of directors, movies and reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directors', type=int, default=100)
+        parser.add_argument('--movies', type=int, default=1000)
+        parser.add_argument('--reviews', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, same seed same catalog.')
+
+    def handle(self, *args, **options):
+        counts = seed_catalog(options['directors'], options['movies'], options['reviews'],
+                              batch_size=options['batch_size'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            'Catalog has {directors} directors, {movies} movies and {reviews} reviews.'.format(**counts)
+        ))
@@ -0,0 +1,242 @@
+"""Per-route request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and records, labelled by the
+route template (``api/v1/movies/<int:movie_id>/``, not the raw path):
+
+* request latency and response size histograms,
+* the number of SQL queries and the time spent in them,
+
+and ``TimedSerializerMixin`` records how long each serializer takes to
+render ``.data``. ``metrics_view`` serves the lot at ``/metrics``.
+
+A staff user can profile a single request by sending ``X-Profile: 1``:
+the view runs under ``cProfile`` and the response carries an
+``X-Profile-Id`` header; the report is kept in memory (last
+``PROFILES_KEPT``) and served to staff at ``/metrics/profiles/<id>/``.
+
+Queries are counted on the request thread: those of a streaming response
+(issued while it is sent) or of an async view running under ASGI (issued
+from the ORM's worker thread) are not included.
+
+Metrics live in the memory of each worker process, so every worker has to
+be scraped (or run a single process behind the scraper).
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRICS = {
+    # name: (type, help, histogram buckets)
+    'afisha_http_requests_total': ('counter', 'HTTP requests served.', None),
+    'afisha_http_request_duration_seconds': ('histogram', 'Time spent serving a request.', LATENCY_BUCKETS),
+    'afisha_http_response_size_bytes': ('histogram', 'Size of the response body.', SIZE_BUCKETS),
+    'afisha_db_queries_per_request': ('histogram', 'SQL queries issued by one request.', QUERY_BUCKETS),
+    'afisha_db_query_duration_seconds_total': ('counter', 'Time spent executing SQL queries.', None),
+    'afisha_serializer_duration_seconds': ('histogram', 'Time spent rendering serializer data.',
+                                           LATENCY_BUCKETS),
+}
+
+
+def metrics_settings():
+    return {
+        'ENABLED': True,
+        'ALLOWED_IPS': ['127.0.0.1', '::1'],
+        'PROFILE_HEADER': 'X-Profile',
+        'PROFILES_KEPT': 20,
+        'PROFILE_LINES': 40,
+        'QUERY_COUNT_HEADER': 'X-DjangoQueryCount-Count',
+        **getattr(settings, 'METRICS', {}),
+    }
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)    # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+class MetricsRegistry:
+    """Thread safe store of counters and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = defaultdict(dict)
+            self.profiles = OrderedDict()
+
+    def inc(self, name, labels, value=1):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            samples = self.samples[name]
+            samples[labels] = samples.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            samples = self.samples[name]
+            if labels not in samples:
+                samples[labels] = Histogram(METRICS[name][2])
+            samples[labels].observe(value)
+
+    def add_profile(self, report, kept):
+        profile_id = uuid.uuid4().hex
+        with self.lock:
+            self.profiles[profile_id] = report
+            while len(self.profiles) > kept:
+                self.profiles.popitem(last=False)
+        return profile_id
+
+    def get_profile(self, profile_id):
+        with self.lock:
+            return self.profiles.get(profile_id)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, _) in METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, sample in sorted(self.samples.get(name, {}).items()):
+                    if kind == 'counter':
+                        lines.append(f'{name}{{{format_labels(labels)}}} {sample}')
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(sample.buckets + ('+Inf',), sample.counts):
+                        cumulative += bucket_count
+                        bucket_labels = format_labels(labels + (('le', bound),))
+                        lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+                    lines.append(f'{name}_sum{{{format_labels(labels)}}} {sample.sum}')
+                    lines.append(f'{name}_count{{{format_labels(labels)}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def observe_serializer(name, seconds):
+    if metrics_settings()['ENABLED']:
+        registry.observe('afisha_serializer_duration_seconds', {'serializer': name}, seconds)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that counts the queries of a request and times them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def is_staff(request):
+    """Authenticate like the API does (token or session) before the view runs."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        try:
+            user = Request(request, authenticators=authenticators).user
+        except APIException:
+            return False
+    return bool(user and user.is_staff)
+
+
+def profile_report(profiler, lines):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(lines)
+    return stream.getvalue()
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = metrics_settings()
+        if not options['ENABLED']:
+            return self.get_response(request)
+
+        profiler = None
+        if request.headers.get(options['PROFILE_HEADER']) and is_staff(request):
+            profiler = cProfile.Profile()
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        duration = time.perf_counter() - started
+
+        labels = {'method': request.method, 'route': route_of(request)}
+        registry.inc('afisha_http_requests_total', {**labels, 'status': response.status_code})
+        registry.observe('afisha_http_request_duration_seconds', labels, duration)
+        registry.observe('afisha_db_queries_per_request', labels, recorder.count)
+        registry.inc('afisha_db_query_duration_seconds_total', labels, recorder.duration)
+        if response.streaming:
+            response.streaming_content = self.count_bytes(response.streaming_content, labels)
+        else:
+            registry.observe('afisha_http_response_size_bytes', labels, len(response.content))
+
+        if settings.DEBUG:
+            response[options['QUERY_COUNT_HEADER']] = recorder.count
+        if profiler is not None:
+            report = profile_report(profiler, options['PROFILE_LINES'])
+            response['X-Profile-Id'] = registry.add_profile(report, options['PROFILES_KEPT'])
+        return response
+
+    @staticmethod
+    def count_bytes(content, labels):
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.observe('afisha_http_response_size_bytes', labels, size)
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:19
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_rating_aggregate(apps, schema_editor):
+    Movie = apps.get_model('movie_app', 'Movie')
+    Review = apps.get_model('movie_app', 'Review')
+    aggregates = {'reviews_count': Count('id'), 'stars_sum': Sum('stars', default=0)}
+    for stars in range(1, 6):
+        aggregates[f'stars_{stars}'] = Count('id', filter=Q(stars=stars))
+    for row in Review.objects.values('movie_id').annotate(**aggregates):
+        Movie.objects.filter(id=row.pop('movie_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_app', '0003_review_stars'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_aggregate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+TABLES = {
+    'movie_app_movie_fts': ('movie_app_movie', ('title', 'description')),
+    'movie_app_review_fts': ('movie_app_review', ('text',)),
+}
+
+
+def create_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (source, columns) in TABLES.items():
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {table} USING fts5({", ".join(columns)}, '
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {table} (rowid, {", ".join(columns)}) '
+            f'SELECT id, {", ".join(columns)} FROM {source}'
+        )
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_app', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_app', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='director',
+            index=models.Index(fields=['name'], name='movie_director_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['director', 'title'], name='movie_movie_director_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['title'], name='movie_movie_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['duration'], name='movie_movie_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', 'stars'], name='movie_review_movie_stars_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['stars'], name='movie_review_stars_idx'),
+        ),
+    ]
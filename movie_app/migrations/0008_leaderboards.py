@@ -0,0 +1,66 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_created_at(apps, schema_editor):
+    # The closest known date of the existing reviews.
+    Review = apps.get_model('movie_app', 'Review')
+    Review.objects.update(created_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_app', '0007_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieRanking',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='movie_app.movie')),
+                ('reviews_count', models.PositiveIntegerField()),
+                ('rating', models.FloatField()),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieReviewDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('reviews', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(fill_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at'], name='movie_review_created_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='moviereviewday',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movie_app.movie'),
+        ),
+        migrations.AddIndex(
+            model_name='movieranking',
+            index=models.Index(fields=['-score', 'movie'], name='movie_ranking_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='moviereviewday',
+            index=models.Index(fields=['day', 'movie', 'reviews'], name='movie_review_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='moviereviewday',
+            constraint=models.UniqueConstraint(fields=('movie', 'day'), name='movie_review_day_unique'),
+        ),
+    ]
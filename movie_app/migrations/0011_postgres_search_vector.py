@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# Text search configuration, PostgresSearchBackend.config must be the same.
+CONFIG = 'english'
+
+TABLES = {
+    'movie_app_movie': ('title', 'description'),
+    'movie_app_review': ('text',),
+}
+
+
+def add_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, columns in TABLES.items():
+        document = " || ' ' || ".join(f"coalesce({column}, '')" for column in columns)
+        # A generated column is kept up to date by Postgres on every write.
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD COLUMN search_vector tsvector '
+            f"GENERATED ALWAYS AS (to_tsvector('{CONFIG}'::regconfig, {document})) STORED"
+        )
+        schema_editor.execute(f'CREATE INDEX {table}_search_vector ON {table} USING gin (search_vector)')
+
+
+def drop_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movie_app', '0010_soft_delete'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vectors, drop_search_vectors),
+    ]
@@ -1,8 +1,98 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+STARS = (1, 2, 3, 4, 5)
+
+
+def average_rating(stars_sum, counts):
+    """Mean of the stars given, ``counts`` being the number of reviews per star."""
+    rated = sum(counts)
+    if not rated:
+        return None
+    return round(stars_sum / rated, 2)
+
+
+class MovieQuerySet(models.QuerySet):
+    def with_related(self):
+        """Everything ``MovieSerializer`` touches, in two queries for any number of movies."""
+        return self.select_related('director').prefetch_related(reviews_prefetch())
+
+    def refresh_ratings(self):
+        """Recompute the denormalized rating columns from the ``Review`` rows.
+
+        The movies are locked before the reviews are counted, so two recounts
+        of a movie (concurrent review writes) cannot write back counts in the
+        wrong order.
+        """
+        aggregates = {'reviews_count': Count('id'), 'stars_sum': Sum('stars', default=0)}
+        for stars in STARS:
+            aggregates[f'stars_{stars}'] = Count('id', filter=Q(stars=stars))
+        with transaction.atomic():
+            movies = list(self.select_for_update().order_by('id').only('id'))
+            rows = Review.objects.filter(movie__in=self.values('id')).values('movie_id').annotate(**aggregates)
+            rows = {row.pop('movie_id'): row for row in rows}
+            empty = dict.fromkeys(aggregates, 0)
+            now = timezone.now()
+            for movie in movies:
+                for field, value in rows.get(movie.id, empty).items():
+                    setattr(movie, field, value)
+                movie.updated_at = now
+            self.model.objects.bulk_update(movies, [*aggregates, 'updated_at'], batch_size=500)
+        return len(movies)
+
+
+class SoftDeleteManager(models.Manager):
+    """Hides the rows marked with ``deleted_at``, see ``movie_app.deletion``."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+def deleted_index(model):
+    # Only the marked rows, which the purge looks up, are in the index.
+    return models.Index(fields=['deleted_at'], condition=Q(deleted_at__isnull=False),
+                        name=f'movie_{model}_deleted_at_idx')
+
+
+class DirectorQuerySet(models.QuerySet):
+    def with_filmography(self):
+        """Annotate ``movies_count``, ``total_duration`` and the stars given to the movies.
+
+        Every aggregate is a correlated subquery on ``Movie`` (using the
+        denormalized rating columns, not the reviews), so a page of
+        directors stays a single statement.
+        """
+        movies = Movie.objects.filter(director=OuterRef('pk')).order_by().values('director')
+
+        def aggregate(expression):
+            return Subquery(movies.annotate(value=expression).values('value'))
+
+        rated = sum((F(f'stars_{stars}') for stars in STARS[1:]), F('stars_1'))
+        return self.annotate(
+            movies_count=Coalesce(aggregate(Count('id')), 0),
+            total_duration=Coalesce(aggregate(Sum('duration')), 0.0),
+            movies_stars_sum=Coalesce(aggregate(Sum('stars_sum')), 0),
+            movies_rated=Coalesce(aggregate(Sum(rated)), 0),
+        )
 
 
 class Director(models.Model):
     name = models.CharField(max_length=150)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = SoftDeleteManager.from_queryset(DirectorQuerySet)()
+    all_objects = DirectorQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='movie_director_name_idx'),
+            deleted_index('director'),
+        ]
 
     def __str__(self):
         return self.name
@@ -13,10 +103,49 @@ class Movie(models.Model):
     description = models.TextField()
     duration = models.FloatField(default=0)
     director = models.ForeignKey(Director, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Incremented by every write of the API, part of the ETag checked by If-Match.
+    version = models.PositiveIntegerField(default=1)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    # Denormalized rating aggregate, kept up to date by ``movie_app.signals``.
+    reviews_count = models.PositiveIntegerField(default=0)
+    stars_sum = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    objects = SoftDeleteManager.from_queryset(MovieQuerySet)()
+    all_objects = MovieQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['director', 'title'], name='movie_movie_director_title_idx'),
+            models.Index(fields=['title'], name='movie_movie_title_idx'),
+            models.Index(fields=['duration'], name='movie_movie_duration_idx'),
+            deleted_index('movie'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The director's filmography changes when a movie moves to another one.
+        instance._loaded_director_id = instance.__dict__.get('director_id')
+        return instance
+
+    @property
+    def stars_histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in STARS}
+
+    @property
+    def rating(self):
+        return average_rating(self.stars_sum, self.stars_histogram.values())
+
     @property
     def director_name(self):
         try:
@@ -38,6 +167,88 @@ class Review(models.Model):
         ),
         null=True
     )
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    version = models.PositiveIntegerField(default=1)
+    # Set with the movie's, reviews are not soft deleted on their own.
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['movie', 'stars'], name='movie_review_movie_stars_idx'),
+            models.Index(fields=['created_at'], name='movie_review_created_at_idx'),
+            models.Index(fields=['stars'], name='movie_review_stars_idx'),
+            deleted_index('review'),
+        ]
 
     def __str__(self):
         return self.movie.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so that signals can apply the difference.
+        instance._loaded_rating = (instance.__dict__.get('movie_id'), instance.__dict__.get('stars'))
+        return instance
+
+
+class MovieRanking(models.Model):
+    """Materialized leaderboard row of a rated movie, see ``movie_app.rankings``."""
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    reviews_count = models.PositiveIntegerField()
+    rating = models.FloatField()
+    # Bayesian average: the rating pulled towards the catalog mean while reviews are few.
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', 'movie'], name='movie_ranking_score_idx'),
+        ]
+
+
+class MovieReviewDay(models.Model):
+    """Number of reviews a movie got on a day, for the trending leaderboard."""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    reviews = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'day'], name='movie_review_day_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'movie', 'reviews'], name='movie_review_day_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Response of a POST sent with an ``Idempotency-Key`` header, see ``movie_app.idempotency``."""
+    key = models.CharField(max_length=255)
+    # The user id, or the client address for anonymous requests.
+    owner = models.CharField(max_length=64)
+    path = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is being processed.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'key'], name='movie_idempotency_key_unique'),
+        ]
+
+
+def movies_prefetch():
+    """The filmography of a director, oldest first, with what ``CompactMovieSerializer`` reads."""
+    columns = ['id', 'director_id', 'title', 'duration', 'stars_sum'] + [f'stars_{stars}' for stars in STARS]
+    return Prefetch('movie_set', queryset=Movie.objects.order_by('id').only(*columns))
+
+
+def reviews_prefetch():
+    """The reviews of a movie in a stable order, oldest first."""
+    return Prefetch('reviews', queryset=Review.objects.order_by('id'))
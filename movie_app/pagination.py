@@ -0,0 +1,148 @@
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor (keyset) pagination for the list endpoints.
+
+    Pages are fetched with ``WHERE id > <last id> ORDER BY id LIMIT n``
+    instead of ``COUNT(*)`` + ``OFFSET``, so every page costs the same
+    no matter how deep the client goes. ``?ordering=-id`` returns the
+    newest rows first, ``?page_size=`` is capped by ``max_page_size``.
+    Views can allow more orderings with an ``ordering_fields`` attribute.
+
+    Other orderings are not unique, so ``id`` breaks their ties and the
+    cursor holds both values: ``WHERE title > %s OR (title = %s AND id > %s)
+    ORDER BY title, id``. DRF's cursors only hold the first field and skip
+    the rows sharing it with an offset, capped by ``offset_cutoff``, so
+    pages would repeat forever once more rows than that tie.
+
+    NULLs of a nullable field sort after every value (``NULLS LAST``, the
+    Postgres default, so its indexes still serve the order) and are kept
+    as ``null`` in the cursor.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+    ordering_query_param = 'ordering'
+    ordering_fields = ('id', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param)
+        if not ordering:
+            return self.with_tiebreaker(self.ordering)
+        ordering_fields = getattr(view, 'ordering_fields', self.ordering_fields)
+        if ordering not in ordering_fields:
+            raise ValidationError({self.ordering_query_param: [
+                'Unsupported ordering. Choose one of: ' + ', '.join(ordering_fields)
+            ]})
+        return self.with_tiebreaker(ordering)
+
+    @staticmethod
+    def with_tiebreaker(ordering):
+        if ordering.lstrip('-') == 'id':
+            return (ordering,)
+        return ordering, '-id' if ordering.startswith('-') else 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # CursorPagination.paginate_queryset, filtering on (field, id) positions.
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = self.cursor or (0, False, None)
+
+        self.field = self.get_field(queryset, self.ordering[0].lstrip('-'))
+        self.pk_field = queryset.model._meta.pk
+        queryset = queryset.order_by(*self.order_by(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            # Test for: (cursor reversed) XOR (queryset reversed)
+            backwards = reverse != self.ordering[0].startswith('-')
+            queryset = queryset.filter(self.after(current_position, 'lt' if backwards else 'gt'))
+
+        # One extra row tells whether there is a following page.
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position, self.previous_position = following_position, current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    @staticmethod
+    def get_field(queryset, name):
+        """The model field or the annotation (``search_rank``) ``name`` orders on."""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def order_by(self, ordering):
+        if not self.field.null:
+            return ordering
+        field, tiebreaker = ordering
+        if field.startswith('-'):
+            return F(field[1:]).desc(nulls_first=True), tiebreaker
+        return F(field).asc(nulls_last=True), tiebreaker
+
+    def after(self, position, lookup):
+        """Rows after ``position`` in the page order, ``lookup`` is ``'gt'`` or ``'lt'``."""
+        field = self.ordering[0].lstrip('-')
+        try:
+            if len(self.ordering) == 1:
+                return Q(**{f'{field}__{lookup}': self.field.to_python(position)})
+            value, pk = json.loads(position)
+            # A cursor is client input: values the columns cannot hold are a bad cursor, not a 500.
+            value = None if value is None else self.field.to_python(value)
+            pk = self.pk_field.to_python(pk)
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        same = {f'{field}__isnull': True} if value is None else {field: value}
+        ties = Q(**same, **{f'id__{lookup}': pk})
+        if value is None:
+            # NULLs come last: nothing follows them but NULLs, all values precede them.
+            return ties if lookup == 'gt' else ties | Q(**{f'{field}__isnull': False})
+        following = Q(**{f'{field}__{lookup}': value}) | ties
+        if self.field.null and lookup == 'gt':
+            following |= Q(**{f'{field}__isnull': True})
+        return following
+
+    def _get_position_from_instance(self, instance, ordering):
+        if len(ordering) == 1:
+            return super()._get_position_from_instance(instance, ordering)
+        name = ordering[0].lstrip('-')
+        value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+        # str() like CursorPagination, but None stays null instead of becoming 'None'.
+        return json.dumps([None if value is None else str(value),
+                           super()._get_position_from_instance(instance, ordering[1:])])
+
+
+def paginate(request, queryset, serializer_class, ordering=None, ordering_fields=None,
+             **serializer_kwargs):
+    """Return a paginated ``Response`` for function based list views."""
+    paginator = KeysetPagination()
+    if ordering is not None:
+        paginator.ordering = ordering
+    if ordering_fields is not None:
+        paginator.ordering_fields = ordering_fields
+    page = paginator.paginate_queryset(queryset, request)
+    data = serializer_class(instance=page, many=True, **serializer_kwargs).data
+    return paginator.get_paginated_response(data)
@@ -0,0 +1,101 @@
+"""Leaderboards served from materialized tables.
+
+* ``MovieRanking`` holds one row per rated movie with its Bayesian score
+  ``(PRIOR_WEIGHT * PRIOR_MEAN + stars given) / (PRIOR_WEIGHT + ratings)``:
+  a movie with a handful of five star reviews does not outrank one with
+  hundreds of good ones. The top N is a read of the ``-score`` index.
+* ``MovieReviewDay`` counts the reviews of a movie per day for the last
+  ``TRENDING_DAYS`` days; the most reviewed movies of a window add up
+  those buckets instead of the reviews.
+
+The ``refresh_ratings`` job refreshes the rows of the movies whose
+reviews changed (``refresh_rankings(movie_ids)``). ``manage.py
+rebuild_rankings`` recomputes every row and drops the buckets that left
+the window; run it periodically (e.g. daily). With ``PRIOR_MEAN = None``
+the prior is the mean star of the whole catalog at the time a row is
+refreshed, so scores are only comparable right after a rebuild.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from movie_app.models import STARS, Movie, MovieRanking, MovieReviewDay, Review
+
+
+def leaderboard_settings():
+    return {
+        'PRIOR_WEIGHT': 10,
+        'PRIOR_MEAN': 3.0,
+        'MIN_REVIEWS': 1,
+        'MAX_LIMIT': 100,
+        'TRENDING_DAYS': 30,
+        **getattr(settings, 'LEADERBOARD', {}),
+    }
+
+
+def rated_count():
+    """Reviews of a movie that gave stars, from the denormalized histogram."""
+    return sum((F(f'stars_{stars}') for stars in STARS[1:]), F('stars_1'))
+
+
+def catalog_mean():
+    totals = Movie.objects.aggregate(stars=Sum('stars_sum'), rated=Sum(rated_count()))
+    return totals['stars'] / totals['rated'] if totals['rated'] else 0.0
+
+
+def bayesian_score(stars_sum, rated, mean, weight):
+    return (weight * mean + stars_sum) / (weight + rated)
+
+
+def refresh_rankings(movie_ids=None, batch_size=1000):
+    """Recompute the ranking rows and review buckets of ``movie_ids``, or of every movie."""
+    options = leaderboard_settings()
+    mean = options['PRIOR_MEAN'] if options['PRIOR_MEAN'] is not None else catalog_mean()
+    movies = Movie.objects.all() if movie_ids is None else Movie.objects.filter(id__in=movie_ids)
+    rows = (movies.annotate(rated=rated_count()).filter(rated__gte=options['MIN_REVIEWS'])
+            .values_list('id', 'reviews_count', 'stars_sum', 'rated'))
+    rankings = [
+        MovieRanking(movie_id=movie_id, reviews_count=reviews_count,
+                     rating=round(stars_sum / rated, 2),
+                     score=bayesian_score(stars_sum, rated, mean, options['PRIOR_WEIGHT']))
+        for movie_id, reviews_count, stars_sum, rated in rows.iterator(chunk_size=batch_size)
+    ]
+
+    since = timezone.localdate() - timedelta(days=options['TRENDING_DAYS'] - 1)
+    since = timezone.make_aware(datetime.combine(since, time.min))
+    reviews = Review.objects.all() if movie_ids is None else Review.objects.filter(movie_id__in=movie_ids)
+    days = (reviews.filter(created_at__gte=since).annotate(day=TruncDate('created_at'))
+            .values('movie_id', 'day').annotate(reviews=Count('id')).order_by())
+    buckets = [MovieReviewDay(**row) for row in days.iterator(chunk_size=batch_size)]
+
+    with transaction.atomic():
+        for model in (MovieRanking, MovieReviewDay):
+            stale = model.objects.all() if movie_ids is None else model.objects.filter(movie_id__in=movie_ids)
+            stale.delete()
+        MovieRanking.objects.bulk_create(rankings, batch_size=batch_size)
+        MovieReviewDay.objects.bulk_create(buckets, batch_size=batch_size)
+    return len(rankings)
+
+
+def top_rated(limit):
+    rows = (MovieRanking.objects.order_by('-score', 'movie_id')
+            .values('movie_id', 'movie__title', 'rating', 'reviews_count', 'score')[:limit])
+    return [
+        {'rank': rank, 'id': row['movie_id'], 'title': row['movie__title'], 'rating': row['rating'],
+         'reviews_count': row['reviews_count'], 'score': round(row['score'], 4)}
+        for rank, row in enumerate(rows, 1)
+    ]
+
+
+def trending(days, limit):
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = (MovieReviewDay.objects.filter(day__gte=since).values('movie_id', 'movie__title')
+            .annotate(reviews=Sum('reviews')).order_by('-reviews', 'movie_id')[:limit])
+    return [
+        {'rank': rank, 'id': row['movie_id'], 'title': row['movie__title'], 'reviews': row['reviews']}
+        for rank, row in enumerate(rows, 1)
+    ]
@@ -0,0 +1,132 @@
+"""Full-text search over ``Movie.title``, ``Movie.description`` and ``Review.text``.
+
+The backend is picked from ``settings.MOVIE_SEARCH['BACKEND']`` or, when
+that is empty, from the database vendor:
+
+* ``SqliteFTSBackend`` keeps FTS5 tables (created by migration 0006) in
+  sync from ``movie_app.signals`` and ranks matches with ``bm25``.
+* ``PostgresSearchBackend`` matches against ``search_vector``, a
+  ``tsvector`` column generated by Postgres on every write and indexed
+  with GIN (migration 0011), and ranks with ``ts_rank``; nothing has to
+  be kept in sync from Python.
+
+Both annotate ``search_rank`` where lower means more relevant, so list
+views can page through the results ordered by it.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from movie_app.models import Movie, Review
+
+
+class SqliteFTSBackend:
+    # model -> (FTS5 table, indexed columns)
+    tables = {
+        Movie: ('movie_app_movie_fts', ('title', 'description')),
+        Review: ('movie_app_review_fts', ('text',)),
+    }
+
+    @staticmethod
+    def match_expression(query):
+        terms = re.findall(r'\w+', query)
+        # Quoted terms are matched literally, the last one also as a prefix.
+        return ' '.join(f'"{term}"' for term in terms[:-1]) + (f' "{terms[-1]}"*' if terms else '')
+
+    def index(self, model, objects, created=False):
+        table, columns = self.tables[model]
+        rows = [[obj.id] + [getattr(obj, column) for column in columns] for obj in objects]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            if not created:
+                cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [row[:1] for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {table} (rowid, {", ".join(columns)}) '
+                f'VALUES ({", ".join(["%s"] * (len(columns) + 1))})',
+                rows,
+            )
+
+    def remove(self, model, ids):
+        table, _ = self.tables[model]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [[pk] for pk in ids])
+
+    def rebuild(self, model):
+        table, columns = self.tables[model]
+        source = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(
+                f'INSERT INTO {table} (rowid, {", ".join(columns)}) '
+                f'SELECT id, {", ".join(columns)} FROM {source} WHERE deleted_at IS NULL'
+            )
+            cursor.execute(f'SELECT count(*) FROM {table}')
+            return cursor.fetchone()[0]
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+        table, _ = self.tables[queryset.model]
+        source = queryset.model._meta.db_table
+        matches = RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [expression])
+        rank = RawSQL(
+            f'SELECT rank FROM {table} WHERE {table} MATCH %s AND rowid = {source}.id',
+            [expression], output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matches).annotate(search_rank=rank)
+
+
+class PostgresSearchBackend:
+    # The configuration the generated columns are built with, see migration 0011.
+    config = 'english'
+
+    def index(self, model, objects, created=False):
+        pass    # the generated column follows the row
+
+    def remove(self, model, ids):
+        pass
+
+    def rebuild(self, model):
+        return model.objects.count()
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+        table = queryset.model._meta.db_table
+        vector = RawSQL(f'"{table}"."search_vector"', [], output_field=SearchVectorField())
+        search_query = SearchQuery(query, search_type='websearch', config=self.config)
+        # search_vector @@ query can use the GIN index, the vector is not selected.
+        return queryset.alias(search_vector=vector) \
+            .filter(search_vector=search_query) \
+            .annotate(search_rank=-SearchRank(vector, search_query))
+
+
+BACKENDS = {
+    'sqlite': SqliteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend():
+    path = getattr(settings, 'MOVIE_SEARCH', {}).get('BACKEND')
+    if path:
+        return import_string(path)()
+    return BACKENDS[connection.vendor]()
+
+
+def search(queryset, query):
+    return get_backend().search(queryset, query)
+
+
+def index_objects(model, objects, created=False):
+    get_backend().index(model, objects, created=created)
+
+
+def remove_objects(model, ids):
+    get_backend().remove(model, ids)
@@ -1,32 +1,201 @@
+import math
+import time
+
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import Director, Movie, Review
+from .metrics import observe_serializer
+from .models import Director, Movie, Review, average_rating, movies_prefetch, reviews_prefetch
+
+
+class TimedSerializerMixin:
+    """Records the time spent rendering ``.data`` in the serializer metrics."""
+
+    @property
+    def data(self):
+        if hasattr(self, '_data'):
+            return super().data
+        started = time.perf_counter()
+        data = super().data
+        observe_serializer(self.metrics_name, time.perf_counter() - started)
+        return data
+
+    @property
+    def metrics_name(self):
+        return type(self).__name__
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    @property
+    def metrics_name(self):
+        return f'{type(self.child).__name__}[]'
+
+
+class DynamicFieldsMixin:
+    """Takes an optional ``fields`` argument that limits which fields are rendered."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 
+class BulkListSerializer(serializers.ListSerializer):
+    """Validates a batch of items.
 
-class DirectorSerializer(serializers.ModelSerializer):
+    Item errors are reported per index like in ``ListSerializer``, but the
+    foreign key named in the child's ``Meta.bulk_foreign_key`` is checked for
+    the whole batch with one ``id__in`` query instead of one query per item.
+    """
+    max_items = 10000
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if not data:
+            raise ValidationError({'non_field_errors': ['The list may not be empty.']})
+        if len(data) > self.max_items:
+            raise ValidationError({'non_field_errors': [
+                f'Ensure this list has no more than {self.max_items} items.'
+            ]})
+
+        items, errors = [], []
+        for item in data:
+            try:
+                items.append(self.run_child_validation(item))
+                errors.append({})
+            except ValidationError as exc:
+                items.append(None)
+                errors.append(exc.detail)
+
+        foreign_key = getattr(self.child.Meta, 'bulk_foreign_key', None)
+        if foreign_key is not None:
+            field, model, message = foreign_key
+            ids = {item[field] for item in items if item is not None}
+            existing = set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+            for item, error in zip(items, errors):
+                if item is not None and item[field] not in existing:
+                    error[field] = [message]
+
+        if any(errors):
+            raise ValidationError(errors)
+        return items
+
+
+class DirectorSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Director
-        fields = '__all__'
+        list_serializer_class = TimedListSerializer
+        fields = 'id name'.split()
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Review
+        list_serializer_class = TimedListSerializer
         fields = 'id text stars'.split()
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     director = DirectorSerializer()
     reviews = ReviewSerializer(many=True)
 
     class Meta:
         model = Movie
-        fields = 'id title description duration director reviews director_name'.split()
+        list_serializer_class = TimedListSerializer
+        fields = 'id title description duration director reviews director_name rating reviews_count'.split()
+        summary_fields = 'id title duration director_name rating reviews_count'.split()
+        # Model columns each serializer field reads, used to narrow querysets.
+        field_columns = {
+            'id': ['id'],
+            'title': ['title'],
+            'description': ['description'],
+            'duration': ['duration'],
+            'director': ['director', 'director__name'],
+            'director_name': ['director', 'director__name'],
+            'rating': ['stars_sum'] + [f'stars_{stars}' for stars in range(1, 6)],
+            'reviews_count': ['reviews_count'],
+            'reviews': [],
+        }
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        """Parse ``?view=summary`` / ``?fields=a,b`` into a list of field names, or ``None``."""
+        if request.query_params.get('view') == 'summary':
+            return cls.Meta.summary_fields
+        fields = request.query_params.get('fields')
+        if not fields:
+            return None
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in cls.Meta.fields]
+        if unknown:
+            raise ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+        return fields
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None):
+        """Load only what the requested fields need: skip reviews and unused columns."""
+        if fields is None:
+            fields = cls.Meta.fields
+        columns = {'id'}
+        for name in fields:
+            columns.update(cls.Meta.field_columns[name])
+        if any(column.startswith('director__') for column in columns):
+            queryset = queryset.select_related('director')
+        if 'reviews' in fields:
+            queryset = queryset.prefetch_related(reviews_prefetch())
+        return queryset.only(*columns)
+
+
+class CompactMovieSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Movie
+        list_serializer_class = TimedListSerializer
+        fields = 'id title duration rating'.split()
+
+
+class DirectorFilmographySerializer(DynamicFieldsMixin, DirectorSerializer):
+    """A director with aggregates of their movies; ``?expand=movies`` embeds the movies.
+
+    Reads querysets prepared by ``setup_queryset``.
+    """
+    movies_count = serializers.IntegerField(read_only=True)
+    total_duration = serializers.FloatField(read_only=True)
+    rating = serializers.SerializerMethodField()
+    movies = CompactMovieSerializer(many=True, read_only=True, source='movie_set')
+
+    class Meta(DirectorSerializer.Meta):
+        fields = 'id name movies_count total_duration rating movies'.split()
+        expandable_fields = ['movies']
+
+    def get_rating(self, director):
+        return average_rating(director.movies_stars_sum, [director.movies_rated])
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        """The fields to render: the expandable ones only when named in ``?expand=``."""
+        expand = [name.strip() for name in request.query_params.get('expand', '').split(',') if name.strip()]
+        unknown = [name for name in expand if name not in cls.Meta.expandable_fields]
+        if unknown:
+            raise ValidationError({'expand': [f'Unknown field: {name}' for name in unknown]})
+        return [name for name in cls.Meta.fields
+                if name not in cls.Meta.expandable_fields or name in expand]
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None):
+        queryset = queryset.with_filmography()
+        if fields is None or 'movies' in fields:
+            queryset = queryset.prefetch_related(movies_prefetch())
+        return queryset
 
 
 class DirectorValidateSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=150)
 
+    class Meta:
+        list_serializer_class = BulkListSerializer
+
 
 class MovieValidateSerializer(serializers.Serializer):
     title = serializers.CharField(max_length=150)
@@ -34,7 +203,18 @@ class MovieValidateSerializer(serializers.Serializer):
     duration = serializers.FloatField(default=0)
     director_id = serializers.IntegerField()
 
+    class Meta:
+        list_serializer_class = BulkListSerializer
+        bulk_foreign_key = ('director_id', Director, 'Director does not exists!')
+
+    def validate_duration(self, duration):
+        if not math.isfinite(duration):
+            raise ValidationError('A finite number is required.')
+        return duration
+
     def validate_director_id(self, director_id):
+        if isinstance(self.parent, BulkListSerializer):
+            return director_id    # checked for the whole batch by the parent
         try:
             Director.objects.get(id=director_id)
         except Director.DoesNotExist:
@@ -47,9 +227,27 @@ class ReviewValidateSerializer(serializers.Serializer):
     movie_id = serializers.IntegerField()
     stars = serializers.IntegerField(min_value=1, max_value=5)
 
+    class Meta:
+        list_serializer_class = BulkListSerializer
+        bulk_foreign_key = ('movie_id', Movie, 'Movie does not exists!')
+
     def validate_movie_id(self, movie_id):
+        if isinstance(self.parent, BulkListSerializer):
+            return movie_id    # checked for the whole batch by the parent
         try:
             Movie.objects.get(id=movie_id)
         except Movie.DoesNotExist:
             raise ValidationError('Movie does not exists!')
         return movie_id
+
+
+class DirectorBulkUpdateSerializer(DirectorValidateSerializer):
+    id = serializers.IntegerField()
+
+
+class MovieBulkUpdateSerializer(MovieValidateSerializer):
+    id = serializers.IntegerField()
+
+
+class ReviewBulkUpdateSerializer(ReviewValidateSerializer):
+    id = serializers.IntegerField()
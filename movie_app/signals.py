@@ -0,0 +1,53 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from movie_app.cache import invalidate_objects
+from movie_app.models import Director, Movie, Review
+from movie_app.tasks import queue_ratings, queue_search_index
+
+# The payloads of the changed rows are invalidated right away, so a client
+# reads its own write; the rating recount and the search index, and the
+# cache entries they affect, are updated by jobs (see movie_app.tasks).
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    current = (instance.movie_id, instance.stars)
+    previous = None if created else getattr(instance, '_loaded_rating', None)
+    if previous != current:
+        # Without ``_loaded_rating`` the old movie is unknown, recount the current one.
+        queue_ratings([instance.movie_id, previous[0] if previous else None])
+    invalidate_objects(Review, [instance])
+    queue_search_index(Review, [instance.id])
+    instance._loaded_rating = current
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    movie_id, _ = getattr(instance, '_loaded_rating', (instance.movie_id, instance.stars))
+    queue_ratings([movie_id])
+    invalidate_objects(Review, [instance])
+    queue_search_index(Review, [instance.id])
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        invalidate_objects(Movie, [instance])
+        queue_search_index(Movie, [instance.id])
+        instance._loaded_director_id = instance.director_id
+
+
+@receiver(post_delete, sender=Movie)
+def movie_deleted(sender, instance, **kwargs):
+    invalidate_objects(Movie, [instance])
+    queue_search_index(Movie, [instance.id])
+
+
+@receiver(post_save, sender=Director)
+@receiver(post_delete, sender=Director)
+def director_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_objects(Director, [instance])
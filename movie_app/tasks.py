@@ -0,0 +1,65 @@
+"""Side effects of writes, run by the job queue (see ``jobs.queue``) off the request path."""
+from django.apps import apps
+
+from jobs.queue import enqueue, task
+from movie_app.cache import invalidate_objects
+from movie_app.models import Movie, Review
+from movie_app.rankings import refresh_rankings
+from movie_app.search import index_objects, remove_objects
+
+
+@task('movie_app.refresh_ratings')
+def refresh_ratings(movie_ids):
+    """Recount the rating columns and leaderboard rows of movies, drop their cached payloads."""
+    movies = Movie.objects.filter(id__in=movie_ids)
+    movies.refresh_ratings()
+    refresh_rankings(movie_ids)
+    invalidate_objects(Movie, movies.only('id', 'director_id'))
+
+
+@task('movie_app.sync_search_index')
+def sync_search_index(model, ids):
+    """Index the current text of rows, or unindex them when they no longer exist."""
+    model = apps.get_model(model)
+    objects = list(model.objects.filter(id__in=ids))
+    index_objects(model, objects)
+    missing = set(ids) - {obj.id for obj in objects}
+    if missing:
+        remove_objects(model, missing)
+
+
+@task('movie_app.forget_deleted_movies')
+def forget_deleted_movies(movie_ids):
+    """Drop the leaderboard rows, search entries and cached reviews of soft deleted movies."""
+    refresh_rankings(movie_ids)
+    reviews = list(Review.all_objects.filter(movie_id__in=movie_ids).only('id', 'movie_id'))
+    remove_objects(Movie, movie_ids)
+    remove_objects(Review, [review.id for review in reviews])
+    invalidate_objects(Review, reviews)
+
+
+# Movies recounted by one job of a bulk write.
+BULK_RATINGS_CHUNK = 500
+
+
+def queue_ratings(movie_ids):
+    """One job per movie, so the writes of a busy movie coalesce into one recount."""
+    for movie_id in sorted({movie_id for movie_id in movie_ids if movie_id is not None}):
+        enqueue(refresh_ratings, key=f'movie:{movie_id}', movie_ids=[movie_id])
+
+
+def queue_bulk_ratings(movie_ids):
+    """Recount the movies of a bulk write in a few jobs of ``BULK_RATINGS_CHUNK`` movies.
+
+    ``queue_ratings`` would cost a lookup and an insert per movie inside the
+    request's transaction.
+    """
+    movie_ids = sorted({movie_id for movie_id in movie_ids if movie_id is not None})
+    for start in range(0, len(movie_ids), BULK_RATINGS_CHUNK):
+        enqueue(refresh_ratings, movie_ids=movie_ids[start:start + BULK_RATINGS_CHUNK])
+
+
+def queue_search_index(model, ids):
+    ids = sorted(ids)
+    if ids:
+        enqueue(sync_search_index, model=model._meta.label, ids=ids)
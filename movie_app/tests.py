@@ -1,3 +1,1168 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from Afisha.routers import PrimaryReplicaRouter, use_replicas
+from movie_app.benchmark import benchmark_routes, compare, seed_catalog
+from movie_app.cache import get_cache
+from movie_app.fast_serializers import DirectorFilmographyValuesSerializer, DirectorValuesSerializer, \
+    MovieValuesSerializer, ReviewValuesSerializer
+from movie_app.filters import MovieFilterSerializer, filter_queryset
+from movie_app.metrics import registry
+from movie_app.rankings import refresh_rankings
+from movie_app.models import STARS, Director, IdempotencyKey, Movie, MovieRanking, MovieReviewDay, Review
+from movie_app.renderers import FastJSONRenderer
+from movie_app.search import PostgresSearchBackend, get_backend
+from movie_app.serializers import DirectorFilmographySerializer, DirectorSerializer, MovieSerializer, \
+    ReviewSerializer
+
+
+NO_CACHE = {'ENABLED': False}
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Director.objects.create(name='Nolan')
+        cls.movies = [
+            Movie.objects.create(title=f'Movie {i}', description='', duration=90,
+                                 director=cls.director)
+            for i in range(5)
+        ]
+        for movie in cls.movies:
+            Review.objects.create(text='ok', stars=4, movie=movie)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def collect_backwards(self, url):
+        """Walk to the last page, then back to the first through the ``previous`` links."""
+        while url:
+            data = self.client.get(url).data
+            url = data['next']
+        ids = [item['id'] for item in data['results']]
+        while data['previous']:
+            response = self.client.get(data['previous'])
+            self.assertEqual(response.status_code, 200)
+            data = response.data
+            ids = [item['id'] for item in data['results']] + ids
+        return ids
+
+    def test_function_views_walk_all_pages(self):
+        expected = [movie.id for movie in self.movies]
+        self.assertEqual(self.collect('/api/v1/movies/?page_size=2'), expected)
+        self.assertEqual(len(self.collect('/api/v1/reviews/?page_size=2')), 5)
+        self.assertEqual(self.collect('/api/v1/directors/'), [self.director.id])
+
+    def test_cbv_newest_first(self):
+        expected = [movie.id for movie in reversed(self.movies)]
+        self.assertEqual(self.collect('/api/v1/movies_cbv/?page_size=2&ordering=-id'), expected)
+        self.assertEqual(len(self.collect('/api/v1/reviews_cbv/?page_size=3')), 5)
+        self.assertEqual(self.collect('/api/v1/directors_cbv/'), [self.director.id])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/v1/movies/?page_size=100000')
+        self.assertEqual(len(response.data['results']), 5)
+        # ETag validators (3) + page + prefetched reviews
+        with self.assertNumQueries(5):
+            self.client.get('/api/v1/movies/?page_size=2')
+
+    def test_ties_past_the_offset_cutoff(self):
+        # More rows share the title than CursorPagination.offset_cutoff can skip.
+        Movie.objects.bulk_create(Movie(title='Remake', description='', duration=90, director=self.director)
+                                  for _ in range(1050))
+        by_title = list(Movie.objects.order_by('title', 'id').values_list('id', flat=True))
+        self.assertEqual(self.collect('/api/v1/movies/?ordering=title&page_size=100'), by_title)
+        expected = list(Movie.objects.order_by('-duration', '-id').values_list('id', flat=True))
+        self.assertEqual(self.collect('/api/v1/movies_cbv/?ordering=-duration&page_size=100'), expected)
+
+        self.assertEqual(self.collect_backwards('/api/v1/movies/?ordering=title&page_size=100'), by_title)
+
+    def test_nulls_in_the_ordering_field(self):
+        movie = self.movies[0]
+        for stars in (None, 2, None):
+            Review.objects.create(text='old', stars=stars, movie=movie)
+        reviews = list(Review.objects.values_list('stars', 'id'))
+        # NULLs sort last, whatever the database does by default.
+        ascending = [pk for stars, pk in sorted(reviews, key=lambda row: (row[0] is None, row[0] or 0, row[1]))]
+        for url in ('/api/v1/reviews/?ordering=stars&page_size=1', '/api/v1/reviews_cbv/?ordering=stars&page_size=2'):
+            self.assertEqual(self.collect(url), ascending)
+            self.assertEqual(self.collect_backwards(url), ascending)
+            url = url.replace('=stars', '=-stars')
+            self.assertEqual(self.collect(url), ascending[::-1])
+            self.assertEqual(self.collect_backwards(url), ascending[::-1])
+
+    def test_malformed_cursors_are_not_found(self):
+        for url, position in [
+            ('/api/v1/reviews/', 'abc'),
+            ('/api/v1/movies/?ordering=duration', '["x", 1]'),
+            ('/api/v1/movies/?ordering=title', '["Movie 1", "x"]'),
+            ('/api/v1/movies_cbv/?ordering=-title', '["Movie 1"'),
+            ('/api/v1/reviews_cbv/?ordering=stars', '{"stars": 1}'),
+        ]:
+            cursor = b64encode(urlencode({'p': position}).encode()).decode()
+            response = self.client.get(f'{url}{"&" if "?" in url else "?"}cursor={cursor}')
+            self.assertEqual(response.status_code, 404, (url, position))
+
+    def test_unknown_ordering_is_rejected(self):
+        response = self.client.get('/api/v1/movies/?ordering=description')
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.director = Director.objects.create(name='Villeneuve')
+        self.movie = Movie.objects.create(title='Dune', description='', director=self.director)
+        self.other = Movie.objects.create(title='Arrival', description='', director=self.director)
+
+    def rating_of(self, movie):
+        movie.refresh_from_db()
+        return movie.reviews_count, movie.stars_sum, movie.stars_histogram
+
+    def test_function_views_keep_aggregate_in_sync(self):
+        response = self.client.post('/api/v1/reviews/', {'text': 'a', 'stars': 5, 'movie_id': self.movie.id})
+        review_id = response.data['id']
+        self.client.post('/api/v1/reviews/', {'text': 'b', 'stars': 2, 'movie_id': self.movie.id})
+        self.assertEqual(self.rating_of(self.movie), (2, 7, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}))
+
+        self.client.put(f'/api/v1/reviews/{review_id}/',
+                        {'text': 'a', 'stars': 3, 'movie_id': self.other.id},
+                        content_type='application/json')
+        self.assertEqual(self.rating_of(self.movie)[:2], (1, 2))
+        self.assertEqual(self.rating_of(self.other)[:2], (1, 3))
+
+        self.client.delete(f'/api/v1/reviews/{review_id}/')
+        self.assertEqual(self.rating_of(self.other)[:2], (0, 0))
+
+    def test_cbv_keep_aggregate_in_sync(self):
+        response = self.client.post('/api/v1/reviews_cbv/', {'text': 'a', 'stars': 4, 'movie_id': self.movie.id})
+        review_id = response.data['id']
+        self.client.put(f'/api/v1/reviews_cbv/{review_id}/',
+                        {'text': 'a', 'stars': 1, 'movie_id': self.movie.id},
+                        content_type='application/json')
+        self.assertEqual(self.rating_of(self.movie), (1, 1, {1: 1, 2: 0, 3: 0, 4: 0, 5: 0}))
+        self.client.delete(f'/api/v1/reviews_cbv/{review_id}/')
+        self.assertEqual(self.rating_of(self.movie)[0], 0)
+
+    def test_rating_exposed_on_movie(self):
+        Review.objects.create(text='a', stars=5, movie=self.movie)
+        Review.objects.create(text='b', stars=4, movie=self.movie)
+        response = self.client.get(f'/api/v1/movies/{self.movie.id}/')
+        self.assertEqual(response.data['rating'], 4.5)
+        self.assertEqual(response.data['reviews_count'], 2)
+
+    def test_rebuild_command(self):
+        Review.objects.create(text='a', stars=5, movie=self.movie)
+        Movie.objects.update(reviews_count=0, stars_sum=0, stars_5=0)
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.assertEqual(self.rating_of(self.movie)[:2], (1, 5))
+
+
+class MovieSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(name='Tarkovsky')
+        cls.movie = Movie.objects.create(title='Solaris', description='Long text', duration=167,
+                                         director=director)
+        Review.objects.create(text='Slow and great', stars=5, movie=cls.movie)
+
+    def test_summary_view(self):
+        for url in ('/api/v1/movies/?view=summary', '/api/v1/movies_cbv/?view=summary'):
+            with self.assertNumQueries(4):    # ETag validators (3) + page
+                response = self.client.get(url)
+            self.assertEqual(response.data['results'], [{
+                'id': self.movie.id, 'title': 'Solaris', 'duration': 167.0,
+                'director_name': 'Tarkovsky', 'rating': 5.0, 'reviews_count': 1,
+            }])
+
+    def test_sparse_fields(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/v1/movies/?fields=id,title')
+        self.assertEqual(response.data['results'], [{'id': self.movie.id, 'title': 'Solaris'}])
+        response = self.client.get('/api/v1/movies_cbv/?fields=id,reviews')
+        self.assertEqual(response.data['results'][0]['reviews'][0]['text'], 'Slow and great')
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/v1/movies/?fields=id,budget')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DEBUG=True, API_CACHE=NO_CACHE)
+class MovieQueryCountTests(TestCase):
+    """Query budget per endpoint, read from the ``X-DjangoQueryCount-Count`` header.
+
+    Jobs run inline in tests, so writes include their follow-up work.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Director.objects.create(name='Kubrick')
+        cls.movie = Movie.objects.create(title='Barry Lyndon', description='', director=cls.director)
+        for stars in STARS:
+            Review.objects.create(text='...', stars=stars, movie=cls.movie)
+
+    def assertQueryCount(self, response, expected):
+        self.assertLess(response.status_code, 300, response.data)
+        self.assertEqual(int(response['X-DjangoQueryCount-Count']), expected)
+
+    def payload(self):
+        return {'title': 'The Shining', 'description': 'Overlook', 'duration': 146,
+                'director_id': self.director.id}
+
+    def test_detail(self):
+        # ETag validator + with_related() fetch
+        self.assertQueryCount(self.client.get(f'/api/v1/movies/{self.movie.id}/'), 3)
+        self.assertQueryCount(self.client.get(f'/api/v1/movies_cbv/{self.movie.id}/'), 3)
+
+    def test_create(self):
+        # director check + insert + search index job (3) + with_related() fetch
+        self.assertQueryCount(self.client.post('/api/v1/movies/', self.payload()), 7)
+        self.assertQueryCount(self.client.post('/api/v1/movies_cbv/', self.payload()), 7)
+
+    def test_update(self):
+        # transaction (2) + row lock + movie lookup + director check + update
+        # + search index job (3) + with_related() fetch + new ETag validator
+        for url in (f'/api/v1/movies/{self.movie.id}/', f'/api/v1/movies_cbv/{self.movie.id}/'):
+            response = self.client.put(url, {**self.payload(), 'title': url}, content_type='application/json')
+            self.assertQueryCount(response, 12)
+            self.assertEqual(len(response.data['reviews']), 5)
+
+
+class BulkEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Director.objects.create(name='Fincher')
+        cls.movie = Movie.objects.create(title='Zodiac', description='', director=cls.director)
+
+    def post(self, url, data, method='post'):
+        return getattr(self.client, method)(url, data, content_type='application/json')
+
+    def test_create_reviews_with_one_foreign_key_query(self):
+        items = [{'text': f'review {i}', 'stars': i % 5 + 1, 'movie_id': self.movie.id} for i in range(50)]
+        # movie id__in check + insert + savepoint/release
+        # + rating job (locked recount 5, leaderboard rows 8, invalidation 1) + search index job (3)
+        with self.assertNumQueries(21):
+            response = self.post('/api/v1/reviews/bulk/', items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 50)
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.reviews_count, 50)
+        self.assertEqual(self.movie.stars_sum, 150)
+
+    def test_per_item_errors_write_nothing(self):
+        items = [
+            {'title': 'Se7en', 'description': 'Sins', 'director_id': self.director.id},
+            {'title': 'Alien', 'description': 'Ship', 'director_id': 999},
+            {'description': 'No title', 'director_id': self.director.id},
+        ]
+        response = self.post('/api/v1/movies/bulk/', items)
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('director_id', errors[1])
+        self.assertIn('title', errors[2])
+        self.assertEqual(Movie.objects.count(), 1)
+
+    def test_update(self):
+        other = Movie.objects.create(title='Fight Club', description='', director=self.director)
+        review = Review.objects.create(text='ok', stars=2, movie=self.movie)
+        response = self.post('/api/v1/reviews/bulk/', [
+            {'id': review.id, 'text': 'better', 'stars': 5, 'movie_id': other.id},
+        ], method='put')
+        self.assertEqual(response.data, {'updated': 1})
+        self.movie.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.movie.reviews_count, other.stars_sum), (0, 5))
+
+        response = self.post('/api/v1/directors/bulk/', [{'id': 999, 'name': 'Nobody'}], method='put')
+        self.assertEqual(response.data['errors'], [{'id': ['Not found']}])
+
+
+class CatalogExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(name='Wong Kar-wai')
+        cls.movie = Movie.objects.create(title='In the Mood for Love', description='1962, Hong Kong',
+                                         duration=98, director=director)
+        Movie.objects.create(title='Chungking Express', description='', director=director)
+        Review.objects.create(text='Beautiful, "quiet"', stars=5, movie=cls.movie)
+
+    def test_ndjson_matches_serializer(self):
+        response = self.client.get('/api/v1/movies/export/ndjson/')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        movie = Movie.objects.with_related().get(id=self.movie.id)
+        self.assertEqual(json.loads(lines[0]), json.loads(json.dumps(MovieSerializer(movie).data)))
+
+    def test_csv(self):
+        response = self.client.get('/api/v1/movies/export/csv/')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['movie_id', 'title'])
+        self.assertEqual(rows[1][-2:], ['Beautiful, "quiet"', '5'])
+        self.assertEqual(rows[2][-3:], ['', '', ''])
+        self.assertEqual(self.client.get('/api/v1/movies/export/xml/').status_code, 404)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_catalog', '--chunk-size', '1', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.director = Director.objects.create(name='Kurosawa')
+        self.movie = Movie.objects.create(title='Ran', description='', director=self.director)
+        self.other = Movie.objects.create(title='Ikiru', description='', director=self.director)
+        self.review = Review.objects.create(text='epic', stars=5, movie=self.movie)
+
+    def get(self, url):
+        response = self.client.get(url)
+        return response['X-Cache'], response.data
+
+    def test_hit_after_miss(self):
+        for url in ('/api/v1/movies/', f'/api/v1/movies_cbv/{self.movie.id}/', '/api/v1/directors_cbv/'):
+            self.assertEqual(self.get(url)[0], 'MISS')
+            # The ETag validators are cached with the payload.
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(url)[0], 'HIT')
+        self.assertEqual(self.get('/api/v1/movies/?page_size=1')[0], 'MISS')
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_pagination_links_follow_the_host(self):
+        Movie.objects.create(title='Dreams', description='', director=self.director)
+        url = '/api/v1/movies/?page_size=1'
+        self.assertEqual(self.get(url)[0], 'MISS')
+        response = self.client.get(url, HTTP_HOST='api.example.com', secure=True)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.data['next'].startswith('https://api.example.com/api/v1/movies/'))
+        self.assertTrue(self.get(url)[1]['next'].startswith('http://testserver/'))
+
+    def test_review_edit_evicts_only_its_movie(self):
+        movie_url, other_url = f'/api/v1/movies/{self.movie.id}/', f'/api/v1/movies/{self.other.id}/'
+        for url in (movie_url, other_url, '/api/v1/movies/', '/api/v1/directors/'):
+            self.get(url)
+        self.client.put(f'/api/v1/reviews/{self.review.id}/',
+                        {'text': 'meh', 'stars': 2, 'movie_id': self.movie.id},
+                        content_type='application/json')
+        cache_state, data = self.get(movie_url)
+        self.assertEqual((cache_state, data['rating']), ('MISS', 2.0))
+        self.assertEqual(self.get('/api/v1/movies/')[0], 'MISS')
+        self.assertEqual(self.get(other_url)[0], 'HIT')
+        # The director embeds the rating of their movies.
+        self.assertEqual(self.get('/api/v1/directors/')[0], 'MISS')
+        self.assertEqual(self.get('/api/v1/reviews/')[0], 'MISS')
+
+    def test_director_rename_evicts_its_movies(self):
+        url = f'/api/v1/movies/{self.movie.id}/'
+        self.get(url)
+        self.client.put(f'/api/v1/directors/{self.director.id}/', {'name': 'Akira Kurosawa'},
+                        content_type='application/json')
+        self.assertEqual(self.get(url)[1]['director_name'], 'Akira Kurosawa')
+
+    def test_bulk_write_evicts(self):
+        self.get('/api/v1/reviews/')
+        self.client.post('/api/v1/reviews/bulk/', [{'text': 'x', 'stars': 1, 'movie_id': self.other.id}],
+                         content_type='application/json')
+        self.assertEqual(len(self.get('/api/v1/reviews/')[1]['results']), 2)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.director = Director.objects.create(name='Bergman')
+        self.movie = Movie.objects.create(title='Persona', description='', director=self.director)
+
+    def test_detail_etag(self):
+        for url in (f'/api/v1/movies/{self.movie.id}/', f'/api/v1/movies_cbv/{self.movie.id}/',
+                    f'/api/v1/directors/{self.director.id}/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):    # validators cached with the response
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            with self.settings(API_CACHE=NO_CACHE), self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_review_changes_movie_etag(self):
+        url = f'/api/v1/movies/{self.movie.id}/'
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        Movie.objects.filter(id=self.movie.id).update(updated_at=timezone.now() - timedelta(days=1))
+        Review.objects.create(text='Mirror', stars=5, movie=self.movie)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_review_text_changes_movie_etag(self):
+        review = Review.objects.create(text='Mirror', stars=5, movie=self.movie)
+        for url in (f'/api/v1/movies/{self.movie.id}/', '/api/v1/movies/'):
+            etag = self.client.get(url)['ETag']
+            self.client.patch(f'/api/v1/reviews/{review.id}/', {'text': url}, content_type='application/json')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag(self):
+        for url in ('/api/v1/movies/', '/api/v1/reviews_cbv/', '/api/v1/directors_cbv/'):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        etag = self.client.get('/api/v1/movies/')['ETag']
+        self.assertNotEqual(self.client.get('/api/v1/movies/?view=summary')['ETag'], etag)
+        self.director.save()
+        self.assertEqual(self.client.get('/api/v1/movies/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(name='Miyazaki')
+        cls.totoro = Movie.objects.create(title='My Neighbor Totoro', description='Forest spirit',
+                                          director=director)
+        cls.spirited = Movie.objects.create(title='Spirited Away', description='A bathhouse of spirits',
+                                            director=director)
+        cls.review = Review.objects.create(text='The catbus is iconic', stars=5, movie=cls.totoro)
+
+    def ids(self, url):
+        return [item['id'] for item in self.client.get(url).data['results']]
+
+    def test_movies_ranked_by_relevance(self):
+        for url in ('/api/v1/movies/?search=spirit', '/api/v1/movies_cbv/?search=spirit'):
+            self.assertEqual(self.ids(url), [self.spirited.id, self.totoro.id])
+        self.assertEqual(self.ids('/api/v1/movies/?search=bathhouse&view=summary'), [self.spirited.id])
+        self.assertEqual(self.ids('/api/v1/movies/?search="%29('), [])
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.ids('/api/v1/reviews_cbv/?search=catbus'), [self.review.id])
+        self.client.put(f'/api/v1/reviews/{self.review.id}/',
+                        {'text': 'Soot sprites!', 'stars': 5, 'movie_id': self.totoro.id},
+                        content_type='application/json')
+        self.assertEqual(self.ids('/api/v1/reviews/?search=catbus'), [])
+        self.assertEqual(self.ids('/api/v1/reviews/?search=soot'), [self.review.id])
+        self.totoro.delete()
+        self.assertEqual(self.ids('/api/v1/movies/?search=totoro'), [])
+        self.assertEqual(self.ids('/api/v1/reviews/?search=soot'), [])
+
+    def test_bulk_and_rebuild(self):
+        self.client.post('/api/v1/movies/bulk/', [
+            {'title': 'Porco Rosso', 'description': 'Seaplanes', 'director_id': self.totoro.director_id},
+        ], content_type='application/json')
+        self.assertEqual(len(self.ids('/api/v1/movies/?search=seaplane')), 1)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.ids('/api/v1/movies/?search=seaplane')), 1)
+
+
+class PostgresSearchTests(SimpleTestCase):
+    def test_migration_adds_indexed_vectors(self):
+        migration = importlib.import_module('movie_app.migrations.0011_postgres_search_vector')
+        schema_editor = mock.Mock(**{'connection.vendor': 'postgresql'})
+        migration.add_search_vectors(None, schema_editor)
+        statements = [call.args[0] for call in schema_editor.execute.call_args_list]
+        self.assertIn("GENERATED ALWAYS AS (to_tsvector('english'::regconfig, coalesce(title, '') || ' ' "
+                      "|| coalesce(description, ''))) STORED", statements[0])
+        self.assertEqual(statements[1], 'CREATE INDEX movie_app_movie_search_vector ON movie_app_movie '
+                                        'USING gin (search_vector)')
+        self.assertEqual(migration.CONFIG, PostgresSearchBackend.config)
+
+    @skipUnless(find_spec('psycopg') or find_spec('psycopg2'), 'psycopg is not installed')
+    def test_query_matches_the_indexed_column(self):
+        sql = str(PostgresSearchBackend().search(Movie.objects.all(), 'spirit').query)
+        self.assertIn('"movie_app_movie"."search_vector" @@', sql)
+        self.assertIn('websearch_to_tsquery', sql)
+        self.assertNotIn('to_tsvector', sql)    # nothing computed per row
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class ListFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lynch = Director.objects.create(name='Lynch')
+        cls.lean = Director.objects.create(name='Lean')
+        cls.eraserhead = Movie.objects.create(title='Eraserhead', description='', duration=89,
+                                              director=cls.lynch)
+        cls.dune = Movie.objects.create(title='Dune', description='', duration=137, director=cls.lynch)
+        cls.lawrence = Movie.objects.create(title='Lawrence of Arabia', description='', duration=222,
+                                            director=cls.lean)
+        for stars, movie in ((5, cls.eraserhead), (2, cls.dune), (4, cls.dune), (5, cls.lawrence)):
+            Review.objects.create(text='...', stars=stars, movie=movie)
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item['id'] for item in response.data['results']]
+
+    def test_movie_filters_and_ordering(self):
+        for base in ('/api/v1/movies/', '/api/v1/movies_cbv/'):
+            self.assertEqual(self.ids(f'{base}?director_id={self.lynch.id}&ordering=title'),
+                             [self.dune.id, self.eraserhead.id])
+            self.assertEqual(self.ids(f'{base}?duration_max=90'), [self.eraserhead.id])
+            self.assertEqual(self.ids(f'{base}?duration_min=100&ordering=-duration'),
+                             [self.lawrence.id, self.dune.id])
+            self.assertEqual(self.ids(f'{base}?title=Du'), [self.dune.id])
+
+    def test_review_and_director_filters(self):
+        self.assertEqual(len(self.ids('/api/v1/reviews/?stars_min=4')), 3)
+        self.assertEqual(len(self.ids(f'/api/v1/reviews_cbv/?movie_id={self.dune.id}&stars=4')), 1)
+        self.assertEqual(self.ids('/api/v1/directors_cbv/?name=Le'), [self.lean.id])
+        self.assertEqual(self.ids('/api/v1/directors/?ordering=-name'), [self.lynch.id, self.lean.id])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/api/v1/reviews/?stars=9').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/movies_cbv/?duration_min=long').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/reviews/?ordering=text').status_code, 400)
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(f'USING INDEX {index}', queryset.explain())
+
+    def test_query_plans_use_indexes(self):
+        self.assertUsesIndex(Review.objects.filter(movie_id=1, stars__gte=4), 'movie_review_movie_stars_idx')
+        self.assertUsesIndex(Review.objects.filter(stars__gte=4), 'movie_review_stars_idx')
+        self.assertUsesIndex(Movie.objects.filter(director_id=1).order_by('title'),
+                             'movie_movie_director_title_idx')
+        self.assertUsesIndex(Movie.objects.filter(duration__lte=90), 'movie_movie_duration_idx')
+        request = type('Request', (), {'query_params': {'title': 'Du'}})
+        self.assertUsesIndex(filter_queryset(request, Movie.objects.all(), MovieFilterSerializer),
+                             'movie_movie_title_idx')
+
+
+class AsyncReadViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Director.objects.create(name='Leone')
+        cls.movies = [Movie.objects.create(title=f'Western {i}', description='', director=cls.director)
+                      for i in range(3)]
+        cls.review = Review.objects.create(text='Ennio!', stars=5, movie=cls.movies[0])
+
+    async def test_movie_pages_match_sync_serializer(self):
+        response = await self.async_client.get('/api/v1/async/movies/?page_size=2')
+        page = response.json()
+        self.assertEqual(len(page['results']), 2)
+        response = await self.async_client.get(page['next'])
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.movies[2].id])
+        self.assertIsNone(response.json()['next'])
+
+        response = await self.async_client.get(f'/api/v1/async/movies/{self.movies[0].id}/')
+        movie = await Movie.objects.with_related().aget(id=self.movies[0].id)
+        self.assertEqual(response.json(), json.loads(json.dumps(MovieSerializer(movie).data)))
+
+    async def test_directors_and_reviews(self):
+        response = await self.async_client.get(f'/api/v1/async/directors/{self.director.id}/')
+        self.assertEqual(response.json(), {'id': self.director.id, 'name': 'Leone'})
+        response = await self.async_client.get('/api/v1/async/reviews/')
+        self.assertEqual(response.json()['results'][0]['text'], 'Ennio!')
+        response = await self.async_client.get('/api/v1/async/reviews/999/')
+        self.assertEqual(response.status_code, 404)
+        for cursor in ('bogus', 'bmFtZT0x'):    # not base64, "name=1"
+            response = await self.async_client.get(f'/api/v1/async/reviews/?cursor={cursor}')
+            self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post('/api/v1/async/reviews/')
+        self.assertEqual(response.status_code, 405)
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class ConcurrentWriteTests(TransactionTestCase):
+    THREADS = 8
+    REVIEWS_PER_THREAD = 10
+
+    def setUp(self):
+        self.movie = Movie.objects.create(title='Rashomon', description='',
+                                          director=Director.objects.create(name='Kurosawa'))
+
+    def post_reviews(self, worker):
+        client = Client()
+        statuses = []
+        try:
+            for i in range(self.REVIEWS_PER_THREAD):
+                response = client.post('/api/v1/reviews/', {
+                    'text': f'review {worker}-{i}', 'movie_id': self.movie.id, 'stars': i % 5 + 1,
+                }, content_type='application/json')
+                statuses.append(response.status_code)
+        finally:
+            connections.close_all()
+        return statuses
+
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            # OPTIONS['timeout'] in seconds, not overridden by a default PRAGMA.
+            self.assertEqual(cursor.fetchone()[0], connection.settings_dict['OPTIONS']['timeout'] * 1000)
+
+    def test_parallel_review_creation(self):
+        with ThreadPoolExecutor(self.THREADS) as pool:
+            statuses = [status for result in pool.map(self.post_reviews, range(self.THREADS))
+                        for status in result]
+
+        total = self.THREADS * self.REVIEWS_PER_THREAD
+        self.assertEqual(statuses, [200] * total)
+        self.assertEqual(Review.objects.filter(movie=self.movie).count(), total)
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.reviews_count, total)
+        self.assertEqual(sum(self.movie.stars_histogram.values()), total)
+
+
+@override_settings(API_CACHE=NO_CACHE, ALLOWED_HOSTS=['testserver'])
+class BenchmarkSuiteTests(TestCase):
+    def test_seed_and_benchmark_every_route(self):
+        counts = seed_catalog(directors=3, movies=10, reviews=40)
+        self.assertEqual(counts, {'directors': 3, 'movies': 10, 'reviews': 40})
+        self.assertEqual(sum(Movie.objects.values_list('reviews_count', flat=True)), 40)
+
+        results = benchmark_routes(iterations=1, warmup=0)
+        self.assertIn('GET /api/v1/movies_cbv/<int:id>/', results)
+        self.assertIn('POST /api/v1/reviews/', results)
+        for key, stats in results.items():
+            self.assertLess(stats['status'], 400, key)
+            self.assertGreater(stats['queries'], 0, key)
+
+        slower = {key: dict(stats, p50_ms=stats['p50_ms'] * 2 + 2, queries=stats['queries'] + 1)
+                  for key, stats in results.items()}
+        self.assertEqual(compare(results, results), [])
+        self.assertEqual(len(compare(results, slower)), 2 * len(results))
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(name='Tarr')
+        Movie.objects.create(title='Sátántangó', description='', duration=439, director=director)
+        cls.staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+        cls.user = User.objects.create_user(username='user', password='pass')
+
+    def setUp(self):
+        registry.reset()
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Token {Token.objects.get_or_create(user=user)[0].key}'}
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/v1/movies/')
+        self.client.get('/api/v1/movies/')
+        b''.join(self.client.get('/api/v1/movies/export/ndjson/').streaming_content)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('afisha_http_requests_total{method="GET",route="api/v1/movies/",status="200"} 2', text)
+        self.assertIn('afisha_db_queries_per_request_count{method="GET",route="api/v1/movies/"} 2', text)
+        self.assertIn('afisha_serializer_duration_seconds_count{serializer="MovieValuesSerializer[]"} 2', text)
+        self.assertIn('afisha_http_response_size_bytes_count{method="GET",'
+                      'route="api/v1/movies/export/<str:export_format>/"} 1', text)
+
+        response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 403)
+
+    def test_profiling_is_staff_only(self):
+        response = self.client.get('/api/v1/movies/', HTTP_X_PROFILE='1', **self.auth(self.user))
+        self.assertNotIn('X-Profile-Id', response)
+
+        response = self.client.get('/api/v1/movies/', HTTP_X_PROFILE='1', **self.auth(self.staff))
+        url = f'/metrics/profiles/{response["X-Profile-Id"]}/'
+        self.assertEqual(self.client.get(url, **self.auth(self.user)).status_code, 403)
+        response = self.client.get(url, **self.auth(self.staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('function calls', response.content.decode())
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class ValuesSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        directors = [Director.objects.create(name=name) for name in ('Varda', 'Ozu')]
+        cls.movies = [
+            Movie.objects.create(title='Cléo', description='Paris, 5 to 7', duration=90, director=directors[0]),
+            Movie.objects.create(title='Tokyo Story', description='', duration=136.5, director=directors[1]),
+            Movie.objects.create(title='Unrated', description='no reviews', director=directors[1]),
+        ]
+        for stars, movie in ((5, 0), (3, 0), (4, 1), (None, 1)):
+            Review.objects.create(text=f'{stars} stars', stars=stars, movie=cls.movies[movie])
+
+    def assertSameOutput(self, fast, drf):
+        self.assertEqual(fast, drf)
+        self.assertEqual(json.dumps(fast), json.dumps(drf))    # same key order and types
+
+    def test_movies_match_movie_serializer(self):
+        drf = MovieSerializer(Movie.objects.with_related().order_by('id'), many=True).data
+        fast = MovieValuesSerializer(MovieValuesSerializer.setup_queryset(Movie.objects.order_by('id')),
+                                     many=True).data
+        self.assertSameOutput(fast, drf)
+        self.assertIsNone(fast[2]['rating'])
+
+        movie = Movie.objects.with_related().get(id=self.movies[1].id)
+        row = MovieValuesSerializer.setup_queryset(Movie.objects.all()).get(id=self.movies[1].id)
+        self.assertSameOutput(MovieValuesSerializer(row).data, MovieSerializer(movie).data)
+
+    def test_requested_fields_match(self):
+        for fields in (MovieSerializer.Meta.summary_fields, ['reviews', 'id'], ['director']):
+            drf = MovieSerializer(MovieSerializer.setup_queryset(Movie.objects.order_by('id'), fields),
+                                  many=True, fields=fields).data
+            fast = MovieValuesSerializer(MovieValuesSerializer.setup_queryset(
+                Movie.objects.order_by('id'), fields), many=True, fields=fields).data
+            self.assertEqual(fast, drf)
+
+    def test_reviews_and_directors_match(self):
+        self.assertSameOutput(
+            ReviewValuesSerializer(ReviewValuesSerializer.setup_queryset(Review.objects.order_by('id')),
+                                   many=True).data,
+            ReviewSerializer(Review.objects.order_by('id'), many=True).data,
+        )
+        self.assertSameOutput(
+            DirectorValuesSerializer(DirectorValuesSerializer.setup_queryset(Director.objects.order_by('id')),
+                                     many=True).data,
+            DirectorSerializer(Director.objects.order_by('id'), many=True).data,
+        )
+
+    def test_filmography_matches(self):
+        fields = DirectorFilmographySerializer.Meta.fields
+        for fields in (fields, [name for name in fields if name != 'movies']):
+            drf = DirectorFilmographySerializer(DirectorFilmographySerializer.setup_queryset(
+                Director.objects.order_by('id'), fields), many=True, fields=fields).data
+            fast = DirectorFilmographyValuesSerializer(DirectorFilmographyValuesSerializer.setup_queryset(
+                Director.objects.order_by('id'), fields), many=True, fields=fields).data
+            self.assertSameOutput(fast, drf)
+
+    def test_endpoints_render_the_same_json(self):
+        expected = json.loads(json.dumps(MovieSerializer(Movie.objects.with_related().order_by('id'),
+                                                         many=True).data))
+        for url in ('/api/v1/movies/', '/api/v1/movies_cbv/'):
+            self.assertEqual(self.client.get(url).json()['results'], expected)
+            self.assertEqual(self.client.get(f'{url}{self.movies[0].id}/').json(), expected[0])
+        response = self.client.get('/api/v1/movies/?ordering=-duration&page_size=2')
+        self.assertEqual([item['id'] for item in response.json()['results']],
+                         [self.movies[1].id, self.movies[0].id])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.movies[2].id])
+
+
+class DirectorFilmographyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.varda, cls.ozu, cls.kubrick = [Director.objects.create(name=name)
+                                           for name in ('Varda', 'Ozu', 'Kubrick')]
+        cleo = Movie.objects.create(title='Cléo', description='', duration=90, director=cls.varda)
+        tokyo = Movie.objects.create(title='Tokyo Story', description='', duration=136.5, director=cls.ozu)
+        cls.unrated = Movie.objects.create(title='Early Summer', description='', duration=125,
+                                           director=cls.ozu)
+        for stars, movie in ((5, cleo), (3, cleo), (4, tokyo), (None, tokyo)):
+            Review.objects.create(text='review', stars=stars, movie=movie)
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_aggregates(self):
+        for url in ('/api/v1/directors/', '/api/v1/directors_cbv/'):
+            self.assertEqual(self.client.get(url).json()['results'], [
+                {'id': self.varda.id, 'name': 'Varda', 'movies_count': 1, 'total_duration': 90.0, 'rating': 4.0},
+                {'id': self.ozu.id, 'name': 'Ozu', 'movies_count': 2, 'total_duration': 261.5, 'rating': 4.0},
+                {'id': self.kubrick.id, 'name': 'Kubrick', 'movies_count': 0, 'total_duration': 0.0,
+                 'rating': None},
+            ])
+        for url in (f'/api/v1/directors/{self.ozu.id}/', f'/api/v1/directors_cbv/{self.ozu.id}/'):
+            self.assertEqual(self.client.get(url).json()['movies_count'], 2)
+
+    @override_settings(API_CACHE=NO_CACHE)
+    def test_one_query_per_page(self):
+        # Two for the ETag validators, one for the page (and one for the movies).
+        with self.assertNumQueries(3):
+            self.client.get('/api/v1/directors/')
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/v1/directors_cbv/?expand=movies')
+        self.assertEqual(response.json()['results'][1]['movies'], [
+            {'id': self.unrated.id - 1, 'title': 'Tokyo Story', 'duration': 136.5, 'rating': 4.0},
+            {'id': self.unrated.id, 'title': 'Early Summer', 'duration': 125.0, 'rating': None},
+        ])
+        response = self.client.get(f'/api/v1/directors/{self.kubrick.id}/?expand=movies')
+        self.assertEqual(response.json()['movies'], [])
+        self.assertEqual(self.client.get('/api/v1/directors/?expand=reviews').status_code, 400)
+
+    def test_movie_changes_refresh_the_director(self):
+        url = f'/api/v1/directors/{self.kubrick.id}/'
+        self.assertEqual(self.client.get(url).json()['movies_count'], 0)
+        self.client.put(f'/api/v1/movies/{self.unrated.id}/', {
+            'title': 'Early Summer', 'description': 'Ozu', 'duration': 125, 'director_id': self.kubrick.id,
+        }, content_type='application/json')
+        self.assertEqual(self.client.get(url).json()['movies_count'], 1)
+        self.assertEqual(self.client.get(f'/api/v1/directors/{self.ozu.id}/').json()['movies_count'], 1)
+
+        Review.objects.create(text='review', stars=2, movie=self.unrated)
+        self.assertEqual(self.client.get(url).json()['rating'], 2.0)
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        director = Director.objects.create(name='Miyazaki')
+        cls.few, cls.many, cls.unrated = [
+            Movie.objects.create(title=title, description='', director=director)
+            for title in ('Porco Rosso', 'Spirited Away', 'Unreleased')
+        ]
+        for _ in range(2):
+            Review.objects.create(text='perfect', stars=5, movie=cls.few)
+        for _ in range(20):
+            Review.objects.create(text='great', stars=4, movie=cls.many)
+
+    def test_top_rated_is_one_read(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/movies/top/')
+        results = response.json()['results']
+        # Two five star reviews weigh less than twenty four star ones.
+        self.assertEqual([(item['rank'], item['id'], item['rating']) for item in results],
+                         [(1, self.many.id, 4.0), (2, self.few.id, 5.0)])
+        self.assertEqual(self.client.get('/api/v1/movies/top/?limit=1').json()['results'][0]['id'],
+                         self.many.id)
+        self.assertEqual(self.client.get('/api/v1/movies/top/?limit=101').status_code, 400)
+
+    def test_rankings_follow_reviews(self):
+        for _ in range(30):
+            Review.objects.create(text='masterpiece', stars=5, movie=self.few)
+        results = self.client.get('/api/v1/movies/top/').json()['results']
+        self.assertEqual([item['id'] for item in results], [self.few.id, self.many.id])
+        self.assertEqual(results[0]['reviews_count'], 32)
+
+        Review.objects.filter(movie=self.few).delete()
+        self.assertFalse(MovieRanking.objects.filter(movie=self.few).exists())
+
+    def test_trending_windows(self):
+        now = timezone.now()
+        Review.objects.filter(movie=self.many).update(created_at=now - timedelta(days=10))
+        Review.objects.create(text='again', stars=3, movie=self.unrated)
+        call_command('rebuild_rankings', stdout=StringIO())
+
+        week = self.client.get('/api/v1/movies/trending/').json()
+        self.assertEqual(week['days'], 7)
+        self.assertEqual([(item['id'], item['reviews']) for item in week['results']],
+                         [(self.few.id, 2), (self.unrated.id, 1)])
+        month = self.client.get('/api/v1/movies/trending/?days=30&limit=1').json()['results']
+        self.assertEqual([(item['id'], item['reviews']) for item in month], [(self.many.id, 20)])
+        self.assertEqual(self.client.get('/api/v1/movies/trending/?days=31').status_code, 400)
+
+    def test_rebuild_matches_incremental_refresh(self):
+        before = self.client.get('/api/v1/movies/top/').json()
+        out = StringIO()
+        call_command('rebuild_rankings', stdout=out)
+        self.assertIn('Ranked 2 movies.', out.getvalue())
+        self.assertEqual(self.client.get('/api/v1/movies/top/').json(), before)
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class WriteConcurrencyTests(TestCase):
+    def setUp(self):
+        self.director = Director.objects.create(name='Varda')
+        self.movie = Movie.objects.create(title='Cleo', description='Paris', duration=90,
+                                          director=self.director)
+        self.review = Review.objects.create(text='Lovely', stars=4, movie=self.movie)
+
+    def test_patch_writes_changed_fields(self):
+        for duration, url in enumerate((f'/api/v1/movies/{self.movie.id}/',
+                                        f'/api/v1/movies_cbv/{self.movie.id}/'), 95):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch(url, {'duration': duration}, content_type='application/json')
+            self.assertEqual(response.status_code, 200, response.data)
+            updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "movie_app_movie"')]
+            self.assertEqual(len(updates), 1)
+            self.assertIn('"duration"', updates[0])
+            self.assertNotIn('"title"', updates[0])
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.title, self.movie.duration, self.movie.version), ('Cleo', 96, 3))
+
+        response = self.client.patch(f'/api/v1/reviews/{self.review.id}/', {'stars': 2},
+                                     content_type='application/json')
+        self.assertEqual(response.data['stars'], 2)
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.text, self.review.version), ('Lovely', 2))
+
+    def test_if_match(self):
+        for url in (f'/api/v1/movies/{self.movie.id}/', f'/api/v1/movies_cbv/{self.movie.id}/',
+                    f'/api/v1/reviews/{self.review.id}/', f'/api/v1/reviews_cbv/{self.review.id}/'):
+            etag = self.client.get(url)['ETag']
+            response = self.client.patch(url, {'description': url, 'text': url},
+                                         content_type='application/json', HTTP_IF_MATCH=etag)
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(self.client.get(url)['ETag'], response['ETag'])
+
+            # A client still holding the old tag cannot overwrite the change.
+            response = self.client.patch(url, {'description': 'stale', 'text': 'stale'},
+                                         content_type='application/json', HTTP_IF_MATCH=etag)
+            self.assertEqual(response.status_code, 412)
+            self.assertEqual(self.client.delete(url, HTTP_IF_MATCH=etag).status_code, 412)
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.description, f'/api/v1/movies_cbv/{self.movie.id}/')
+        self.assertEqual(self.client.delete(f'/api/v1/reviews/{self.review.id}/',
+                                            HTTP_IF_MATCH='*').status_code, 204)
+
+    def test_if_match_is_per_resource_version(self):
+        etags = [self.client.get(url)['ETag'] for url in (f'/api/v1/movies_cbv/{self.movie.id}/',
+                                                          f'/api/v1/movies/{self.movie.id}/?fields=title')]
+        # A rating recount changes the representation, not the version.
+        Review.objects.create(text='Again', stars=5, movie=self.movie)
+        for description, etag in enumerate(etags):
+            response = self.client.patch(f'/api/v1/movies/{self.movie.id}/', {'description': str(description)},
+                                         content_type='application/json', HTTP_IF_MATCH=etag)
+            self.assertEqual(response.status_code, 200 if description == 0 else 412)
+
+    def test_bulk_update_bumps_version(self):
+        response = self.client.put('/api/v1/reviews/bulk/', [
+            {'id': self.review.id, 'text': 'Bulk', 'stars': 3, 'movie_id': self.movie.id},
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.version, 2)
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Director.objects.create(name='Tarkovsky')
+        cls.movie = Movie.objects.create(title='Solaris', description='', director=cls.director)
+
+    def post(self, url, data, key):
+        return self.client.post(url, data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        movie = {'title': 'Stalker', 'description': 'Zone', 'duration': 161, 'director_id': self.director.id}
+        review = {'text': 'Slow', 'stars': 5, 'movie_id': self.movie.id}
+        for url, data, model in (('/api/v1/movies/', movie, Movie), ('/api/v1/movies_cbv/', movie, Movie),
+                                 ('/api/v1/reviews/', review, Review), ('/api/v1/reviews_cbv/', review, Review)):
+            count = model.objects.count()
+            first = self.post(url, data, f'key {url}')
+            retry = self.post(url, data, f'key {url}')
+            self.assertEqual(model.objects.count(), count + 1)
+            self.assertEqual((retry.status_code, retry.json()), (first.status_code, first.json()))
+            self.assertEqual(retry['Idempotent-Replayed'], 'true')
+            self.assertEqual(self.post(url, data, f'other {url}').status_code, first.status_code)
+            self.assertEqual(model.objects.count(), count + 2)
+
+    def test_key_reuse_and_failures(self):
+        review = {'text': 'Slow', 'stars': 5, 'movie_id': self.movie.id}
+        self.post('/api/v1/reviews/', review, 'key')
+        self.assertEqual(self.post('/api/v1/reviews/', {**review, 'stars': 1}, 'key').status_code, 422)
+        self.assertEqual(self.post('/api/v1/reviews/', review, 'x' * 256).status_code, 400)
+
+        # Errors raised by the view are not stored, the key can be retried.
+        self.assertEqual(self.post('/api/v1/reviews_cbv/', {'stars': 5}, 'retry').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key='retry').exists())
+
+        IdempotencyKey.objects.create(owner='127.0.0.1', key='busy', path='/api/v1/reviews/',
+                                      fingerprint='')
+        self.assertEqual(self.post('/api/v1/reviews/', review, 'busy').status_code, 409)
+        IdempotencyKey.objects.filter(key='busy').update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.post('/api/v1/reviews/', review, 'busy').status_code, 200)
+
+    def test_purge(self):
+        self.post('/api/v1/reviews/', {'text': 'Slow', 'stars': 5, 'movie_id': self.movie.id}, 'old')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1 idempotency keys.', out.getvalue())
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.kept = self.create_director('Ozu', movies=1, reviews=2)
+        self.small = self.create_director('Vigo', movies=1, reviews=1)
+        self.large = self.create_director('Fassbinder', movies=40, reviews=10)
+        Movie.objects.all().refresh_ratings()
+        refresh_rankings()
+        get_backend().rebuild(Review)
+
+    def create_director(self, name, movies, reviews):
+        director = Director.objects.create(name=name)
+        created = Movie.objects.bulk_create(
+            Movie(title=f'{name} {i}', description='', director=director) for i in range(movies))
+        Review.objects.bulk_create(Review(text='review', stars=stars % 5 + 1, movie=movie)
+                                   for movie in created for stars in range(reviews))
+        return director
+
+    def delete(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        return len(queries)
+
+    def test_delete_director_is_independent_of_its_size(self):
+        movie_id = self.large.movie_set.first().id
+        review_id = Review.objects.filter(movie_id=movie_id).first().id
+        self.assertEqual(self.client.get(f'/api/v1/reviews/{review_id}/').status_code, 200)
+
+        small = self.delete(f'/api/v1/directors/{self.small.id}/')
+        self.assertEqual(self.delete(f'/api/v1/directors_cbv/{self.large.id}/'), small)
+
+        for url in (f'/api/v1/directors/{self.large.id}/', f'/api/v1/movies/{movie_id}/',
+                    f'/api/v1/reviews/{review_id}/', f'/api/v1/reviews_cbv/{review_id}/'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        self.assertEqual(len(self.client.get('/api/v1/movies/').json()['results']), 1)
+        self.assertEqual(Review.objects.count(), 2)
+        self.assertEqual(Review.all_objects.count(), 403)
+        self.assertEqual(list(MovieRanking.objects.values_list('movie__director', flat=True)), [self.kept.id])
+        self.assertEqual(len(self.client.get('/api/v1/reviews/?search=review').json()['results']), 2)
+
+    def test_delete_movie(self):
+        movie = self.large.movie_set.first()
+        self.assertEqual(self.client.delete(f'/api/v1/movies_cbv/{movie.id}/').status_code, 204)
+        self.assertEqual(self.client.get(f'/api/v1/directors/{self.large.id}/').json()['movies_count'], 39)
+        self.assertFalse(Review.objects.filter(movie_id=movie.id).exists())
+        self.assertEqual(self.client.post('/api/v1/reviews/', {'text': 'late', 'stars': 3, 'movie_id': movie.id},
+                                          content_type='application/json').status_code, 400)
+
+    def test_delete_movie_changes_director_etag(self):
+        url = f'/api/v1/directors/{self.large.id}/'
+        etag = self.client.get(url)['ETag']
+        self.client.delete(f'/api/v1/movies/{self.large.movie_set.first().id}/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['movies_count']), (200, 39))
+
+    def test_purge_in_batches(self):
+        self.delete(f'/api/v1/directors/{self.large.id}/')
+        self.delete(f'/api/v1/movies/{self.small.movie_set.get().id}/')
+        # A soft deleted row is only purged once it is older than --older-than.
+        out = StringIO()
+        call_command('purge_deleted', older_than=1, stdout=out)
+        self.assertIn('Purged 0 movie_app.Review', out.getvalue())
+
+        out = StringIO()
+        call_command('purge_deleted', batch_size=150, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('movie_app.Review: deleted 150 rows (300 so far)', lines)
+        self.assertIn('movie_app.Review: deleted 101 rows (401 so far)', lines)
+        self.assertEqual(lines[-1], 'Purged 401 movie_app.Review, 0 movie_app.MovieReviewDay, '
+                                    '0 movie_app.MovieRanking, 41 movie_app.Movie, 1 movie_app.Director.')
+        self.assertEqual(Review.all_objects.count(), 2)
+        self.assertEqual(list(Movie.all_objects.values_list('director_id', flat=True)), [self.kept.id])
+        self.assertEqual(Director.all_objects.count(), 2)
+        self.assertFalse(MovieReviewDay.objects.exclude(movie__director=self.kept).exists())
+
+
+@override_settings(API_CACHE=NO_CACHE)
+class JSONRendererTests(TestCase):
+    def test_output_matches_drf_json_renderer(self):
+        data = {
+            'results': [{'duration': 90.0, 'rating': 0.1 + 0.2, 'none': None}],
+            'text': 'Amélie —   "quoted"',
+            'when': timezone.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+            'price': Decimal('9.90'),
+            1: [True, False],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=4'),
+                         JSONRenderer().render(data, 'application/json; indent=4'))
+        # Exponents are written 1.365e22 / 1e-7 rather than 1.365e+22 / 1e-07, the same numbers.
+        floats = {'big': 136.5e20, 'small': 1e-7}
+        self.assertEqual(json.loads(FastJSONRenderer().render(floats)), floats)
+
+    def test_api_round_trip(self):
+        director = Director.objects.create(name='Kieślowski')
+        response = self.client.post('/api/v1/movies/', {
+            'title': 'Trois couleurs : Bleu', 'description': 'Liberté', 'duration': 98.5,
+            'director_id': director.id,
+        }, content_type='application/json')
+        self.assertEqual(response.json()['duration'], 98.5)
+        self.assertIn(b'"duration":98.5', self.client.get('/api/v1/movies/').content)
+
+        response = self.client.post('/api/v1/movies/', '{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+        response = self.client.post('/api/v1/movies/', {
+            'title': 'Infinite', 'description': '', 'duration': 'inf', 'director_id': director.id,
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_browsable_api(self):
+        response = self.client.get('/api/v1/movies/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'&quot;results&quot;', response.content)
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    @override_settings(DATABASE_REPLICAS={'ALIASES': ['replica']})
+    def test_routing(self):
+        router = PrimaryReplicaRouter()
+        # Outside a GET request (commands, jobs) everything reads the primary.
+        self.assertEqual(router.db_for_read(Movie), 'default')
+        with use_replicas():
+            self.assertEqual(router.db_for_read(Movie), 'replica')
+            self.assertEqual(router.db_for_read(User), 'default')
+            self.assertEqual(router.db_for_write(Review), 'default')
+            # Read-after-write within the request.
+            self.assertEqual(router.db_for_read(Movie), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'movie_app'))
+        self.assertTrue(router.allow_migrate('default', 'movie_app'))
+
+
+def replicate():
+    primary, replica = connections['default'], connections['replica']
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
+
+
+HAS_REPLICA = 'replica' in settings.DATABASES
+
+
+@skipUnless(HAS_REPLICA, 'run with --settings=Afisha.test_settings_replica')
+@override_settings(API_CACHE=NO_CACHE)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        self.director = Director.objects.create(name='Tarkovsky')
+        replicate()
+
+    def test_reads_lag_until_replicated(self):
+        movie = Movie.objects.create(title='Stalker', description='', director=self.director)
+        self.assertEqual(self.client.get(f'/api/v1/movies/{movie.id}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/movies/').json()['results'], [])
+        replicate()
+        self.assertEqual(self.client.get(f'/api/v1/movies/{movie.id}/').status_code, 200)
+        self.assertEqual(len(self.client.get('/api/v1/movies/').json()['results']), 1)
+
+    def test_writer_reads_own_writes(self):
+        response = self.client.post('/api/v1/movies/', {
+            'title': 'Solaris', 'description': 'Lem', 'duration': 167, 'director_id': self.director.id,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db_primary', response.cookies)
+        movie_id = Movie.objects.get(title='Solaris').id
+
+        self.assertEqual(self.client.get(f'/api/v1/movies/{movie_id}/').status_code, 200)
+        self.assertEqual(Client().get(f'/api/v1/movies/{movie_id}/').status_code, 404)
+
+    def test_writes_read_the_primary(self):
+        movie = Movie.objects.create(title='Mirror', description='', director=self.director)
+        response = Client().put(f'/api/v1/movies/{movie.id}/', {
+            'title': 'Zerkalo', 'description': 'Memory', 'duration': 107, 'director_id': self.director.id,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Zerkalo')
@@ -1,22 +1,45 @@
-from rest_framework.decorators import api_view
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.viewsets import ModelViewSet
 
 from movie_app.serializers import DirectorSerializer, MovieSerializer, ReviewSerializer, \
-    DirectorValidateSerializer, MovieValidateSerializer, ReviewValidateSerializer
+    DirectorFilmographySerializer, DirectorValidateSerializer, MovieValidateSerializer, ReviewValidateSerializer, \
+    DirectorBulkUpdateSerializer, MovieBulkUpdateSerializer, ReviewBulkUpdateSerializer
+from movie_app.cache import CacheResponseMixin, cache_response, invalidate_objects
+from movie_app.conditional import ConditionalResponseMixin, conditional, conditional_response
+from movie_app.deletion import soft_delete
+from movie_app.export import EXPORTERS
+from movie_app.fast_serializers import DirectorFilmographyValuesSerializer, MovieValuesSerializer, \
+    ReviewValuesSerializer
+from movie_app.metrics import metrics_settings, registry
+from movie_app.idempotency import idempotent, idempotent_response
+from movie_app.filters import DirectorFilterSerializer, LeaderboardFilterSerializer, MovieFilterSerializer, \
+    ReviewFilterSerializer, filter_queryset
 from movie_app.models import Director, Movie, Review
+from movie_app.pagination import KeysetPagination, paginate
+from movie_app.rankings import leaderboard_settings, top_rated, trending
+from movie_app.search import search
+from movie_app.tasks import queue_bulk_ratings, queue_search_index
 
 
 @api_view(['GET', 'POST'])
+@conditional('director')
+@cache_response('director')
 def director_list_api_view(request):
-    print(request.user)
     if request.method == 'GET':
-        directors = Director.objects.all()
-        data = DirectorSerializer(instance=directors, many=True).data
-        return Response(data=data)
+        fields = DirectorFilmographySerializer.get_requested_fields(request)
+        directors = filter_queryset(request, Director.objects.all(), DirectorFilterSerializer)
+        directors = DirectorFilmographyValuesSerializer.setup_queryset(directors, fields)
+        return paginate(request, directors, DirectorFilmographyValuesSerializer, fields=fields,
+                        ordering_fields=DirectorFilterSerializer.ordering_fields)
     elif request.method == 'POST':
         serializer = DirectorValidateSerializer(data=request.data)
         if not serializer.is_valid():
@@ -30,17 +53,24 @@ def director_list_api_view(request):
 
 
 @api_view(['GET', 'PUT', 'DELETE'])
+@conditional('director', 'director_id')
+@cache_response('director', 'director_id')
 def director_detail_api_view(request, director_id):
+    directors = Director.objects.all()
+    if request.method == 'GET':
+        fields = DirectorFilmographySerializer.get_requested_fields(request)
+        directors = DirectorFilmographyValuesSerializer.setup_queryset(directors, fields)
     try:
-        director = Director.objects.get(id=director_id)
+        director = directors.get(id=director_id)
     except Director.DoesNotExist:
         return Response(data={'error': 'Director not Found'},
                         status=status.HTTP_404_NOT_FOUND)
     if request.method == 'GET':
-        data = DirectorSerializer(instance=director, many=False).data
+        data = DirectorFilmographyValuesSerializer(instance=director, many=False, fields=fields).data
         return Response(data=data)
     elif request.method == 'DELETE':
-        director.delete()
+        # Marks the director, its movies and their reviews, see movie_app.deletion
+        soft_delete(Director, [director.id])
         return Response(status=status.HTTP_204_NO_CONTENT,
                         data={'message': 'The director has been removed.'})
     elif request.method == 'PUT':
@@ -53,14 +83,22 @@ def director_detail_api_view(request, director_id):
 
 
 @api_view(['GET', 'POST'])
+@conditional('movie')
+@cache_response('movie')
+@idempotent
 def movie_list_api_view(request):
     if request.method == 'GET':
-        # Step 1 Collect all data from DB (Queryset)
-        movies = Movie.objects.select_related('director').prefetch_related('reviews').all()
-        # Step 2 Reformat queryset to Dictionary
-        data = MovieSerializer(instance=movies, many=True).data
-        # Step 3 Return Json data
-        return Response(data=data)
+        # Step 1 Collect data from DB (Queryset), only what the requested fields need
+        fields = MovieSerializer.get_requested_fields(request)
+        movies = filter_queryset(request, Movie.objects.all(), MovieFilterSerializer)
+        movies = MovieValuesSerializer.setup_queryset(movies, fields)
+        query = request.query_params.get('search')
+        if query:
+            movies = search(movies, query)
+        # Step 2 Reformat one page of the queryset to Dictionary and return it
+        return paginate(request, movies, MovieValuesSerializer, fields=fields,
+                        ordering='search_rank' if query else None,
+                        ordering_fields=MovieFilterSerializer.ordering_fields)
     elif request.method == 'POST':
         # Step 0 Validation
         serializer = MovieValidateSerializer(data=request.data)
@@ -75,44 +113,75 @@ def movie_list_api_view(request):
         # Step 2 Create movie
         movie = Movie.objects.create(title=title, description=description,
                                      duration=duration, director_id=director_id)
-        movie.save()
         # Step 3 Return created object
+        movie = Movie.objects.with_related().get(id=movie.id)
         return Response(data=MovieSerializer(movie).data)
 
 
-@api_view(['GET', 'PUT', 'DELETE'])
+@api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
+@conditional('movie', 'movie_id')
+@cache_response('movie', 'movie_id')
 def movie_detail_api_view(request, movie_id):
+    movies = Movie.objects.all()
+    if request.method == 'GET':
+        movies = MovieValuesSerializer.setup_queryset(movies)
     try:
-        movie = Movie.objects.get(id=movie_id)
+        movie = movies.get(id=movie_id)
     except Movie.DoesNotExist:
         return Response(data={'error': 'Movie not Found'},
                         status=status.HTTP_404_NOT_FOUND)
     if request.method == 'GET':
-        data = MovieSerializer(instance=movie, many=False).data
+        data = MovieValuesSerializer(instance=movie, many=False).data
         return Response(data=data)
     elif request.method == 'DELETE':
-        movie.delete()
+        soft_delete(Movie, [movie.id])
         return Response(status=status.HTTP_204_NO_CONTENT,
                         data={'message': 'The movie has been removed'})
-    elif request.method == 'PUT':
-        # Validation
-        serializer = MovieValidateSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-
-        movie.title = serializer.validated_data.get('title')
-        movie.description = serializer.validated_data.get('description')
-        movie.duration = serializer.validated_data.get('duration')
-        movie.director_id = serializer.validated_data.get('director_id')
-        movie.save()
+    elif request.method in ('PUT', 'PATCH'):
+        # Validation, PATCH only validates and writes the fields it sends
+        update_object(request, movie, MovieValidateSerializer)
+        movie = Movie.objects.with_related().get(id=movie.id)
         return Response(data=MovieSerializer(movie).data)
 
 
+def leaderboard_params(request):
+    options = leaderboard_settings()
+    serializer = LeaderboardFilterSerializer(data=request.query_params, max_limit=options['MAX_LIMIT'],
+                                             max_days=options['TRENDING_DAYS'])
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+@api_view(['GET'])
+@cache_response('movie')
+def movie_top_api_view(request):
+    """Best rated movies by Bayesian score, from the ``MovieRanking`` table."""
+    params = leaderboard_params(request)
+    return Response(data={'results': top_rated(params['limit'])})
+
+
+@api_view(['GET'])
+@cache_response('movie')
+def movie_trending_api_view(request):
+    """Most reviewed movies of the last ``?days=``, from the daily review counts."""
+    params = leaderboard_params(request)
+    return Response(data={'days': params['days'], 'results': trending(params['days'], params['limit'])})
+
+
 @api_view(['GET', 'POST'])
+@conditional('review')
+@cache_response('review')
+@idempotent
 def review_list_api_view(request):
     if request.method == 'GET':
-        reviews = Review.objects.all()
-        data = ReviewSerializer(instance=reviews, many=True).data
-        return Response(data=data)
+        reviews = filter_queryset(request, Review.objects.all(), ReviewFilterSerializer)
+        reviews = ReviewValuesSerializer.setup_queryset(reviews)
+        query = request.query_params.get('search')
+        if query:
+            reviews = search(reviews, query)
+        return paginate(request, reviews, ReviewValuesSerializer,
+                        ordering='search_rank' if query else None,
+                        ordering_fields=ReviewFilterSerializer.ordering_fields)
     elif request.method == 'POST':
         serializer = ReviewValidateSerializer(data=request.data)
         if not serializer.is_valid():
@@ -127,38 +196,222 @@ def review_list_api_view(request):
         return Response(data=ReviewSerializer(review).data)
 
 
-@api_view(['GET', 'PUT', 'DELETE'])
+@api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
+@conditional('review', 'review_id')
+@cache_response('review', 'review_id')
 def review_detail_api_view(request, review_id):
+    reviews = Review.objects.all()
+    if request.method == 'GET':
+        reviews = ReviewValuesSerializer.setup_queryset(reviews)
     try:
-        review = Review.objects.get(id=review_id)
+        review = reviews.get(id=review_id)
     except Review.DoesNotExist:
         return Response(data={'error': 'Review not Found'},
                         status=status.HTTP_404_NOT_FOUND)
     if request.method == 'GET':
-        data = ReviewSerializer(instance=review, many=False).data
+        data = ReviewValuesSerializer(instance=review, many=False).data
         return Response(data=data)
     elif request.method == 'DELETE':
         review.delete()
         return Response(status=status.HTTP_204_NO_CONTENT,
                         data={'message': 'Review has been removed'})
-    elif request.method == 'PUT':
-        serializer = ReviewValidateSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-
-        review.text = serializer.validated_data.get('text')
-        review.stars = serializer.validated_data.get('stars')
-        review.movie_id = serializer.validated_data.get('movie_id')
-        review.save()
+    elif request.method in ('PUT', 'PATCH'):
+        update_object(request, review, ReviewValidateSerializer)
         return Response(data=ReviewSerializer(review).data)
 
 
+"""Single object writes"""
+
+
+def save_changes(obj, data):
+    """Assign ``data`` to ``obj`` and write only the columns that changed, plus the version."""
+    changed = [name for name, value in data.items() if getattr(obj, name) != value]
+    for name in changed:
+        setattr(obj, name, data[name])
+    if changed:
+        obj.version += 1
+        obj.save(update_fields=[*changed, 'version', 'updated_at'])
+    return changed
+
+
+def update_object(request, obj, serializer_class):
+    """PUT validates a full representation, PATCH only the fields sent."""
+    serializer = serializer_class(data=request.data, partial=request.method == 'PATCH')
+    serializer.is_valid(raise_exception=True)
+    return save_changes(obj, serializer.validated_data)
+
+
+"""Bulk endpoints"""
+
+BULK_BATCH_SIZE = 500
+
+
+def bulk_create(request, model, serializer_class, on_write=None):
+    serializer = serializer_class(data=request.data, many=True)
+    if not serializer.is_valid():
+        return Response(status=status.HTTP_400_BAD_REQUEST,
+                        data={'errors': serializer.errors})
+
+    with transaction.atomic():
+        objects = model.objects.bulk_create(
+            [model(**item) for item in serializer.validated_data],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        if on_write is not None:
+            on_write(objects)
+        # bulk_create() does not send post_save, update cache and search index here.
+        invalidate_objects(model, objects)
+        if model in (Movie, Review):
+            queue_search_index(model, [obj.id for obj in objects])
+    return Response(status=status.HTTP_201_CREATED,
+                    data={'created': len(objects), 'ids': [obj.id for obj in objects]})
+
+
+def bulk_update(request, model, serializer_class, on_write=None):
+    serializer = serializer_class(data=request.data, many=True)
+    if not serializer.is_valid():
+        return Response(status=status.HTTP_400_BAD_REQUEST,
+                        data={'errors': serializer.errors})
+
+    items = serializer.validated_data
+    objects = model.objects.in_bulk([item['id'] for item in items])
+    errors = [{} if item['id'] in objects else {'id': ['Not found']} for item in items]
+    if any(errors):
+        return Response(status=status.HTTP_400_BAD_REQUEST, data={'errors': errors})
+
+    fields = [name for name in serializer.child.fields if name != 'id']
+    versioned = model in (Movie, Review)
+    now = timezone.now()
+    for item in items:
+        obj = objects[item['id']]
+        for name in fields:
+            setattr(obj, name, item[name])
+        obj.updated_at = now    # bulk_update() does not apply auto_now
+        if versioned:
+            obj.version = F('version') + 1
+    with transaction.atomic():
+        updated = model.objects.bulk_update(objects.values(),
+                                            fields + ['updated_at'] + ['version'] * versioned,
+                                            batch_size=BULK_BATCH_SIZE)
+        if on_write is not None:
+            on_write(list(objects.values()))
+        invalidate_objects(model, objects.values())
+        if model in (Movie, Review):
+            queue_search_index(model, list(objects))
+    return Response(data={'updated': updated})
+
+
+@api_view(['POST', 'PUT'])
+def director_bulk_api_view(request):
+    if request.method == 'POST':
+        return bulk_create(request, Director, DirectorValidateSerializer)
+    return bulk_update(request, Director, DirectorBulkUpdateSerializer)
+
+
+@api_view(['POST', 'PUT'])
+def movie_bulk_api_view(request):
+    if request.method == 'POST':
+        return bulk_create(request, Movie, MovieValidateSerializer)
+    return bulk_update(request, Movie, MovieBulkUpdateSerializer)
+
+
+def refresh_review_ratings(reviews):
+    # bulk_create()/bulk_update() skip the rating signals, so recount the touched movies.
+    movie_ids = {review.movie_id for review in reviews}
+    movie_ids.update(review._loaded_rating[0] for review in reviews if hasattr(review, '_loaded_rating'))
+    queue_bulk_ratings(movie_ids)
+
+
+@api_view(['POST', 'PUT'])
+def review_bulk_api_view(request):
+    if request.method == 'POST':
+        return bulk_create(request, Review, ReviewValidateSerializer, on_write=refresh_review_ratings)
+    return bulk_update(request, Review, ReviewBulkUpdateSerializer, on_write=refresh_review_ratings)
+
+
+@require_GET
+def movie_export_view(request, export_format):
+    # Plain Django view: DRF content negotiation would reject Accept: text/csv.
+    if export_format not in EXPORTERS:
+        raise Http404('Unknown export format')
+    exporter, content_type = EXPORTERS[export_format]
+    response = StreamingHttpResponse(exporter(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="movies.{export_format}"'
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in metrics_settings()['ALLOWED_IPS']:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_view(request, profile_id):
+    report = registry.get_profile(profile_id)
+    if report is None:
+        raise Http404('Unknown profile')
+    return HttpResponse(report, content_type='text/plain; charset=utf-8')
+
+
 """Generic's and Mixin's"""
 
 
-class DirectorListCreateAPIView(ListCreateAPIView):     # GET, POST
+class ValuesReadMixin:
+    """Reads (GET) are rendered by ``read_serializer_class`` from ``.values()`` rows."""
+    read_serializer_class = None
+
+    def is_read(self):
+        return self.request.method in ('GET', 'HEAD')
+
+    def get_requested_fields(self):
+        """Fields of ``read_serializer_class`` to render, ``None`` for all of them."""
+        return None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_read():
+            return self.read_serializer_class.setup_queryset(queryset, self.get_requested_fields())
+        return queryset
+
+    def get_serializer_class(self):
+        if self.is_read():
+            return self.read_serializer_class
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.is_read():
+            kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+
+class SearchMixin:
+    """``?search=`` on list endpoints, results ordered by relevance."""
+
+    def search_queryset(self, queryset):
+        query = self.request.query_params.get('search')
+        if not query:
+            return queryset
+        self.paginator.ordering = 'search_rank'
+        return search(queryset, query)
+
+
+class DirectorListCreateAPIView(ConditionalResponseMixin, CacheResponseMixin, ValuesReadMixin,
+                                ListCreateAPIView):     # GET, POST
+    cache_resource = 'director'
     queryset = Director.objects.all()
     serializer_class = DirectorSerializer
-    pagination_class = PageNumberPagination
+    read_serializer_class = DirectorFilmographyValuesSerializer
+    pagination_class = KeysetPagination
+    ordering_fields = DirectorFilterSerializer.ordering_fields
+
+    def get_requested_fields(self):
+        return DirectorFilmographySerializer.get_requested_fields(self.request)
+
+    def get_queryset(self):
+        return filter_queryset(self.request, super().get_queryset(), DirectorFilterSerializer)
 
     def create(self, request, *args, **kwargs):
         serializer = DirectorValidateSerializer(data=request.data)
@@ -172,10 +425,17 @@ class DirectorListCreateAPIView(ListCreateAPIView):     # GET, POST
                         status=status.HTTP_201_CREATED)
 
 
-class DirectorRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):     # GET, PUT, DELETE
+class DirectorRetrieveUpdateDestroyAPIView(ConditionalResponseMixin, CacheResponseMixin, ValuesReadMixin,
+                                           RetrieveUpdateDestroyAPIView):     # GET, PUT, DELETE
+    cache_resource = 'director'
+    queryset = Director.objects.all()
     serializer_class = DirectorSerializer
+    read_serializer_class = DirectorFilmographyValuesSerializer
     lookup_field = 'id'
 
+    def get_requested_fields(self):
+        return DirectorFilmographySerializer.get_requested_fields(self.request)
+
     def update(self, request, *args, **kwargs):
         serializer = DirectorValidateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -188,13 +448,38 @@ class DirectorRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):     #
         return Response(data=self.serializer_class(obj, many=False).data,
                         status=status.HTTP_200_OK)
 
+    def perform_destroy(self, instance):
+        soft_delete(Director, [instance.id])
 
-class MovieViewSet(ModelViewSet):     # GET, POST, GET, PUT, DELETE
-    queryset = Movie.objects.select_related('director').prefetch_related('reviews').all()
+
+class MovieViewSet(ConditionalResponseMixin, CacheResponseMixin, SearchMixin, ValuesReadMixin,
+                   ModelViewSet):     # GET, POST, GET, PUT, PATCH, DELETE
+    cache_resource = 'movie'
+    queryset = Movie.objects.all()
     serializer_class = MovieSerializer
+    read_serializer_class = MovieValuesSerializer
+    pagination_class = KeysetPagination
+    ordering_fields = MovieFilterSerializer.ordering_fields
     lookup_field = 'id'
 
+    def get_queryset(self):
+        if self.action == 'list':
+            fields = MovieSerializer.get_requested_fields(self.request)
+            movies = filter_queryset(self.request, Movie.objects.all(), MovieFilterSerializer)
+            movies = MovieValuesSerializer.setup_queryset(movies, fields)
+            return self.search_queryset(movies)
+        # Writes build their response from a fresh with_related() fetch.
+        return super().get_queryset()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list':
+            kwargs.setdefault('fields', MovieSerializer.get_requested_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
     def create(self, request, *args, **kwargs):
+        return idempotent_response(request, lambda: self.save_create(request))
+
+    def save_create(self, request):
         serializer = MovieValidateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
@@ -205,31 +490,43 @@ class MovieViewSet(ModelViewSet):     # GET, POST, GET, PUT, DELETE
             duration=serializer.validated_data.get('duration'),
             director_id=serializer.validated_data.get('director_id'),
         )
+        movie = Movie.objects.with_related().get(id=movie.id)
         return Response(data=self.serializer_class(movie, many=False).data,
                         status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
-        serializer = MovieValidateSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        return conditional_response(request, self.cache_resource, kwargs.get(self.lookup_field),
+                                    lambda: self.save_update(request))
 
+    def save_update(self, request):
         obj = self.get_object()
+        update_object(request, obj, MovieValidateSerializer)
 
-        obj.title = serializer.validated_data.get('title')
-        obj.description = serializer.validated_data.get('description')
-        obj.duration = serializer.validated_data.get('duration')
-        obj.director_id = serializer.validated_data.get('director_id')
-        obj.save()
-
+        obj = Movie.objects.with_related().get(id=obj.id)
         return Response(data=self.serializer_class(obj, many=False).data,
                         status=status.HTTP_200_OK)
 
+    def perform_destroy(self, instance):
+        soft_delete(Movie, [instance.id])
 
-class ReviewListCreateAPIView(ListCreateAPIView):
+
+class ReviewListCreateAPIView(ConditionalResponseMixin, CacheResponseMixin, SearchMixin, ValuesReadMixin,
+                              ListCreateAPIView):
+    cache_resource = 'review'
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
-    pagination_class = PageNumberPagination
+    read_serializer_class = ReviewValuesSerializer
+    pagination_class = KeysetPagination
+    ordering_fields = ReviewFilterSerializer.ordering_fields
+
+    def get_queryset(self):
+        reviews = filter_queryset(self.request, super().get_queryset(), ReviewFilterSerializer)
+        return self.search_queryset(reviews)
 
     def create(self, request, *args, **kwargs):
+        return idempotent_response(request, lambda: self.save_create(request))
+
+    def save_create(self, request):
         serializer = ReviewValidateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
@@ -243,20 +540,21 @@ class ReviewListCreateAPIView(ListCreateAPIView):
                         status=status.HTTP_201_CREATED)
 
 
-class ReviewRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
+class ReviewRetrieveUpdateDestroyAPIView(ConditionalResponseMixin, CacheResponseMixin, ValuesReadMixin,
+                                         RetrieveUpdateDestroyAPIView):
+    cache_resource = 'review'
+    queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    read_serializer_class = ReviewValuesSerializer
     lookup_field = 'id'
 
     def update(self, request, *args, **kwargs):
-        serializer = ReviewValidateSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        return conditional_response(request, self.cache_resource, kwargs.get(self.lookup_field),
+                                    lambda: self.save_update(request))
 
+    def save_update(self, request):
         obj = self.get_object()
-
-        obj.text = serializer.validated_data.get('text')
-        obj.stars = serializer.validated_data.get('stars')
-        obj.movie_id = serializer.validated_data.get('movie_id')
-        obj.save()
+        update_object(request, obj, ReviewValidateSerializer)
 
         return Response(data=self.serializer_class(obj, many=False).data,
                         status=status.HTTP_200_OK)
@@ -0,0 +1,157 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import IntegrityError, router, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+# What request.user needs without a query; the password hash never goes to the cache.
+# In the order of the model fields, as Model.from_db() expects them.
+USER_FIELDS = ('id', 'is_superuser', 'username', 'is_staff', 'is_active')
+
+
+def token_cache_settings():
+    return {
+        'ALIAS': 'default',
+        'TTL': 300,
+        'MEMORY_TTL': 30,
+        'MAX_ENTRIES': 10000,
+        **getattr(settings, 'TOKEN_CACHE', {}),
+    }
+
+
+def token_settings():
+    return {'TTL': None, **getattr(settings, 'AUTH_TOKENS', {})}
+
+
+def token_expires_at(token):
+    """Unix time after which ``token`` is refused, or None when tokens do not expire."""
+    ttl = token_settings()['TTL']
+    return None if ttl is None else token.created.timestamp() + ttl
+
+
+def issue_token(user, rotate=False):
+    """The current token of ``user``, or a new one if ``rotate`` is set or it expired.
+
+    Logging in again reuses the token (one read) instead of deleting and
+    creating it on every login.
+    """
+    token, created = Token.objects.get_or_create(user=user)
+    expires_at = token_expires_at(token)
+    if created or not (rotate or (expires_at is not None and expires_at <= time.time())):
+        return token
+    try:
+        with transaction.atomic():
+            token.delete()
+            return Token.objects.create(user=user)
+    except IntegrityError:
+        # A concurrent login of the same user rotated it first.
+        return Token.objects.get(user=user)
+
+
+class TokenCache:
+    """Token key -> user, kept in a per-process LRU in front of the shared cache backend.
+
+    Only the ``USER_FIELDS`` of the user are stored, never its password
+    hash; the user is rebuilt with the other fields deferred, so they are
+    loaded from the database if something reads them.
+
+    The LRU answers most requests without any I/O. Invalidations (see
+    ``users.signals``) clear the LRU of the process that made them and the
+    shared backend, but not the LRUs of the other processes: those keep
+    accepting a rotated token, or a changed or deactivated user, for up
+    to ``MEMORY_TTL`` seconds. Lower it (0 disables the LRU) if that
+    window is too long.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(key):
+        return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    @property
+    def backend(self):
+        return caches[token_cache_settings()['ALIAS']]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    return user
+                del self._entries[key]
+        values = self.backend.get(self.cache_key(key))
+        if values is None:
+            return None
+        user = User.from_db(router.db_for_read(User), USER_FIELDS, values)
+        self._remember(key, user, token_cache_settings()['MEMORY_TTL'])
+        return user
+
+    def set(self, key, user, expires_at=None):
+        """Cache ``key`` no longer than the token lives (``expires_at``, Unix time)."""
+        options = token_cache_settings()
+        timeout, memory_ttl = options['TTL'], options['MEMORY_TTL']
+        if expires_at is not None:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                return
+            timeout, memory_ttl = min(timeout, remaining), min(memory_ttl, remaining)
+        values = tuple(getattr(user, field) for field in USER_FIELDS)
+        self.backend.set(self.cache_key(key), values, timeout=timeout)
+        self._remember(key, User.from_db(user._state.db, USER_FIELDS, values), memory_ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        self.backend.delete_many([self.cache_key(key) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, user, ttl):
+        options = token_cache_settings()
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > options['MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` that resolves keys from ``token_cache`` before the database.
+
+    Entries are dropped when a token is deleted (e.g. rotated by
+    ``auth_api_view``) or its user is saved, see ``users.signals``.
+    With ``AUTH_TOKENS['TTL']`` set, tokens older than that are refused and
+    entries are never cached past the expiry of their token.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is not None:
+            return user, Token(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        expires_at = token_expires_at(token)
+        if expires_at is not None and expires_at <= time.time():
+            raise AuthenticationFailed('Token has expired.')
+        token_cache.set(key, user, expires_at)
+        return user, token
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = ('Logins per second of /api/v1/users/auth/ for each password hasher profile, '
+            'reusing the token or rotating it on every login.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--profiles', nargs='+', default=list(settings.PASSWORD_HASHER_PROFILES),
+                            help='Profiles of PASSWORD_HASHER_PROFILES to compare.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['profiles']) - set(settings.PASSWORD_HASHER_PROFILES)
+        if unknown:
+            raise CommandError(f'Unknown password hasher profiles: {", ".join(sorted(unknown))}')
+
+        client = Client()
+        # Every login comes from one client, throttling would answer 429s.
+        with override_settings(ALLOWED_HOSTS=['testserver'], THROTTLING={'ENABLED': False}), \
+                transaction.atomic():
+            user = User.objects.create_user(username='benchmark-logins')
+            for profile in options['profiles']:
+                with override_settings(PASSWORD_HASHERS=settings.PASSWORD_HASHER_PROFILES[profile]):
+                    user.set_password(PASSWORD)
+                    user.save(update_fields=['password'])
+                    for rotate in (False, True):
+                        self.run(client, profile, rotate, options['logins'])
+            transaction.set_rollback(True)
+
+    def run(self, client, profile, rotate, count):
+        data = {'username': 'benchmark-logins', 'password': PASSWORD, 'rotate': rotate}
+        client.post('/api/v1/users/auth/', data)    # issues the token the reused runs get
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                response = client.post('/api/v1/users/auth/', data)
+                if response.status_code != 200:
+                    raise CommandError(f'Login failed with {response.status_code}: {response.content!r}')
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{profile:<8} {"rotate" if rotate else "reuse":<7} {count / elapsed:9.1f} logins/s '
+            f'{len(queries) / count:6.2f} queries/login'
+        )
@@ -0,0 +1,41 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from users.authentication import CachedTokenAuthentication, token_cache
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and time per request of TokenAuthentication and CachedTokenAuthentication.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with transaction.atomic():
+            user = User.objects.create_user(username='benchmark-token-auth')
+            token = Token.objects.create(user=user)
+            token_cache.clear()
+            for authentication_class in (TokenAuthentication, CachedTokenAuthentication):
+                self.run(authentication_class(), factory, token.key, options['requests'])
+            transaction.set_rollback(True)
+        token_cache.delete(token.key)
+
+    def run(self, authenticator, factory, key, count):
+        request = factory.get('/', HTTP_AUTHORIZATION=f'Token {key}')
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                authenticator.authenticate(request)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{type(authenticator).__name__:<28} {len(queries) / count:6.3f} queries/request '
+            f'{elapsed / count * 1e6:8.1f} us/request'
+        )
@@ -2,14 +2,15 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from django.contrib.auth.models import User
 
+USERNAME_TAKEN = 'username is already taken'
+
 
 class UserCreateSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
 
     def validate_username(self, username):
-        try:
-            User.objects.get(username=username)
-        except User.DoesNotExist:
-            return username
-        raise ValidationError('username is already taken')
+        # A cheap early answer; the unique constraint catches concurrent registrations.
+        if User.objects.filter(username=username).exists():
+            raise ValidationError(USERNAME_TAKEN)
+        return username
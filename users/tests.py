@@ -1,3 +1,280 @@
-from django.test import TestCase
+import sys
+import time
+import types
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from users.authentication import token_cache
+from users.serializers import USERNAME_TAKEN, UserCreateSerializer
+from users.throttling import MemoryStore, RedisStore, get_store
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class FakeRedis:
+    """In-memory stand-in for the calls ``RedisStore`` makes to a Redis server.
+
+    ``register_script`` runs a Python port of ``RedisStore.SCRIPT`` against
+    the hashes, with ``now`` as the server clock. ``test_redis_store`` runs
+    the Lua itself when fakeredis is installed.
+    """
+
+    class Error(Exception):
+        pass
+
+    def __init__(self):
+        self.hashes = {}
+        self.expires = {}
+        self.now = 1000.0
+        self.down = False
+
+    def module(self):
+        """A ``redis`` module whose clients all talk to this server."""
+        return types.SimpleNamespace(RedisError=self.Error, Redis=types.SimpleNamespace(from_url=lambda url: self))
+
+    def register_script(self, script):
+        return self.run_bucket
+
+    def run_bucket(self, keys, args):
+        if self.down:
+            raise self.Error('Connection refused')
+        [key], (capacity, period) = keys, map(float, args)
+        if self.expires.get(key, self.now + 1) <= self.now:
+            self.hashes.pop(key, None)
+        bucket = self.hashes.get(key, {})
+        tokens, updated = float(bucket.get('tokens', capacity)), float(bucket.get('updated', self.now))
+        tokens = min(capacity, tokens + max(0, self.now - updated) * capacity / period)
+        wait = 0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) * period / capacity
+        self.hashes[key] = {'tokens': str(tokens), 'updated': str(self.now)}
+        self.expires[key] = self.now + period
+        return str(wait).encode()
+
+    def flushdb(self):
+        self.hashes.clear()
+        self.expires.clear()
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='wonderland-42')
+        self.token = Token.objects.create(user=self.user)
+
+    def get(self, key):
+        return self.client.get('/api/v1/reviews/', HTTP_AUTHORIZATION=f'Token {key}')
+
+    def count_queries(self, key):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get(key).status_code, 200)
+        return sum('authtoken_token' in query['sql'] for query in queries)
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(self.count_queries(self.token.key), 1)
+        self.assertEqual(self.count_queries(self.token.key), 0)
+        self.assertEqual(self.get('not-a-token').status_code, 401)
+
+    def login(self, **data):
+        return self.client.post('/api/v1/users/auth/', {'username': 'alice', 'password': 'wonderland-42', **data})
+
+    def test_login_reuses_token(self):
+        with self.assertNumQueries(2):    # user + token lookup, no writes
+            response = self.login()
+        self.assertEqual(response.data['key'], self.token.key)
+        self.assertEqual(self.login().data['key'], self.token.key)
+
+    def test_login_rotation_invalidates(self):
+        self.get(self.token.key)
+        response = self.login(rotate='true')
+        self.assertNotEqual(response.data['key'], self.token.key)
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.get(self.token.key).status_code, 401)
+        self.assertEqual(self.get(response.data['key']).status_code, 200)
+
+    def test_deactivation_invalidates(self):
+        self.get(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(self.token.key).status_code, 401)
+
+    def test_user_save_invalidates(self):
+        self.get(self.token.key)
+        self.user.username = 'alice2'
+        self.user.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_cache_holds_no_password(self):
+        self.get(self.token.key)
+        self.assertNotIn(self.user.password, repr(token_cache.backend.get(token_cache.cache_key(self.token.key))))
+        token_cache.clear()    # drop the LRU, rebuild the user from the shared cache
+        user = token_cache.get(self.token.key)
+        self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, 'alice', True))
+        self.assertIn('password', user.get_deferred_fields())
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('wonderland-42'))
+
+    @override_settings(AUTH_TOKENS={'TTL': 60})
+    def test_token_expiry(self):
+        Token.objects.filter(key=self.token.key).update(created=timezone.now() - timedelta(minutes=2))
+        response = self.get(self.token.key)
+        self.assertEqual((response.status_code, response.data['detail']), (401, 'Token has expired.'))
+        # Logging in replaces the expired token.
+        key = self.login().data['key']
+        self.assertNotEqual(key, self.token.key)
+        self.assertEqual(self.get(key).status_code, 200)
+
+    def test_cache_entries_do_not_outlive_the_token(self):
+        token_cache.set(self.token.key, self.user, expires_at=time.time() - 1)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+
+class RegistrationTests(TestCase):
+    def register(self, username):
+        return self.client.post('/api/v1/users/register/', {'username': username, 'password': 'builder-42'})
+
+    def test_register(self):
+        response = self.register('bob')
+        self.assertEqual(response.status_code, 201)
+        # Tests hash with the fast profile, see Afisha.testing.TestRunner
+        self.assertTrue(User.objects.get(id=response.data['user_id']).password.startswith('md5$'))
+        response = self.register('bob')
+        self.assertEqual((response.status_code, response.data), (400, {'username': [USERNAME_TAKEN]}))
+
+    def test_concurrent_registration(self):
+        User.objects.create_user(username='bob')
+        # The request validated before the other one committed its user.
+        with mock.patch.object(UserCreateSerializer, 'validate_username', lambda self, username: username):
+            response = self.register('bob')
+        self.assertEqual((response.status_code, response.data), (400, {'username': [USERNAME_TAKEN]}))
+        self.assertEqual(User.objects.filter(username='bob').count(), 1)
+
+    def test_benchmark_logins(self):
+        out = StringIO()
+        call_command('benchmark_logins', logins=2, profiles=['fast'], stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:2] for line in lines], [['fast', 'reuse'], ['fast', 'rotate']])
+        self.assertIn('2.00 queries/login', lines[0])
+        self.assertFalse(User.objects.filter(username='benchmark-logins').exists())
+
+
+THROTTLING = {
+    'ENABLED': True,
+    'STORE': 'users.throttling.MemoryStore',
+    'STORE_OPTIONS': {},
+    'RATES': {'login': '3/min', 'login_username': '5/min', 'register': '1/hour', 'write': '2/min'},
+}
+
+
+@override_settings(THROTTLING=THROTTLING)
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        get_store().clear()
+
+    def login(self, password):
+        return self.client.post('/api/v1/users/auth/', {'username': 'alice', 'password': password})
+
+    def test_login_is_throttled_before_hashing(self):
+        User.objects.create_user(username='alice', password='wonderland-42')
+        for _ in range(3):
+            self.assertEqual(self.login('guess').status_code, 401)
+        with mock.patch('users.views.authenticate') as authenticate, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.login('wonderland-42')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+        self.assertEqual(len(queries), 0)
+
+    def test_spoofed_forwarded_for_is_ignored(self):
+        for _ in range(3):
+            self.assertEqual(self.login('guess').status_code, 401)
+        # Another X-Forwarded-For does not give the same client a fresh bucket.
+        response = self.client.post('/api/v1/users/auth/', {'username': 'alice', 'password': 'guess'},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(THROTTLING={**THROTTLING, 'RATES': {**THROTTLING['RATES'], 'login_username': '2/min'}})
+    def test_login_is_throttled_per_username_and_client(self):
+        User.objects.create_user(username='alice', password='wonderland-42')
+        attacker, owner = {'REMOTE_ADDR': '198.51.100.1'}, {'REMOTE_ADDR': '198.51.100.2'}
+        responses = [self.client.post('/api/v1/users/auth/', {'username': 'Alice', 'password': 'guess'},
+                                      **attacker).status_code for _ in range(3)]
+        self.assertEqual(responses, [401, 401, 429])
+        # The guesses of another client do not lock the owner out.
+        response = self.client.post('/api/v1/users/auth/', {'username': 'alice', 'password': 'wonderland-42'},
+                                    **owner)
+        self.assertEqual(response.status_code, 200)
+
+    def test_register_scope(self):
+        data = {'username': 'bob', 'password': 'builder-42'}
+        self.assertEqual(self.client.post('/api/v1/users/register/', data).status_code, 201)
+        data = {'username': 'carol', 'password': 'singer-42'}
+        self.assertEqual(self.client.post('/api/v1/users/register/', data).status_code, 429)
+
+    def test_writes_are_throttled_per_client(self):
+        for name in ('Bergman', 'Fellini'):
+            self.assertEqual(self.client.post('/api/v1/directors/', {'name': name}).status_code, 200)
+        self.assertEqual(self.client.post('/api/v1/directors/', {'name': 'Varda'}).status_code, 429)
+        self.assertEqual(self.client.get('/api/v1/directors/').status_code, 200)
+
+        user = User.objects.create_user(username='alice', password='wonderland-42')
+        token = Token.objects.create(user=user)
+        response = self.client.post('/api/v1/directors/', {'name': 'Varda'},
+                                    HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bucket_refills(self):
+        store = MemoryStore()
+        with mock.patch('users.throttling.time.monotonic', return_value=100.0):
+            self.assertEqual([store.consume('key', 2, 60) for _ in range(3)], [0, 0, 30.0])
+        with mock.patch('users.throttling.time.monotonic', return_value=115.0):
+            self.assertAlmostEqual(store.consume('key', 2, 60), 15.0)
+        with mock.patch('users.throttling.time.monotonic', return_value=130.0):
+            self.assertEqual(store.consume('key', 2, 60), 0)
+
+    def test_redis_store_with_the_fake_server(self):
+        server = FakeRedis()
+        with mock.patch.dict(sys.modules, redis=server.module()):
+            store = RedisStore(url='redis://fake/0')
+        self.assertEqual([store.consume('key', 2, 60) for _ in range(3)], [0, 0, 30.0])
+        self.assertEqual(server.expires['key'], server.now + 60)
+        server.now += 15
+        self.assertEqual(store.consume('key', 2, 60), 15.0)
+        server.now += 15
+        self.assertEqual(store.consume('key', 2, 60), 0)
+        self.assertEqual(store.consume('other', 2, 60), 0)
+
+        server.down = True
+        with self.assertLogs('users.throttling', 'WARNING'):
+            self.assertEqual(store.consume('key', 2, 60), 0)    # let through
+        server.down = False
+        store.clear()
+        self.assertEqual(server.hashes, {})
+
+    def test_login_is_throttled_through_the_redis_store(self):
+        server = FakeRedis()
+        options = {**THROTTLING, 'STORE': 'users.throttling.RedisStore', 'STORE_OPTIONS': {'url': 'redis://fake/1'}}
+        with mock.patch.dict(sys.modules, redis=server.module()), override_settings(THROTTLING=options):
+            statuses = [self.login('guess').status_code for _ in range(4)]
+        self.assertEqual(statuses, [401, 401, 401, 429])
+        self.assertTrue(any(key.startswith('throttle:login:') for key in server.hashes))
+
+    @skipUnless(fakeredis, 'fakeredis is not installed')
+    def test_redis_store(self):
+        store = RedisStore(client=fakeredis.FakeRedis())
+        self.assertEqual([store.consume('key', 2, 60) > 0 for _ in range(3)], [False, False, True])
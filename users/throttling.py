@@ -0,0 +1,188 @@
+"""Token bucket throttling of the login, registration and write endpoints.
+
+Every scope of ``settings.THROTTLING['RATES']`` (``'10/min'``, like DRF's
+rates) is a bucket of that many requests per client, refilled
+continuously: a client may burst up to the full rate, then gets one
+request every ``period / count`` seconds. Refused requests fail in
+``APIView.initial`` with a 429 and a ``Retry-After`` header, before the
+view parses the body, hashes a password or queries the database.
+
+Buckets live in the store named by ``THROTTLING['STORE']``:
+
+* ``MemoryStore`` keeps them in the process, so every worker process
+  counts on its own.
+* ``RedisStore`` keeps them in a Redis-compatible server shared by all
+  the workers (``STORE_OPTIONS = {'url': 'redis://...'}``); the bucket
+  is updated by a Lua script, atomically. If the server is unreachable
+  requests are let through rather than failing.
+
+Clients are told apart by ``get_ident``: the ``REMOTE_ADDR`` or, behind
+``REST_FRAMEWORK['NUM_PROXIES']`` reverse proxies, the address those
+proxies appended to ``X-Forwarded-For``. With ``NUM_PROXIES = 0`` a
+client-supplied ``X-Forwarded-For`` is ignored, so it cannot pick its own
+bucket. Logins are also counted per username and client, which bounds
+the password guesses one client makes against an account (more tightly
+than the per-client login rate) without letting it lock the account's
+owner out, who logs in from another address.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def throttle_settings():
+    return {
+        'ENABLED': True,
+        'STORE': 'users.throttling.MemoryStore',
+        'STORE_OPTIONS': {},
+        'RATES': {},
+        **getattr(settings, 'THROTTLING', {}),
+    }
+
+
+def parse_rate(rate):
+    """``'10/min'`` -> ``(10, 60)``."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class MemoryStore:
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, period):
+        """Take a token from the bucket; returns 0 or the seconds until one is available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * capacity / period)
+            wait = 0 if tokens >= 1 else (1 - tokens) * period / capacity
+            self.buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+            while len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class RedisStore:
+    # Lua numbers are returned as integers, the wait goes back as a string.
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local period = tonumber(ARGV[2])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * capacity / period)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) * period / capacity
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(period * 1000))
+        return tostring(wait)
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', client=None):
+        import redis
+
+        self.errors = redis.RedisError
+        self.client = client or redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, period):
+        try:
+            return float(self.script(keys=[key], args=[capacity, period]))
+        except self.errors:
+            logger.warning('Throttle store unavailable, request let through', exc_info=True)
+            return 0
+
+    def clear(self):
+        self.client.flushdb()
+
+
+_stores = {}
+
+
+def get_store():
+    options = throttle_settings()
+    key = (options['STORE'], tuple(sorted(options['STORE_OPTIONS'].items())))
+    if key not in _stores:
+        _stores[key] = import_string(options['STORE'])(**options['STORE_OPTIONS'])
+    return _stores[key]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def applies(self, request):
+        return True
+
+    def get_client_key(self, request):
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        options = throttle_settings()
+        rate = options['RATES'].get(self.scope)
+        if not options['ENABLED'] or rate is None or not self.applies(request):
+            return True
+        capacity, period = parse_rate(rate)
+        key = f'throttle:{self.scope}:{self.get_client_key(request)}'
+        self.wait_seconds = get_store().consume(key, capacity, period)
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    """Per client IP, checked before the password is hashed."""
+    scope = 'login'
+
+
+class LoginUsernameRateThrottle(TokenBucketThrottle):
+    """Per username submitted to the login and client IP."""
+    scope = 'login_username'
+
+    def applies(self, request):
+        return isinstance(request.data.get('username'), str)
+
+    def get_client_key(self, request):
+        username = request.data['username'].strip().lower()
+        return f'username:{hashlib.md5(username.encode()).hexdigest()}:{self.get_ident(request)}'
+
+
+class RegisterRateThrottle(TokenBucketThrottle):
+    scope = 'register'
+
+
+class WriteRateThrottle(TokenBucketThrottle):
+    """Unsafe requests, per user when authenticated and per IP otherwise."""
+    scope = 'write'
+
+    def applies(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS')
+
+    def get_client_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return self.get_ident(request)
@@ -1,34 +1,43 @@
-from rest_framework.decorators import api_view
-from rest_framework.authtoken.models import Token
+from rest_framework.decorators import api_view, throttle_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from users.serializers import UserCreateSerializer
+from django.db import IntegrityError, transaction
+from users.authentication import issue_token
+from users.serializers import USERNAME_TAKEN, UserCreateSerializer
+from users.throttling import LoginRateThrottle, LoginUsernameRateThrottle, RegisterRateThrottle
 
 
 @api_view(['POST'])
+@throttle_classes([RegisterRateThrottle])
 def register_api_view(request):
     serializer = UserCreateSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
 
-    username = request.data.get('username')
-    password = request.data.get('password')
-    user = User.objects.create_user(username=username, password=password)
+    username = serializer.validated_data['username']
+    password = serializer.validated_data['password']
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(username=username, password=password)
+    except IntegrityError:
+        # Registered by a concurrent request since the validation.
+        raise ValidationError({'username': [USERNAME_TAKEN]})
     return Response(status=status.HTTP_201_CREATED,
                     data={'user_id': user.id})
 
 
 @api_view(['POST'])
+@throttle_classes([LoginRateThrottle, LoginUsernameRateThrottle])
 def auth_api_view(request):
     # Step 1 Get credential data from client
     username, password = request.data.get('username'), request.data.get('password')
     # Step 2 Authentication of user
     user = authenticate(username=username, password=password)
     if user is not None:
-        # Step 3 Return Key
-        Token.objects.filter(user=user).delete()
-        token = Token.objects.create(user=user)
+        # Step 3 Return Key, the current one unless the client asks for a new one
+        token = issue_token(user, rotate=str(request.data.get('rotate', '')).lower() in ('1', 'true'))
         return Response(data={'key': token.key})
     else:
         # Step 4 Return error